@@ -0,0 +1,151 @@
+import json
+
+# Label of the extraction plan nodes (one per Data Extraction Standard and Source Data Table)
+PLAN_LABEL = "Extraction Plan"
+# Version of the plan format - plans of another version are stale
+PLAN_VERSION = 1
+
+# Metadata used by SDTMDataProvider.get_data_sdtm to extract a Source Data Table of a Data Extraction Standard
+META_QUERY = """
+    MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:$table}),
+    (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`), (class:Class)<-[:TO]-(rel:Relationship)-[:FROM]->(fromclass:Class)
+    WHERE
+      EXISTS(
+        (sdc)<-[:MAPS_TO_COLUMN]-(rel)-[:TO]->(class)
+      )
+      OR
+      EXISTS(
+        (sdt)-[:MAPS_TO_CLASS]->(class)
+      )
+    WITH *
+    OPTIONAL MATCH (sdc)-[r:MAPS_TO_CLASS]->(class)   
+    WITH *
+    ORDER BY sdf, sdt, sdc.Order, sdc
+    RETURN
+    collect({from: fromclass.label, to: class.label, type: rel.relationship_type, short_label: class.short_label}) as rels,
+    collect(distinct fromclass.label) + collect(distinct class.label) as classes,
+    apoc.coll.toSet(
+            [triple in [ 
+                triple in collect([class.label, sdc.Core, class.create]) 
+                where triple[1] = "Req" or triple[2]] | triple[0]
+            ] + 
+            [pair in [
+                pair in collect([fromclass.label, fromclass.create]) 
+                where pair[1]] | pair[0]
+            ] // Ensure Domain is in required classes
+        ) as req_classes,         
+    apoc.map.fromPairs(
+        [y in   
+            [x in collect(distinct {class:class, sdc:sdc, r:r}) WHERE NOT x['r'] IS NULL] | //filtering for classes with existing Column MAPS_TO_CLASS relationship
+            [
+                //y['class'].label + '.' + y['class'].short_label,    //to be used as key of the dict
+                y['class'].short_label,    //to be used as key of the dict
+                y['sdc']._columnname_                               // to be used as value of the dict
+            ]
+        ]
+    ) as rename_dct,
+    apoc.map.fromPairs(collect([sdc._columnname_, sdc.Order])) as order_dct,
+    sdt['SortOrder'] as sorting
+"""
+
+# Cheap summary of the extraction metadata of a Source Data Table (columns, mappings - with the ids and the properties
+# of the mapped Classes and Relationships read by META_QUERY -, sort order) - a plan is stale when the signature it
+# was written with differs from the current one.
+# The mappings are sorted json strings as the order of the pattern comprehensions is not defined
+SIGNATURE = """
+[
+    sdt.SortOrder,
+    [sdc IN sdcs | [sdc._columnname_, sdc.Order, sdc.Core,
+        apoc.coll.sort([(sdc)-[:MAPS_TO_CLASS]->(c) | apoc.convert.toJson([id(c), c.label, c.short_label, c.create])]),
+        apoc.coll.sort([(sdc)<-[:MAPS_TO_COLUMN]-(r) | apoc.convert.toJson([id(r), r.relationship_type,
+            [(r)-[:FROM]->(f) | [id(f), f.label, f.short_label, f.create]],
+            [(r)-[:TO]->(t) | [id(t), t.label, t.short_label, t.create]]
+        ])])
+    ]],
+    apoc.coll.sort([(sdt)-[:MAPS_TO_CLASS]->(c:Class)<-[:TO]-(r:Relationship)-[:FROM]->(f:Class) |
+        apoc.convert.toJson([id(r), r.relationship_type, [id(c), c.label, c.short_label, c.create],
+                             [id(f), f.label, f.short_label, f.create]])
+    ])
+]
+"""
+
+
+def signature_key(signature: list) -> str:
+    return json.dumps(signature, sort_keys=True, default=str)
+
+
+def materialize_extraction_plans(neo, standard: str, tables: list = None) -> int:
+    """
+    Computes the extraction metadata (META_QUERY) of the Source Data Tables of the Data Extraction Standard and
+    stores it, with the signature of the table, on an `Extraction Plan` node per table
+    (sdt)-[:HAS_EXTRACTION_PLAN]->(:`Extraction Plan`{_tag_, _domain_}) read by get_extraction_plan.
+    Called by CdiscModelManager.automap_excel_based_model - call it again after changing the mapping or the model:
+    until then get_extraction_plan finds the plans of the affected tables stale (see SIGNATURE)
+    :param neo: NeoInterface object
+    :param standard: _tag_ of the Data Extraction Standard
+    :param tables: list of _domain_ of the Source Data Tables; if None all the tables of the standard
+    :return: number of plans written
+    """
+    neo.create_index(PLAN_LABEL, "_domain_")
+    q = f"""
+    MATCH (sdf:`Data Extraction Standard`{{_tag_:$standard}})-[:HAS_TABLE]->(sdt:`Source Data Table`)
+    WHERE $tables IS NULL OR sdt._domain_ IN $tables
+    OPTIONAL MATCH (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+    WITH sdt, sdc
+    ORDER BY sdc._columnname_
+    WITH sdt, collect(sdc) as sdcs
+    RETURN sdt._domain_ as table, {SIGNATURE} as signature
+    """
+    signatures = neo.query(q, {'standard': standard, 'tables': tables})
+    plans = []
+    for row in signatures:
+        meta = neo.query(META_QUERY, {'standard': standard, 'table': row['table']})
+        if meta:
+            plans.append({'table': row['table'], 'meta': json.dumps(meta, default=str),
+                          'signature': signature_key(row['signature'])})
+    q = f"""
+    UNWIND $plans as row
+    MATCH (sdf:`Data Extraction Standard`{{_tag_:$standard}})-[:HAS_TABLE]->(sdt:`Source Data Table`{{_domain_:row.table}})
+    MERGE (sdt)-[:HAS_EXTRACTION_PLAN]->(plan:`{PLAN_LABEL}`{{_tag_:$standard, _domain_:row.table}})
+    SET plan.meta = row.meta, plan.signature = row.signature, plan.version = $version
+    """
+    neo.query(q, {'standard': standard, 'plans': plans, 'version': PLAN_VERSION})
+    return len(plans)
+
+
+def get_extraction_plan(neo, standard: str, table: str):
+    """
+    Reads the extraction plan of a Source Data Table in one indexed lookup
+    :param neo: NeoInterface object
+    :param standard: _tag_ of the Data Extraction Standard
+    :param table: _domain_ of the Source Data Table
+    :return: the extraction metadata (as returned by META_QUERY) or None if there is no plan or if it is stale
+    """
+    return get_extraction_plans(neo, standard=standard, tables=[table]).get(table)
+
+
+def get_extraction_plans(neo, standard: str, tables: list) -> dict:
+    """
+    Reads the extraction plans of several Source Data Tables in one query
+    :param neo: NeoInterface object
+    :param standard: _tag_ of the Data Extraction Standard
+    :param tables: list of _domain_ of the Source Data Tables
+    :return: dictionary with the _domain_ of the tables with an up to date plan as keys and their extraction metadata
+    (as returned by META_QUERY) as values
+    """
+    q = f"""
+    UNWIND $tables as table
+    MATCH (plan:`{PLAN_LABEL}`{{_domain_:table}})<-[:HAS_EXTRACTION_PLAN]-(sdt:`Source Data Table`)
+    WHERE plan._tag_ = $standard
+    OPTIONAL MATCH (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+    WITH plan, sdt, sdc
+    ORDER BY sdc._columnname_
+    WITH plan, sdt, collect(sdc) as sdcs
+    RETURN plan._domain_ as table, plan.meta as meta, plan.signature as signature, plan.version as version,
+    {SIGNATURE} as current
+    """
+    plans = {}
+    for plan in neo.query(q, {'standard': standard, 'tables': tables}):
+        if plan['version'] == PLAN_VERSION and plan['signature'] == signature_key(plan['current']):
+            plans[plan['table']] = json.loads(plan['meta'])
+    return plans
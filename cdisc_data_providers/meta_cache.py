@@ -0,0 +1,88 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# All the MetaCache objects of the process (see invalidate_all)
+_caches = weakref.WeakSet()
+
+
+class MetaCache:
+    """
+    In-process cache of the extraction metadata of SDTMDataProvider.get_meta, keyed by (standard, table):
+    size-bounded with least recently used eviction, optional time to live, hit/miss counters.
+    Entries are not refreshed when the model changes - they have to be invalidated (invalidate or invalidate_all,
+    which CdiscModelManager.automap_excel_based_model calls)
+    """
+    def __init__(self, maxsize: int = 128, ttl: float = None, clock=time.monotonic):
+        """
+        :param maxsize: Maximum number of entries (0 disables the cache)
+        :param ttl: Seconds after which an entry expires (never if None)
+        :param clock: Function returning the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, standard: str, table: str):
+        """
+        :return: the cached value for (standard, table) or None if there is none or if it expired
+        """
+        key = (standard, table)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry[0] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, standard: str, table: str, value) -> None:
+        """
+        Caches value for (standard, table), evicting the least recently used entries beyond maxsize
+        """
+        if self.maxsize <= 0:
+            return
+        key = (standard, table)
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, standard: str = None, tables: list = None) -> int:
+        """
+        :param standard: only invalidate the entries of this standard (all standards if None)
+        :param tables: only invalidate the entries of these tables (all tables if None)
+        :return: number of entries removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries
+                    if (standard is None or key[0] == standard) and (tables is None or key[1] in tables)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> dict:
+        """
+        :return: dictionary with the number of hits, misses and entries and the maximum number of entries
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+def invalidate_all(standard: str = None, tables: list = None) -> int:
+    """
+    Invalidates the matching entries of all the MetaCache objects of the process (see MetaCache.invalidate)
+    :return: number of entries removed
+    """
+    return sum(cache.invalidate(standard=standard, tables=tables) for cache in list(_caches))
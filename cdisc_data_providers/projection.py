@@ -0,0 +1,82 @@
+from collections import defaultdict, deque
+
+
+def column_classes(meta) -> dict:
+    """
+    :param meta: extraction metadata (as returned by SDTMDataProvider.get_meta)
+    :return: dictionary with the (renamed) columns as keys and the label of the Class each column is extracted from
+    as values
+    """
+    rename_dct = meta[0]['rename_dct']
+    res = {}
+    for rel in meta[0]['rels']:
+        short_label = rel.get('short_label')
+        if short_label is not None:
+            res.setdefault(rename_dct.get(short_label, short_label), rel['to'])
+    return res
+
+
+def minimal_subgraph(rels: list, terminals: list) -> set:
+    """
+    Connects the terminal classes through the rels (undirected) with as few classes as possible: starting from the
+    first terminal, the nearest terminal not yet connected is repeatedly joined with a shortest path (breadth-first
+    search from all the connected classes)
+    :param rels: list of {'from', 'to', ...}
+    :param terminals: list of class labels
+    :return: set of the labels of the connected classes (terminals included)
+    """
+    terminals = list(dict.fromkeys(terminals))
+    if not terminals:
+        return set()
+    neighbours = defaultdict(list)
+    for rel in rels:
+        neighbours[rel['from']].append(rel['to'])
+        neighbours[rel['to']].append(rel['from'])
+    tree = {terminals[0]: None}
+    remaining = [terminal for terminal in terminals[1:] if terminal not in tree]
+    while remaining:
+        previous = {node: None for node in tree}
+        queue = deque(tree)
+        found = None
+        while queue:
+            node = queue.popleft()
+            if node in remaining:
+                found = node
+                break
+            for neighbour in neighbours[node]:
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+        if found is None:
+            raise ValueError(f"Classes {remaining} are not connected to {list(tree)}")
+        node = found
+        while node not in tree:
+            tree[node] = None
+            node = previous[node]
+        remaining = [terminal for terminal in remaining if terminal not in tree]
+    return set(tree)
+
+
+def project_extraction(meta, classes: list, rels: list, columns: list, keep_classes: list = (),
+                       oclass_marker: str = "**") -> (list, list):
+    """
+    Prunes the classes and rels of an extraction to the ones needed for the columns: the required classes (not
+    marked with oclass_marker - they restrict the rows that are extracted), keep_classes and the classes of the
+    columns are connected with minimal_subgraph; the other (optional) classes are dropped with their rels
+    :param meta: extraction metadata (as returned by SDTMDataProvider.get_meta)
+    :param classes: classes of the extraction (optional ones marked with oclass_marker)
+    :param rels: rels of the extraction
+    :param columns: (renamed) columns to extract
+    :param keep_classes: labels of other classes to keep (e.g. the ones filtered by a where_map)
+    :return: the pruned classes and rels
+    """
+    def label(class_):
+        return class_[:-len(oclass_marker)] if class_.endswith(oclass_marker) else class_
+
+    available = {label(class_) for class_ in classes}
+    col_classes = column_classes(meta)
+    terminals = [class_ for class_ in classes if not class_.endswith(oclass_marker)] + \
+                [col_classes[col] for col in columns if col in col_classes] + list(keep_classes)
+    kept = minimal_subgraph(rels, [terminal for terminal in terminals if terminal in available])
+    return [class_ for class_ in classes if label(class_) in kept], \
+           [rel for rel in rels if rel['from'] in kept and rel['to'] in kept]
@@ -1,6 +1,11 @@
 import datacompy
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from data_providers import DataProvider
+from cdisc_data_providers import extraction_plan
+from cdisc_data_providers import projection
+from cdisc_data_providers.meta_cache import MetaCache
 import logging
 
 
@@ -11,11 +16,124 @@ class SDTMDataProvider(DataProvider):
 
     RDFSLABEL = "rdfs:label"
 
-    def __init__(self, check_for_refarctored=True, *args, **kwargs):
+    def __init__(self, check_for_refarctored=True, use_extraction_plan=True, meta_cache_size=128, meta_cache_ttl=None,
+                 *args, **kwargs):
+        """
+        :param check_for_refarctored: Whether to exclude the classes that were never created during refactoring
+        :param use_extraction_plan: Whether get_data_sdtm reads the extraction metadata from the materialized
+        extraction plan of the table (see extraction_plan.py) - the live query (neo_get_meta) is used when there
+        is no plan or when it is stale
+        :param meta_cache_size: Maximum number of tables whose extraction metadata is cached by get_meta
+        (least recently used first evicted; 0 disables the cache - see meta_cache.py)
+        :param meta_cache_ttl: Seconds after which the cached extraction metadata of a table expires (never if None)
+        """
         self.check_for_refarctored = check_for_refarctored
+        self.use_extraction_plan = use_extraction_plan
+        self.meta_cache = MetaCache(maxsize=meta_cache_size, ttl=meta_cache_ttl)
         super().__init__(*args, **kwargs)
 
-    def get_data_sdtm(self, standard: str, domain: str, study=None, where_map=None, user_role=None):
+    def get_data_sdtm(self, standard: str, domain: str, study=None, where_map=None, user_role=None, meta=None,
+                      columns: list = None):
+        """
+        :param meta: extraction metadata of the domain (as returned by get_meta) - read with get_meta if None
+        :param columns: if provided, only these columns are returned and only the classes needed for them (and for
+        the sort keys, the where_map and the required classes) are traversed (see projection.project_extraction)
+        """
+        extraction = self.prepare_data_sdtm(standard=standard, domain=domain, study=study, where_map=where_map,
+                                            user_role=user_role, meta=meta, columns=columns)
+        if extraction:
+            df = self.fetch_data_sdtm(extraction)
+            return self.format_data_sdtm(df, extraction['meta'], columns=columns)
+
+    def iter_data_sdtm(self, standard: str, domain: str, study=None, where_map=None, user_role=None, meta=None,
+                       columns: list = None, chunk_subjects: int = 1000, partition_class: str = 'Subject'):
+        """
+        Extracts a domain as get_data_sdtm but partitioned by subject, so that only one partition is in memory at a
+        time: the subjects of the extraction (rdfs:label of the nodes of partition_class - see neo_get_partition_keys)
+        are paginated by key - chunk_subjects at a time in ascending order - and the data of each page of subjects is
+        extracted, renamed, re-ordered and sorted before being yielded (empty chunks are skipped).
+        The concatenated chunks are in the final sort order if the column of partition_class is the first sort key
+        (after STUDYID when a study is given) - otherwise each chunk is sorted on its own (a WARNING is printed).
+        If partition_class is not a required class of the extraction the domain is yielded in one chunk.
+        :param columns: as in get_data_sdtm
+        :param chunk_subjects: Maximum number of subjects per chunk
+        :param partition_class: label of the Class whose nodes partition the data
+        :return: generator of DataFrames
+        """
+        extraction = self.prepare_data_sdtm(standard=standard, domain=domain, study=study, where_map=where_map,
+                                            user_role=user_role, meta=meta, columns=columns)
+        if not extraction:
+            return
+        meta = extraction['meta']
+        if partition_class not in extraction['classes'] or \
+                self.RDFSLABEL in extraction['where_map'].get(partition_class, {}):
+            print(f"WARNING: {domain} cannot be partitioned by {partition_class} - extracting it in one chunk")
+            yield self.format_data_sdtm(self.fetch_data_sdtm(extraction), meta, columns=columns)
+            return
+
+        short_labels = {rel['to']: rel.get('short_label') for rel in extraction['rels']}
+        partition_column = meta[0]['rename_dct'].get(short_labels.get(partition_class),
+                                                     short_labels.get(partition_class))
+        sorting = self.get_sorting(meta)
+        if study:
+            study_column = meta[0]['rename_dct'].get(short_labels.get('Study'), short_labels.get('Study'))
+            sorting = [col for col in sorting if col != study_column]
+        if not sorting or sorting[0] != partition_column:
+            print(f"WARNING: the chunks of {domain} are sorted separately as {partition_class} is not the first "
+                  f"sort key: {sorting}")
+
+        after = None
+        while True:
+            keys = self.neo_get_partition_keys(extraction, partition_class, after=after, limit=chunk_subjects)
+            if not keys:
+                break
+            after = keys[-1]
+            partition_where_map = {**extraction['where_map'], partition_class: {
+                **extraction['where_map'].get(partition_class, {}), self.RDFSLABEL: keys}}
+            df = self.fetch_data_sdtm(extraction, where_map=partition_where_map)
+            if not df.empty:
+                yield self.format_data_sdtm(df, meta, columns=columns)
+
+    def neo_get_partition_keys(self, extraction: dict, label: str, after=None, limit: int = 1000) -> list:
+        """
+        :param extraction: as returned by prepare_data_sdtm
+        :param label: label of a required class of the extraction
+        :param after: only the keys greater than this one (all if None)
+        :param limit: maximum number of keys
+        :return: the next (ascending) rdfs:label values of the nodes with the label that match the required classes,
+        rels and where_map of the extraction (i.e. of the study and domain extracted) - keyset pagination
+        """
+        # the MATCH of the required classes, as built by get_data_generic (with the labels as variable names)
+        rels = self.mm.gen_default_reltypes_list(extraction['rels'])
+        labels = self.qb.enrich_labels_from_rels(labels=extraction['classes'], rels=rels,
+                                                 oclass_marker=self.OCLASS_MARKER)
+        labels, rels = self.qb.split_out_optional(labels=labels, rels=rels, oclass_marker=self.OCLASS_MARKER)[0]
+        q_body, params = self.qb.generate_query_body(
+            labels=labels, rels=rels, match="MATCH",
+            where_map={key: item for key, item in extraction['where_map'].items() if key in labels}
+        )
+        q = q_body + f"""
+        WITH DISTINCT `{label.replace("`", "``")}`.`{self.RDFSLABEL}` as key
+        WHERE key IS NOT NULL AND ($after IS NULL OR key > $after)
+        RETURN key
+        ORDER BY key
+        LIMIT $limit
+        """
+        params = {**params, 'after': after, 'limit': limit}
+        if self.debug:
+            logging.debug(f"""
+                               query: {q}
+                               parameters: {params}
+                           """)
+        return [r['key'] for r in self.query(q, params)]
+
+    def prepare_data_sdtm(self, standard: str, domain: str, study=None, where_map=None, user_role=None, meta=None,
+                          columns: list = None):
+        """
+        :return: dictionary with the extraction metadata ('meta') of the domain and the validated 'classes', 'rels'
+        and 'where_map' to extract it with get_data_generic (pruned to the columns if provided) - None if there is
+        no extraction metadata
+        """
         assert where_map is None or isinstance(where_map, dict)
         if not where_map:
             where_map = {}
@@ -24,22 +142,24 @@ class SDTMDataProvider(DataProvider):
             where_map = {**where_map, **{
                 'Study': {'rdfs:label': study}}}
         # TODO: add assert statements to check prerequisites - e.g. extraction model contains all required nodes and properties
-        meta = self.neo_get_meta(standard=standard, table=domain)
+        if meta is None:
+            meta = self.get_meta(standard=standard, table=domain)
         if self.debug:
             print("meta", meta)
         if meta:
             classes = (['Study'] if 'Study' not in meta[0]['classes'] else []) + meta[0]['classes']
             non_valid, no_access = [], []
 
-            if self.check_for_refarctored:
-                classes, non_valid = self.neo_validate_classes_to_extract(classes)
+            if self.check_for_refarctored or user_role:
+                # refactoring counts and access restrictions checked in one query
+                classes, non_valid, no_access = self.neo_validate_extraction(
+                    classes, check_counts=self.check_for_refarctored, user_role=user_role)
                 if non_valid:
                     print(
                         f"ERROR: the following classes were excluded as those were never created during refactoring: {non_valid}")
-            if user_role:
-                classes, no_access = self.neo_validate_access(classes, user_role=user_role)
-                print(
-                    f"WARNING: the following classes were excluded as the user_role {user_role} access is restricted: {no_access}")
+                if user_role:
+                    print(
+                        f"WARNING: the following classes were excluded as the user_role {user_role} access is restricted: {no_access}")
             if meta[0]['req_classes']:
                 classes = [(class_ + self.OCLASS_MARKER if class_ not in meta[0]['req_classes'] else class_) for
                            class_ in classes]
@@ -52,117 +172,204 @@ class SDTMDataProvider(DataProvider):
                 print(f'Excluding the following classes from rels: {excluded_classes}')
                 rels = self.filter_classes_from_rels(rels, excluded_classes)
 
-            df = self.get_data_generic(labels=classes,
-                                       rels=rels,
-                                       where_map=where_map,
-                                       infer_rels=False,
-                                       return_nodeid=False,
-                                       return_propname=False,
-                                       use_shortlabel=True,
-                                       only_props=[self.RDFSLABEL],
-                                       limit=None)
-
-            # renaming and re-ordering columns (according to metadata):
-            rename_dct = {}
-            for key, item in meta[0]['rename_dct'].items():
-                if not item in rename_dct.values():  # to avoid 2 columns with the same name
-                    if key != item:
-                        rename_dct[key] = item
-            df = df.rename(rename_dct, axis=1)
-
-            def _sorter(x):
-                # Some columns don't have an order set
-                none_count = 1000
-                if not x[1]:
-                    order = none_count
-                    none_count += 1
-                else:
-                    order = x[1]
-                return order
-
-            _col_order = [(k, v) for k, v in sorted(meta[0]['order_dct'].items(), key=lambda x: x[0])]
-            col_order = [k for k, v in sorted(_col_order, key=lambda x: _sorter(x))]
-
-            for col in col_order:
-                if col not in df.columns:
-                    df[col] = None
-            df = df[col_order]
-
-            # Sorting
-            # check that variables for sorting in meta actaully exist
-            sorting, sorting_excluded = [], []
-            if meta[0]['sorting']:
-                if isinstance(meta[0]['sorting'], list):
-                    l_sorting = meta[0]['sorting']
-                elif isinstance(meta[0]['sorting'], str):
-                    if "," in meta[0]['sorting']:
-                        l_sorting = meta[0]['sorting'].split(",")
-                    else:
-                        l_sorting = [meta[0]['sorting']]
-                else:
-                    l_sorting = []
-                for col in l_sorting:
-                    if col in df.columns:
-                        sorting.append(col)
-                    else:
-                        sorting_excluded.append(col)
-                    if sorting_excluded:
-                        print(
-                            f"ERROR: the following columns were excluded from sort-by-group as those have not been extracted"
-                            f"from the graph: {sorting_excluded}")
-
-            # sorting dataframe:
-            if sorting:
-                df = df.sort_values(by=sorting, ignore_index=True)
+            if columns:
+                unknown = [col for col in columns if col not in meta[0]['order_dct']]
+                if unknown:
+                    raise ValueError(f"Columns {unknown} are not in the extraction metadata of {domain}")
+                classes, rels = projection.project_extraction(meta, classes, rels,
+                                                              columns=list(columns) + self.get_sorting(meta),
+                                                              keep_classes=list(where_map),
+                                                              oclass_marker=self.OCLASS_MARKER)
+                if self.debug:
+                    print(f"Classes needed for columns {columns}: {classes}")
+
+            return {'meta': meta, 'classes': classes, 'rels': rels, 'where_map': where_map}
+
+    def fetch_data_sdtm(self, extraction: dict, where_map: dict = None):
+        """
+        :param extraction: as returned by prepare_data_sdtm
+        :param where_map: to use instead of the where_map of the extraction
+        :return: the data of the extraction as returned by get_data_generic (not yet renamed, re-ordered and sorted)
+        """
+        return self.get_data_generic(labels=extraction['classes'],
+                                     rels=extraction['rels'],
+                                     where_map=extraction['where_map'] if where_map is None else where_map,
+                                     infer_rels=False,
+                                     return_nodeid=False,
+                                     return_propname=False,
+                                     use_shortlabel=True,
+                                     only_props=[self.RDFSLABEL],
+                                     limit=None)
+
+    def format_data_sdtm(self, df, meta, columns: list = None):
+        """
+        Renames, re-orders and sorts the columns of the data extracted by get_data_generic (according to the
+        extraction metadata)
+        :param columns: if provided, only these columns are returned (after sorting)
+        """
+        # renaming and re-ordering columns (according to metadata):
+        rename_dct = {}
+        for key, item in meta[0]['rename_dct'].items():
+            if not item in rename_dct.values():  # to avoid 2 columns with the same name
+                if key != item:
+                    rename_dct[key] = item
+        df = df.rename(rename_dct, axis=1)
+
+        def _sorter(x):
+            # Some columns don't have an order set
+            none_count = 1000
+            if not x[1]:
+                order = none_count
+                none_count += 1
             else:
-                print(f"WARNING: no sort-by-group metadata(`Source Data Table`.SortOrder) was provided")
+                order = x[1]
+            return order
 
-            return df
+        _col_order = [(k, v) for k, v in sorted(meta[0]['order_dct'].items(), key=lambda x: x[0])]
+        col_order = [k for k, v in sorted(_col_order, key=lambda x: _sorter(x))]
 
-    def neo_get_meta(self, standard: str, table: str):
+        for col in col_order:
+            if col not in df.columns:
+                df[col] = None
+        df = df[col_order]
 
-        q = """
-        MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:$table}),
-        (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`), (class:Class)<-[:TO]-(rel:Relationship)-[:FROM]->(fromclass:Class)
-        WHERE
-          EXISTS(
-            (sdc)<-[:MAPS_TO_COLUMN]-(rel)-[:TO]->(class)
-          )
-          OR
-          EXISTS(
-            (sdt)-[:MAPS_TO_CLASS]->(class)
-          )
-        WITH *
-        OPTIONAL MATCH (sdc)-[r:MAPS_TO_CLASS]->(class)   
-        WITH *
-        ORDER BY sdf, sdt, sdc.Order, sdc
-        RETURN
-        collect({from: fromclass.label, to: class.label, type: rel.relationship_type, short_label: class.short_label}) as rels,
-        collect(distinct fromclass.label) + collect(distinct class.label) as classes,
-        apoc.coll.toSet(
-                [triple in [ 
-                    triple in collect([class.label, sdc.Core, class.create]) 
-                    where triple[1] = "Req" or triple[2]] | triple[0]
-                ] + 
-                [pair in [
-                    pair in collect([fromclass.label, fromclass.create]) 
-                    where pair[1]] | pair[0]
-                ] // Ensure Domain is in required classes
-            ) as req_classes,         
-        apoc.map.fromPairs(
-            [y in   
-                [x in collect(distinct {class:class, sdc:sdc, r:r}) WHERE NOT x['r'] IS NULL] | //filtering for classes with existing Column MAPS_TO_CLASS relationship
-                [
-                    //y['class'].label + '.' + y['class'].short_label,    //to be used as key of the dict
-                    y['class'].short_label,    //to be used as key of the dict
-                    y['sdc']._columnname_                               // to be used as value of the dict
-                ]
-            ]
-        ) as rename_dct,
-        apoc.map.fromPairs(collect([sdc._columnname_, sdc.Order])) as order_dct,
-        sdt['SortOrder'] as sorting
+        # Sorting
+        # check that variables for sorting in meta actaully exist
+        sorting, sorting_excluded = [], []
+        for col in self.get_sorting(meta):
+            if col in df.columns:
+                sorting.append(col)
+            else:
+                sorting_excluded.append(col)
+            if sorting_excluded:
+                print(
+                    f"ERROR: the following columns were excluded from sort-by-group as those have not been extracted"
+                    f"from the graph: {sorting_excluded}")
+
+        # sorting dataframe:
+        if sorting:
+            df = df.sort_values(by=sorting, ignore_index=True)
+        else:
+            print(f"WARNING: no sort-by-group metadata(`Source Data Table`.SortOrder) was provided")
+
+        if columns:
+            df = df[[col for col in col_order if col in columns]]
+        return df
+
+    @staticmethod
+    def get_sorting(meta) -> list:
+        """
+        :return: the list of sort-by-group columns of the extraction metadata (`Source Data Table`.SortOrder)
+        """
+        if isinstance(meta[0]['sorting'], list):
+            return meta[0]['sorting']
+        elif isinstance(meta[0]['sorting'], str) and meta[0]['sorting']:
+            return meta[0]['sorting'].split(",")
+        return []
+
+    def get_data_sdtm_many(self, standard: str, domains: list, study=None, where_map=None, user_role=None,
+                           columns: dict = None, workers: int = 4) -> dict:
+        """
+        Extracts several domains concurrently (see get_data_sdtm): the extraction metadata of all the domains is read
+        first (get_meta_many), then the domains are extracted by at most `workers` threads - each query runs in its
+        own session of the shared driver. A domain whose extraction fails does not stop the others.
+        :param domains: list of domains (_domain_ of the Source Data Tables)
+        :param columns: dictionary with the columns to extract of the domains (see get_data_sdtm) - all the columns
+        of the domains not in the dictionary
+        :param workers: Maximum number of domains extracted concurrently
+        :return: dictionary with keys 'data' ({domain: DataFrame}), 'timings' ({domain: seconds}) and
+        'errors' ({domain: error message}) - a failed domain is in 'timings' and 'errors' but not in 'data'
+        """
+        domains = list(dict.fromkeys(domains))
+        metas = self.get_meta_many(standard=standard, tables=domains)
+
+        def extract(domain):
+            start = time.perf_counter()
+            try:
+                return domain, self.get_data_sdtm(standard=standard, domain=domain, study=study, where_map=where_map,
+                                                  user_role=user_role, meta=metas.get(domain),
+                                                  columns=(columns or {}).get(domain)), None, \
+                    time.perf_counter() - start
+            except Exception as e:
+                return domain, None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(extract, domains))
+        else:
+            results = [extract(domain) for domain in domains]
+        res = {'data': {}, 'timings': {}, 'errors': {}}
+        for domain, df, error, seconds in results:
+            res['timings'][domain] = seconds
+            if error is None:
+                res['data'][domain] = df
+            else:
+                print(f"ERROR: the extraction of domain {domain} failed: {error}")
+                res['errors'][domain] = error
+        return res
+
+    def get_meta_many(self, standard: str, tables: list) -> dict:
+        """
+        :return: dictionary with the extraction metadata of each table (as get_meta) - the tables that are not cached
+        are read from their extraction plans in one query (the live query is run for the tables without an up to
+        date plan)
+        """
+        metas = {}
+        for table in tables:
+            meta = self.meta_cache.get(standard, table)
+            if meta is not None:
+                metas[table] = meta
+        missing = [table for table in tables if table not in metas]
+        if missing and self.use_extraction_plan:
+            metas.update(extraction_plan.get_extraction_plans(self, standard=standard, tables=missing))
+        for table in tables:
+            if table not in metas:
+                metas[table] = self.neo_get_meta(standard=standard, table=table)
+            if table in missing and metas[table]:
+                self.meta_cache.put(standard, table, metas[table])
+        return metas
+
+    def get_meta(self, standard: str, table: str):
+        """
+        :return: the extraction metadata of the table (as returned by neo_get_meta) - from the cache (see
+        invalidate), else from the extraction plan of the table if use_extraction_plan is set and the plan is up to
+        date, otherwise from the live query
+        """
+        meta = self.meta_cache.get(standard, table)
+        if meta is not None:
+            return meta
+        if self.use_extraction_plan:
+            meta = self.neo_get_extraction_plan(standard=standard, table=table)
+        if meta is None:
+            meta = self.neo_get_meta(standard=standard, table=table)
+        if meta:
+            self.meta_cache.put(standard, table, meta)
+        return meta
+
+    def invalidate(self, standard: str = None, table: str = None) -> int:
+        """
+        Removes cached extraction metadata (see get_meta) - to be called after the mapping of a table changed
+        (CdiscModelManager.automap_excel_based_model invalidates the caches of all the data providers of the process)
+        :param standard: only for this standard (all standards if None)
+        :param table: only for this table (all tables if None)
+        :return: number of cache entries removed
         """
+        return self.meta_cache.invalidate(standard=standard, tables=None if table is None else [table])
 
+    def clean_slate(self, *args, **kwargs) -> None:
+        self.invalidate()
+        super().clean_slate(*args, **kwargs)
+
+    def neo_get_extraction_plan(self, standard: str, table: str):
+        """
+        :return: the extraction metadata stored in the extraction plan of the table or None if there is no plan or
+        if it is stale (see extraction_plan.get_extraction_plan)
+        """
+        return extraction_plan.get_extraction_plan(self, standard=standard, table=table)
+
+    def neo_get_meta(self, standard: str, table: str):
+
+        q = extraction_plan.META_QUERY
         params = {'standard': standard, 'table': table}
         if self.debug:
             logging.debug(f"""
@@ -193,15 +400,11 @@ class SDTMDataProvider(DataProvider):
             return []
 
     def filter_classes_from_rels(self, rels, classes: list):
+        excluded = set(classes)
         clean_rels = []
         excluded_rels = []
         for rels_dict in rels:
-            intersect = False
-            for class_ in classes:
-                if class_ in rels_dict.values():
-                    intersect = True
-
-            if not intersect:
+            if excluded.isdisjoint(rels_dict.values()):
                 clean_rels.append(rels_dict)
             else:
                 excluded_rels.append(rels_dict)
@@ -219,18 +422,54 @@ class SDTMDataProvider(DataProvider):
         """
         q = """
         MATCH (n:Class) 
-        WHERE n.count = 0 OR NOT EXISTS (n.count)
+        WHERE n.label IN $classes AND (n.count = 0 OR NOT EXISTS (n.count))
         RETURN DISTINCT n.label as class
         """
-        pre_non_valid = [res['class'] for res in self.query(q, {'classes': classes})]
-        non_valid = []
-        for class_ in pre_non_valid:
-            if class_ in classes:
-                non_valid.append(class_)
-
-        valid = [class_ for class_ in classes if class_ not in non_valid]
+        pre_non_valid = {res['class'] for res in self.query(q, {'classes': classes})}
+        non_valid = [class_ for class_ in classes if class_ in pre_non_valid]
+        valid = [class_ for class_ in classes if class_ not in pre_non_valid]
         return valid, non_valid
 
+    def neo_validate_extraction(self, classes: list, check_counts: bool = True, user_role=None) -> ([], [], []):
+        """
+        Combines neo_validate_classes_to_extract and neo_validate_access in one query
+        :param classes: list of classes to validate
+        :param check_counts: Whether to identify the classes never created during refactoring (as
+        neo_validate_classes_to_extract)
+        :param user_role: when None no access restrictions are accounted for (as neo_validate_access)
+        :return: [], [], [] - list of valid classes, list of classes never created during refactoring and list of
+        classes the user_role has no access to (a class in both of these lists is only in the first one)
+        """
+        if not classes:
+            return [], [], []
+        q = """
+        OPTIONAL MATCH (role:`User Role`{name:$user_role})
+        WITH role
+        UNWIND $classes as label
+        OPTIONAL MATCH (n:Class{label:label})
+        WITH role, label, collect(n) as nodes
+        RETURN
+            label as class,
+            role IS NOT NULL as role_exists,
+            $check_counts AND any(n IN nodes WHERE n.count = 0 OR NOT EXISTS (n.count)) as non_valid,
+            role IS NOT NULL AND any(n IN nodes WHERE EXISTS ( (role)-[:ACCESS_RESTRICTED]->(n) )) as no_access
+        """
+        params = {'classes': list(dict.fromkeys(classes)), 'check_counts': check_counts, 'user_role': user_role}
+        if self.debug:
+            logging.debug(f"""
+                               query: {q}
+                               parameters: {params}
+                           """)
+        res = self.query(q, params)
+        if user_role and not res[0]['role_exists']:
+            raise Exception(f"User Role {user_role} does not exist")
+        pre_non_valid = {r['class'] for r in res if r['non_valid']}
+        pre_no_access = {r['class'] for r in res if r['no_access'] and not r['non_valid']}
+        non_valid = [class_ for class_ in classes if class_ in pre_non_valid]
+        no_access = [class_ for class_ in classes if class_ in pre_no_access]
+        valid = [class_ for class_ in classes if class_ not in pre_non_valid and class_ not in pre_no_access]
+        return valid, non_valid, no_access
+
     def neo_validate_access(self, classes: list, user_role=None) -> ([], []):
         """
         :param classes: list of classes to validate (nodes with labels Class and property label must exist)
@@ -1,33 +1,43 @@
 from model_managers.model_manager import ModelManager
+from cdisc_model_managers.query_catalog import NamedQueryMixin
+from cdisc_model_managers.class_hierarchy import SubclassClosureMixin
+from cdisc_model_managers.controlled_terms import ControlledTermsMixin, CONTROLLED_TERMS
+from cdisc_model_managers import metadata_snapshot
+from cdisc_model_managers import cdisc_standard_parser
+from cdisc_data_providers import extraction_plan
+from cdisc_data_providers import meta_cache
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 
-class CdiscModelManager(ModelManager):
+class CdiscModelManager(NamedQueryMixin, SubclassClosureMixin, ControlledTermsMixin, ModelManager):
+    # Labels of the nodes of the metadata graph saved by export_metadata_snapshot (with the fingerprint of the
+    # loaded standard, which holds its codelist_only mode - see is_codelist_only)
+    SNAPSHOT_LABELS = ["Class", "Relationship", "Term", "Dataset", "Variable", "DataElement", "Codelist",
+                       "ObservationClass", "VariableGrouping", "DataElementRole", "Standard Load Fingerprint"]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.verbose:
             print(f"---------------- {self.__class__} initialized -------------------")
 
     ## ---------------------------- Generate model from excel SDTM spec ----------------------------- ##
-    def generate_excel_based_model(self, label_terms: bool = False, create_term_indexes: bool = False, create_short_label: bool = False):
+    def generate_excel_based_model(self, label_terms: bool = False, create_term_indexes: bool = False, create_short_label: bool = False,
+                                   codelist_only: bool = None):
         """
         Run ExcelStandardLoader.load_standard() to prepare metadata from excel (and SDTM ontology form GitHub)
         in Neo4j
         :param create_term_indexes: Whether to create indexes for each Class that HAS_CONTROLLED_TERM (can be done later
         during reshaping)
         :param create_short_label: Whether to create the short_label property on Relationship (Variable) nodes
+        :param codelist_only: Whether the standard was loaded with CdiscStandardLoader(codelist_only=True) - the dehl
+        classes are then linked to the Codelists of their variables (HAS_CODELIST) instead of to each of their Terms.
+        If None, read from the loaded standard (see is_codelist_only)
         :return: None
         """
-        print("Creating indexes on Class and Term")
-        self.create_index(label="Class", key="label")
-        self.create_index(label="Class", key="short_label")
-        self.create_index(label="Relationship", key="relationship_type")
-        self.create_index(label="Term", key="Codelist Code")
-        self.create_index(label="Term", key="Term Code")
-        self.create_index(label="Term", key=ModelManager.RDFSLABEL)
-        print("Creating indexes on Source Data Table and Source Data Column")
-        self.create_index(label="Source Data Table", key="_domain_")
-        self.create_index(label="Source Data Column", key="_columnname_")
+        if codelist_only is None:
+            codelist_only = self.is_codelist_only()
+        self.create_model_indexes()
 
         # Terms
         print("Mapping Term GSK Codes and NCI Codes together")
@@ -47,7 +57,7 @@ class CdiscModelManager(ModelManager):
                    t.`NCI Term Code`
                END
            """
-        self.query(q)
+        self.run_query("generate_excel_based_model.map_term_codes", q)
 
         print("Creating Classes from Dataset and ObservationClass")
         # Datasets to Classes
@@ -78,7 +88,7 @@ class CdiscModelManager(ModelManager):
                MERGE (rec_class:Class{label: 'Record', short_label: 'RECORD'})
                MERGE (oc)-[:SUBCLASS_OF]->(rec_class)
                """
-        self.query(q)
+        self.run_query("generate_excel_based_model.create_dataset_classes", q)
 
         print("Creating Class from Variable")  # when no DataElement exists
         q = """
@@ -107,29 +117,21 @@ class CdiscModelManager(ModelManager):
                      v.Variable
                END
            SET v.create = False
-           // for the DM table, like all the variable to the (soon to be) subject class, otherwise link to the dataset class
-           WITH d, v
-           CALL apoc.do.when(
-              d.Dataset in $datasets
-              ,
-              '
-              MERGE (d)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
-              WITH d, v
-              MATCH (s:Variable)
-              WHERE s.Dataset in $datasets AND s.Label = "Unique Subject Identifier"
-              MERGE (s)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v) 
-              '
-              ,
-              '
-              MERGE (d)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v) 
-              '
-              ,
-              {d:d, v:v, datasets:$datasets}
-           )
-           YIELD value
-           RETURN value           
+           MERGE (d)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
+           RETURN count(v)
            """
-        self.query(q, {'datasets': ['DM']})
+        self.run_query("generate_excel_based_model.create_variable_classes", q)
+
+        # for the DM table, link all the variables also to the (soon to be) subject class
+        q = """
+           MATCH (d:Dataset)-[:HAS_VARIABLE]->(v:Variable:Class)
+           WHERE d.Dataset in $datasets
+           MATCH (s:Variable)
+           WHERE s.Dataset in $datasets AND s.Label = "Unique Subject Identifier"
+           MERGE (s)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
+           RETURN count(v)
+           """
+        self.run_query("generate_excel_based_model.link_subject_variable_classes", q, {'datasets': ['DM']})
 
         print("Creating Class from dataElement and Relationship from Variable")
         q = """
@@ -180,7 +182,17 @@ class CdiscModelManager(ModelManager):
                MATCH (v)-[:HAS_CONTROLLED_TERM]->(t:Term)
                MERGE (dehl)-[:HAS_CONTROLLED_TERM]->(t)
                """
-        self.query(q, {'short_label_bool': create_short_label})
+        self.run_query("generate_excel_based_model.create_data_element_classes", q,
+                       {'short_label_bool': create_short_label})
+
+        if codelist_only:
+            # Linking the dehl classes to the Codelists of their variables (instead of to each Term of them)
+            q = """
+            MATCH (d:Dataset)-[:HAS_VARIABLE]->(v:Variable)-[:IS_DATA_ELEMENT]->(:DataElement)-[:SUBCLASS_OF]->(dehl:Class)
+            MATCH (v)-[:HAS_CODELIST]->(c:Codelist)
+            MERGE (dehl)-[:HAS_CODELIST]->(c)
+            """
+            self.run_query("generate_excel_based_model.link_data_element_codelists", q)
 
         # In the DM dateset, migrate the relationships going TO variables FROM the Unique Subject Identifier
         # variable/relationship to the Subject Class (created from the USI variable above)
@@ -193,7 +205,7 @@ class CdiscModelManager(ModelManager):
         MATCH (subject:Class{label:'Subject'})
         MERGE (rel)-[:FROM]->(subject)
         """
-        self.query(q)
+        self.run_query("generate_excel_based_model.migrate_dm_relationships_to_subject", q)
 
         # Merging duplicate dehl Terms:
         # Note: this is rather a workaround
@@ -217,7 +229,30 @@ class CdiscModelManager(ModelManager):
            MERGE (t)-[:TERM_POOLED_INTO]->(dehl_term)
            DELETE r
            """
-        self.query(q)
+        if codelist_only:
+            # the same over the Terms of the Codelists of the dehl classes (only the pooled Terms are linked)
+            q = """
+               MATCH (dehl:Class)-[:HAS_CODELIST|HAS_CONTROLLED_TERM]->()-[:HAS_TERM*0..1]->(t:Term)
+               WHERE NOT dehl:Variable
+               WITH DISTINCT dehl, t
+               ORDER BY dehl, t.`rdfs:label`, t.`Codelist Code`, t.`Term Code`
+               WITH dehl, t.`rdfs:label` as Term, collect(t) as coll
+               WHERE size(coll) > 1
+               WITH *, coll[0] as template
+               MERGE (dehl_term:Term{`Codelist Code`: 'P' + template.`Codelist Code`, `Term Code`: 'P' + template.`Term Code`})
+               SET dehl_term.`rdfs:label` = template.`rdfs:label`
+               WITH *
+               MERGE (dehl)-[:HAS_CONTROLLED_TERM]->(dehl_term)
+               WITH *
+               UNWIND coll as t
+               MERGE (t)-[:TERM_POOLED_INTO]->(dehl_term)
+               WITH dehl, t
+               OPTIONAL MATCH (dehl)-[r:HAS_CONTROLLED_TERM]->(t)
+               DELETE r
+               """
+            self.run_query("generate_excel_based_model.pool_duplicate_codelist_terms", q)
+        else:
+            self.run_query("generate_excel_based_model.pool_duplicate_terms", q)
 
         # Link Domain Abbreviation to all dehl classes
         q = """
@@ -225,7 +260,7 @@ class CdiscModelManager(ModelManager):
            WHERE dehl <> domain_class AND NOT dehl.label in ['Subject', 'Study']
            MERGE (dehl)<-[:FROM]-(:Relationship{relationship_type:'DOMAIN'})-[:TO]->(domain_class)
            """
-        self.query(q)
+        self.run_query("generate_excel_based_model.link_domain_abbreviation", q)
 
         if label_terms:
             # Labelling Terms
@@ -234,15 +269,15 @@ class CdiscModelManager(ModelManager):
                WHERE NOT (c:DataElement)-[:SUBCLASS_OF]->()
                    AND NOT c.create //NOT labelling the classes that get always created (e.g. --ORRES), otherwise duplicates appear
                    AND NOT (c:Variable AND c.Dataset STARTS WITH 'SUPP')
-               WITH * 
-               MATCH (c)-[:HAS_CONTROLLED_TERM]->(t:Term)
+               WITH c
+               """ + CONTROLLED_TERMS + """
                WITH c, collect(t) AS coll
                WITH *
                CALL apoc.create.addLabels(coll, [c.label]) 
                YIELD node
                RETURN count(*)
                """
-            self.query(q)
+            self.run_query("generate_excel_based_model.label_terms", q)
 
             if create_term_indexes:
                 # Creating indexes for each Term label
@@ -250,20 +285,23 @@ class CdiscModelManager(ModelManager):
                 q = f"""
                    MATCH (c:Class) 
                    WHERE EXISTS ( (:Term)<-[:HAS_CONTROLLED_TERM]-(c) )
+                       OR EXISTS ( (:Term)<-[:HAS_TERM]-(:Codelist)<-[:HAS_CODELIST]-(c) )
                    RETURN c.label as label        
                    """
-                res = self.query(q)
+                res = self.run_query("generate_excel_based_model.get_term_classes", q)
                 for r in res:
                     # print(f"Creating index for {r['label']}")
-                    self.create_index(r['label'], ModelManager.RDFSLABEL)
+                    with self.profile_call("generate_excel_based_model.create_term_index"):
+                        self.create_index(r['label'], ModelManager.RDFSLABEL)
 
         # Creating classes from SUPP domain Terms (only SUPPDM for now)
         print("Creating Class from SUPP domain Terms")
         q = """
-           MATCH path=(t:Term)<-[:HAS_CONTROLLED_TERM]-(qnam:Variable),
+           MATCH (t:Term)<-[:HAS_TERM*0..1]-()<-[:HAS_CONTROLLED_TERM|HAS_CODELIST]-(qnam:Variable),
            (qnam)<-[:HAS_VARIABLE]-(suppd:Dataset)<-[:SUPP_DATASET]-(d:Dataset)        
                WHERE qnam.Dataset STARTS WITH 'SUPP' AND qnam.Variable = 'QNAM'
                AND d.Dataset = 'DM' // TODO: to be removed when generalized for all SUPP domains
+           WITH DISTINCT t, qnam, suppd, d // the Terms of the QNAM codelist are linked directly unless codelist_only
                //chellenges - (1) no 1:1 btw Term and `Decoded Value`; (2) no uniqueness of Term/`Decoded Value`: sz>1            
            //WITH t.`Decoded Value` as label
            WITH t.`Decoded Value` + ' (' + t.Term + ')' as label
@@ -287,18 +325,23 @@ class CdiscModelManager(ModelManager):
                WHERE qval.Variable = 'QVAL'
            MERGE (t)-[:HAS_CONTROLLED_TERM]->(vlterm)                       
            """
-        self.query(q)
+        self.run_query("generate_excel_based_model.create_supp_term_classes", q)
 
         # ------------------ LINKING-----------------------
         # (0)
 
         # -------- Creating  'qualifies' Relationship--------
         print("Creating Relationships based on SDTM ontology")
+        # between the dehl classes of the DataElements (or the DataElements themselves if they have no dehl class)
         q = """
-           MATCH p=(x:Class)<-[:SUBCLASS_OF*0..1]-(:DataElement)-[:qualifies]->(:DataElement)-[:SUBCLASS_OF*0..1]->(y:Class)
+           MATCH (x:DataElement)-[:qualifies]->(y:DataElement)
+           OPTIONAL MATCH (x)-[:SUBCLASS_OF]->(x_dehl:Class)
+           OPTIONAL MATCH (y)-[:SUBCLASS_OF]->(y_dehl:Class)
+           WITH DISTINCT coalesce(x_dehl, x) as subj, coalesce(y_dehl, y) as core
+           WHERE subj:Class AND core:Class AND subj <> core
            MERGE (subj)<-[:FROM]-(:Relationship{relationship_type:'QUALIFIES'})-[:TO]->(core)
            """
-        self.query(q)
+        self.run_query("generate_excel_based_model.create_qualifies_relationships", q)
 
         # --------------- Custom links (business experience) -------------------:
         # additional 'qualifies' rel for business purposes:
@@ -313,7 +356,7 @@ class CdiscModelManager(ModelManager):
            WHERE left_c.label = row['left'] and right_c.label = row['right']
            MERGE (left_c)<-[:FROM]-(:Relationship{relationship_type:row['rel']})-[:TO]->(right_c)
            """
-        self.query(q, {'data': data})
+        self.run_query("generate_excel_based_model.create_business_relationships", q, {'data': data})
 
         # (2)
         # -------- getting topics -------
@@ -322,7 +365,7 @@ class CdiscModelManager(ModelManager):
            WHERE der.label = 'Topic Variable'
            RETURN de.dataElementLabel as topic_class
            """
-        topics = self.query(q)
+        topics = self.run_query("generate_excel_based_model.get_topics", q)
         # extending and updating topics:
         df_topics = pd.DataFrame(
             topics + [{"topic_class": "Dictionary-Derived Term"}]
@@ -342,7 +385,9 @@ class CdiscModelManager(ModelManager):
              AND ctx.contextLabel = 'Findings Observation Class Variables'
            RETURN de.dataElementLabel as rq_class, de2.dataElementLabel as topic
            """
-        df_resqs = pd.DataFrame(self.query(q, {"topics": topics}))
+        df_resqs = pd.DataFrame(
+            self.run_query("generate_excel_based_model.get_result_qualifiers", q, {"topics": topics})
+        )
 
         # ------- linking Result Qualifiers to topics (Findings) -------
         print("Linking Result Qualifiers to Finding Topics")
@@ -353,7 +398,8 @@ class CdiscModelManager(ModelManager):
            MERGE (c_topic)<-[:FROM]-(r:Relationship)-[:TO]->(c)
            SET r.relationship_type = 'HAS_RESULT'
            """
-        self.query(q, {"data": df_resqs.to_dict(orient="records")})
+        self.run_query("generate_excel_based_model.link_result_qualifiers", q,
+                       {"data": df_resqs.to_dict(orient="records")})
 
         # (3)
         # linking grouping classes to topics
@@ -363,69 +409,67 @@ class CdiscModelManager(ModelManager):
            WHERE der.label = 'Grouping Qualifier'
            RETURN DISTINCT de.dataElementLabel as groupping_class
            """
-        groupings = [res["groupping_class"] for res in self.query(q)]
+        groupings = [res["groupping_class"]
+                     for res in self.run_query("generate_excel_based_model.get_grouping_qualifiers", q)]
 
         q = """
            MATCH (topic:Class), (gr:Class)
            WHERE topic.label in $topics and gr.label in $groupings
            MERGE (topic)<-[:FROM]-(:Relationship{relationship_type:'IN_CATEGORY'})-[:TO]->(gr)
            """
-        self.query(q, {"topics": topics, "groupings": groupings})
+        self.run_query("generate_excel_based_model.link_grouping_qualifiers", q,
+                       {"topics": topics, "groupings": groupings})
 
         # (4)
         # category to subcategory
         print("Linking Category to Sub-Category")
-        self.query("""
+        self.run_query("generate_excel_based_model.link_category_subcategory", """
            MATCH (cat:Class), (scat:Class)
            WHERE cat.label = 'Category' and scat.label = 'Subcategory'
            MERGE (cat)<-[:FROM]-(:Relationship{relationship_type:'HAS_SUBCATEGORY'})-[:TO]->(scat)
            """)
 
-    def automap_excel_based_model(self, domain: list, standard: str):
-        # mapping to Dataset and Variable/DataElement classes
+        print("Refreshing the SUBCLASS_OF closure")
+        self.refresh_subclass_closure()
+
+    def create_model_indexes(self):
+        """
+        Creates the indexes on Class, Relationship and Term used by generate_excel_based_model and the indexes on
+        Source Data Table and Source Data Column used by automap_excel_based_model
+        :return: None
+        """
+        with self.profile_call("create_model_indexes.create_index"):
+            print("Creating indexes on Class and Term")
+            self.create_index(label="Class", key="label")
+            self.create_index(label="Class", key="short_label")
+            self.create_index(label="Relationship", key="relationship_type")
+            self.create_index(label="Term", key="Codelist Code")
+            self.create_index(label="Term", key="Term Code")
+            self.create_index(label="Term", key=ModelManager.RDFSLABEL)
+            print("Creating indexes on Source Data Table and Source Data Column")
+            self.create_index(label="Source Data Table", key="_domain_")
+            self.create_index(label="Source Data Column", key="_columnname_")
+
+    def automap_excel_based_model(self, domain: list, standard: str) -> list:
+        """
+        Maps the Source Data Tables and Columns to the classes of the model (see automap_columns), attaches the
+        tables to the Data Extraction Standard, sets their sort order and the MAPS_TO_COLUMN relationships and
+        writes their extraction plans (see cdisc_data_providers/extraction_plan.py)
+        :param domain: list of domains (_domain_ of the Source Data Tables)
+        :param standard: _tag_ of the Data Extraction Standard
+        :return: list of {'table', 'column'} - the Source Data Columns that are not mapped to any class
+        """
+        # mapping to Dataset classes
         q = """
            MATCH (sdt:`Source Data Table`), (ds:Dataset)
            WHERE sdt._domain_ = ds.Dataset
            MERGE (sdt)-[:MAPS_TO_CLASS]->(ds)
-           WITH *
-           MATCH (ds)-[:HAS_VARIABLE]->(v:`Variable`),
-                 (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
-           WHERE sdc._columnname_ = v.Variable
-           CALL apoc.do.when(
-               v:Class,
-               '
-               WITH sdc, v        
-               MERGE (sdc)-[:MAPS_TO_CLASS]->(v)  
-               '
-               ,
-               '
-               WITH sdc, v
-               MATCH (v)-[:IS_DATA_ELEMENT]->()-[:SUBCLASS_OF]->(dehl)
-               MERGE (sdc)-[:MAPS_TO_CLASS]->(dehl)  
-               '
-               ,
-               {sdc:sdc, v:v}
-           ) YIELD value               
-           RETURN *
+           RETURN count(ds)
            """
-        self.query(q)
+        self.run_query("automap_excel_based_model.map_datasets", q)
 
-        # mapping to SUPP-- Term Classes
-        q = """                
-           MATCH (t:Term:Class), (sdc:`Source Data Column`)
-           WHERE t.short_label = sdc._columnname_
-           MERGE (sdc)-[:MAPS_TO_CLASS]->(t) 
-           """
-        self.query(q)
-
-        q = f"""
-        MATCH (sdt:`Source Data Table`)-[:HAS_COLUMN]->(sdc:`Source Data Column`), (d:Dataset)-->(v:Variable)
-        WHERE sdt._domain_ = d.Dataset and sdc._columnname_ = v.Variable
-        SET sdc.Order = v.Order
-        SET sdc.Core = v.Core
-        """
-
-        self.query(q)
+        # mapping columns to the Variable, DataElement and SUPP-- Term classes, and setting Order and Core
+        unmapped = self.automap_columns()
 
         # add the Data Extraction Standard node to the db and attach it to the Source Data Tables
         q = """
@@ -435,48 +479,258 @@ class CdiscModelManager(ModelManager):
                MERGE (sdf)-[:HAS_TABLE]->(sdt)
                """
         params = {'standard': standard}
-        self.query(q, params)
+        self.run_query("automap_excel_based_model.attach_tables_to_standard", q, params)
 
         # set the SortOrder property for each source data table in the graph
         self.set_sort_order(domain=domain, standard=standard)
         # Extend the extraction metadata with MAPS_TO_COLUMN rel between relationship and source data column nodes
         self.extend_extraction_metadata(domain=domain, standard=standard)
+        # materialize the extraction metadata read by SDTMDataProvider.get_data_sdtm
+        extraction_plan.materialize_extraction_plans(self, standard=standard, tables=domain)
+        # the mapping of all the tables of the standard may have changed
+        meta_cache.invalidate_all(standard=standard)
+        return unmapped
 
-    def set_sort_order(self, domain: list, standard: str):
+    def automap_columns(self, chunk_size: int = 10000) -> list:
+        """
+        Maps the Source Data Columns to the Variable classes of the Dataset of their table (or to the parent classes
+        of the DataElements of the variables that are not classes) and to the Term classes (SUPP--) and sets their
+        Order and Core from the variable: the columns, variables and Term classes are read once and joined in Python
+        (see cdisc_standard_parser.automap_columns), the MAPS_TO_CLASS relationships and properties are written in
+        batches of chunk_size
+        :param chunk_size: Maximum number of relationships/columns written per query
+        :return: list of {'table', 'column'} - the Source Data Columns that are not mapped to any class
+        """
+        q = """
+           MATCH (sdt:`Source Data Table`)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+           RETURN id(sdc) as id, sdt._domain_ as table, sdc._columnname_ as column
+           """
+        columns = self.run_query("automap_columns.get_columns", q)
+        q = """
+           MATCH (ds:Dataset)-[:HAS_VARIABLE]->(v:Variable)
+           OPTIONAL MATCH (v)-[:IS_DATA_ELEMENT]->()-[:SUBCLASS_OF]->(dehl)
+           RETURN id(v) as id, ds.Dataset as table, v.Variable as column, v:Class as is_class, v.Order as Order,
+                  v.Core as Core, collect(id(dehl)) as dehl_ids
+           """
+        variables = self.run_query("automap_columns.get_variables", q)
+        q = """
+           MATCH (t:Term:Class)
+           RETURN id(t) as id, t.short_label as short_label
+           """
+        term_classes = self.run_query("automap_columns.get_term_classes", q)
+        maps, properties, unmapped = cdisc_standard_parser.automap_columns(columns, variables, term_classes)
 
-        for dom in domain:
+        q = """
+           UNWIND $rows as row
+           MATCH (sdc:`Source Data Column`), (c)
+           WHERE id(sdc) = row.sdc AND id(c) = row.class_id
+           MERGE (sdc)-[:MAPS_TO_CLASS]->(c)
+           """
+        for i in range(0, len(maps), chunk_size):
+            self.run_query("automap_columns.merge_maps_to_class", q, {'rows': maps[i:i + chunk_size]})
+        q = """
+           UNWIND $rows as row
+           MATCH (sdc:`Source Data Column`)
+           WHERE id(sdc) = row.id
+           SET sdc.Order = row.Order
+           SET sdc.Core = row.Core
+           """
+        for i in range(0, len(properties), chunk_size):
+            self.run_query("automap_columns.set_order_and_core", q, {'rows': properties[i:i + chunk_size]})
+        print(f"Automapping: {len(maps)} MAPS_TO_CLASS relationships, {len(unmapped)} unmapped columns")
+        return unmapped
+
+    def set_sort_order(self, domain: list = None, standard: str = None):
+        """
+        Sets SortOrder (the column names ordered by Order) on the Source Data Tables of the Data Extraction Standard
+        in one query for all the domains
+        :param domain: list of domains (_domain_ of the Source Data Tables); if None all the tables of the standard
+        :param standard: _tag_ of the Data Extraction Standard
+        :return: number of Source Data Tables updated
+        """
+        if domain is None:
             q = """
-               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:$domain})-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
                WITH sdc, sdt
                ORDER BY sdc.Order
                WITH collect(sdc._columnname_) AS col_order, sdt
                SET sdt.SortOrder = col_order
+               RETURN count(sdt) as n
                """
-            params = {'domain': dom, 'standard': standard}
-
-            self.query(q, params)
-
+            res = self.run_query("set_sort_order.all_tables", q, {'standard': standard})
+        else:
             q = """
-               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:$domain})-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+               UNWIND $domains as dom
+               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:dom})-[:HAS_COLUMN]->(sdc:`Source Data Column`)
                WITH sdc, sdt
                ORDER BY sdc.Order
                WITH collect(sdc._columnname_) AS col_order, sdt
                SET sdt.SortOrder = col_order
+               RETURN count(sdt) as n
                """
-            params = {'domain': dom, 'standard': standard}
+            params = {'domains': list(dict.fromkeys(domain)), 'standard': standard}
+            res = self.run_query("set_sort_order.domains", q, params)
+        return res[0]['n'] if res else 0
 
-            self.query(q, params)
-
-    def extend_extraction_metadata(self, domain: list, standard: str):
-        # Adds the relationship MAPS_TO_COLUMN between the source data column node and the relationship that
-        # sdc node's variable is pointing 'TO'. WHERE that relationship is 'FROM' a core class (ie FA, EX, VS, ... etc)
-        for dom in domain:
+    def extend_extraction_metadata(self, domain: list = None, standard: str = None, chunk_size: int = 100,
+                                   workers: int = 1) -> dict:
+        """
+        Adds the relationship MAPS_TO_COLUMN between the source data column node and the relationship that
+        sdc node's variable is pointing 'TO'. WHERE that relationship is 'FROM' a core class (ie FA, EX, VS, ... etc)
+        The domains are handled by a single parameterized query per chunk of chunk_size domains; with workers > 1
+        the chunks are run concurrently (each query runs in its own session)
+        :param domain: list of domains (_domain_ of the Source Data Tables); if None all the tables of the standard
+        :param standard: _tag_ of the Data Extraction Standard
+        :param chunk_size: Maximum number of domains per query
+        :param workers: Maximum number of queries run concurrently
+        :return: dictionary with the number of MAPS_TO_COLUMN relationships created per domain
+        """
+        if domain is None:
             q = """
-               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:$table})
-               , (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)-[:MAPS_TO_CLASS]->(c:Class)<-[:TO]-(r:Relationship)
-               , (r)-[:FROM]-(c2:Class)
-               WHERE c2.short_label = $table
-               MERGE (r)-[:MAPS_TO_COLUMN]-(sdc)
+               MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`)
+               RETURN DISTINCT sdt._domain_ as domain
                """
-            params = {'standard': standard, 'table': dom}
-            self.query(q, params)
+            domain = [r['domain'] for r in self.run_query("extend_extraction_metadata.get_tables", q,
+                                                           {'standard': standard})]
+        tables = list(dict.fromkeys(domain))
+        q = """
+           UNWIND $tables as table
+           MATCH (sdf:`Data Extraction Standard`{_tag_:$standard})-[:HAS_TABLE]->(sdt:`Source Data Table`{_domain_:table})
+           , (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)-[:MAPS_TO_CLASS]->(c:Class)<-[:TO]-(r:Relationship)
+           , (r)-[:FROM]-(c2:Class)
+           WHERE c2.short_label = table
+           WITH DISTINCT table, r, sdc
+           WITH table, r, sdc, EXISTS ((r)-[:MAPS_TO_COLUMN]-(sdc)) as existed
+           MERGE (r)-[:MAPS_TO_COLUMN]-(sdc)
+           RETURN table, sum(CASE WHEN existed THEN 0 ELSE 1 END) as created
+           """
+
+        def run_chunk(chunk):
+            return self.run_query("extend_extraction_metadata.merge_maps_to_column", q,
+                                  {'standard': standard, 'tables': chunk})
+
+        chunks = [tables[i:i + chunk_size] for i in range(0, len(tables), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(run_chunk, chunks))
+        else:
+            results = [run_chunk(chunk) for chunk in chunks]
+        created = {table: 0 for table in tables}
+        for res in results:
+            created.update({r['table']: r['created'] for r in res})
+        return created
+
+    ## ---------------------------- Metadata snapshot ----------------------------- ##
+    def export_metadata_snapshot(self, path: str, labels: list = None) -> dict:
+        """
+        Saves the metadata graph built by CdiscStandardLoader.load_standard and generate_excel_based_model
+        (nodes with any of the labels, with their labels and properties, and the relationships between them)
+        to a compact versioned file (see metadata_snapshot.write_snapshot) that can be loaded into an empty
+        database with restore_metadata_snapshot
+        :param path: path of the snapshot file
+        :param labels: labels of the nodes to save (default: SNAPSHOT_LABELS)
+        :return: dictionary with the number of nodes and relationships saved
+        """
+        labels = labels or self.SNAPSHOT_LABELS
+        q = """
+        MATCH (n)
+        WHERE any(label IN labels(n) WHERE label IN $labels)
+        RETURN id(n) as id, labels(n) as labels, properties(n) as props
+        """
+        # (the temporal values are kept as neo4j.time values - see metadata_snapshot.encode_value)
+        nodes = self.run_query("export_metadata_snapshot.get_nodes", q, {'labels': labels}, convert_dates=False)
+        q = """
+        MATCH (a)-[r]->(b)
+        WHERE any(label IN labels(a) WHERE label IN $labels) AND any(label IN labels(b) WHERE label IN $labels)
+        RETURN id(a) as from_id, type(r) as type, id(b) as to_id, properties(r) as props
+        """
+        rels = self.run_query("export_metadata_snapshot.get_relationships", q, {'labels': labels},
+                              convert_dates=False)
+        metadata_snapshot.write_snapshot(path, labels, nodes, rels)
+        print(f"Metadata snapshot saved to {path}: {len(nodes)} nodes, {len(rels)} relationships")
+        return {'nodes': len(nodes), 'relationships': len(rels)}
+
+    def restore_metadata_snapshot(self, path: str, chunk_size: int = 10000) -> dict:
+        """
+        Loads a snapshot saved by export_metadata_snapshot with batched writes.
+        The database must not contain nodes with the labels of the snapshot yet.
+        N.B. Indexes are not part of the snapshot - create them with CdiscStandardLoader.create_schema and
+        create_model_indexes if needed
+        :param path: path of the snapshot file
+        :param chunk_size: Maximum number of nodes/relationships written per query
+        :return: dictionary with the number of nodes and relationships restored
+        """
+        snapshot = metadata_snapshot.read_snapshot(path)
+        counts = self.write_metadata_graph(snapshot, chunk_size=chunk_size)
+        print(f"Metadata snapshot restored from {path}: {counts['nodes']} nodes, {counts['relationships']} relationships")
+        return counts
+
+    def write_metadata_graph(self, graph: dict, chunk_size: int = 10000) -> dict:
+        """
+        Writes a metadata graph in the format of metadata_snapshot.read_snapshot with batched writes.
+        The database must not contain nodes with the labels of the graph yet.
+        :param graph: dictionary {'labels', 'nodes': [[id, labels, properties]], 'rels': [[from id, type, to id, properties]]}
+        :param chunk_size: Maximum number of nodes/relationships written per query
+        :return: dictionary with the number of nodes and relationships written
+        """
+        q = """
+        MATCH (n)
+        WHERE any(label IN labels(n) WHERE label IN $labels)
+        RETURN count(n) as n
+        """
+        res = self.run_query("write_metadata_graph.count_existing", q, {'labels': graph['labels']})
+        if res and res[0]['n'] > 0:
+            raise Exception(f"Cannot write the metadata graph: the database already contains {res[0]['n']} metadata nodes")
+
+        # creating the nodes (and mapping the ids of the graph to the ids of the new nodes)
+        q = """
+        UNWIND $nodes as row
+        CALL apoc.create.node(row[1], row[2]) YIELD node
+        RETURN row[0] as graph_id, id(node) as id
+        """
+        ids = {}
+        nodes = graph['nodes']
+        for i in range(0, len(nodes), chunk_size):
+            res = self.run_query("write_metadata_graph.create_nodes", q, {'nodes': nodes[i:i + chunk_size]})
+            ids.update({r['graph_id']: r['id'] for r in res})
+
+        # creating the relationships
+        q = """
+        UNWIND $rels as row
+        MATCH (a), (b)
+        WHERE id(a) = row[0] AND id(b) = row[2]
+        CALL apoc.create.relationship(a, row[1], row[3], b) YIELD rel
+        RETURN count(rel)
+        """
+        rels = [[ids[rel[0]], rel[1], ids[rel[2]], rel[3]] for rel in graph['rels']]
+        for i in range(0, len(rels), chunk_size):
+            self.run_query("write_metadata_graph.create_relationships", q, {'rels': rels[i:i + chunk_size]})
+        return {'nodes': len(nodes), 'relationships': len(rels)}
+
+    def load_built_model(self, builder, create_term_indexes: bool = False, chunk_size: int = 10000) -> dict:
+        """
+        Writes the model built in memory by a ModelBuilder (see model_builder.py) in one batched load - instead of
+        running CdiscStandardLoader.load_standard(direct=True) and generate_excel_based_model in the database.
+        The database must not contain metadata nodes yet.
+        EXAMPLE:
+            builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+            builder.build()
+            mm.load_built_model(builder)
+        :param builder: ModelBuilder object on which build() has been called
+        :param create_term_indexes: Whether to create indexes for each Class that HAS_CONTROLLED_TERM
+        :param chunk_size: Maximum number of nodes/relationships written per query
+        :return: dictionary with the number of nodes and relationships written
+        """
+        errors = builder.validate()
+        if errors:
+            raise Exception(f"The built model is not valid ({len(errors)} errors): " + "; ".join(errors[:10]))
+        self.create_model_indexes()
+        counts = self.write_metadata_graph(builder.to_graph(), chunk_size=chunk_size)
+        self.refresh_subclass_closure(chunk_size=chunk_size)
+        if create_term_indexes:
+            print("Creating indexes for each Term label")
+            for label in builder.term_class_labels():
+                with self.profile_call("load_built_model.create_term_index"):
+                    self.create_index(label, ModelManager.RDFSLABEL)
+        print(f"Built model loaded: {counts['nodes']} nodes, {counts['relationships']} relationships")
+        return counts
@@ -2,18 +2,60 @@ import os
 from model_appliers.model_applier import ModelApplier
 import json
 from data_loaders import file_data_loader
-import re
+from cdisc_model_managers import cdisc_standard_parser
+from cdisc_model_managers import ttl_parser
+from cdisc_model_managers.query_catalog import NamedQueryMixin
+from cdisc_model_managers.query_profiler import QueryProfiler
+from cdisc_model_managers.class_hierarchy import SubclassClosureMixin
 
 
-class CdiscStandardLoader(ModelApplier):
+class CdiscStandardLoader(NamedQueryMixin, SubclassClosureMixin, ModelApplier):
+    # Version of the loading logic (see cdisc_standard_parser.LOADER_VERSION)
+    LOADER_VERSION = cdisc_standard_parser.LOADER_VERSION
+    # Files of the standards folder that are loaded besides sdtm_file, sdtmig_file and terminology_file
+    DOMAIN_SORT_ORDER_FILE = "sdtmig3_2_domain_sort_order.json"
+    DOMAIN_LABELS_FILE = "sdtmig3_3_domain_labels.json"
+    TTL_FILE = "sdtm-1-3.ttl"
+    # Fingerprint entries whose change can be applied by rerunning only the listed stage with reset=True (see
+    # load_standard); a change of any other entry (e.g. of the TTL file, whose DataElements and IS_DATA_ELEMENT
+    # links are used by the other stages) requires the full load
+    PARTIAL_RELOAD_STAGES = {
+        'domain_labels_sha256': 'set_domain_labels',
+        'domain_sort_order_sha256': 'set_domain_sort_order',
+    }
+    # Labels that the loader substitutes into the `<placeholder>`s of its named queries (see QueryCatalog)
+    NODE_LABELS = ["GOC", "Special_Purpose_Variable", "Variable", "Codelist", "Term", "Retired Codelist",
+                   "Retired Term"]
+    # Uniqueness constraints and indexes the joins of the loading steps rely on (see create_schema)
+    SCHEMA_CONSTRAINTS = [
+        ("Domain", "Domain"),  # reshape_sdtmig, set_domain_sort_order
+        ("ObservationClass", "Class"),  # reshape_sdtmig
+    ]
+    SCHEMA_INDEXES = [
+        ("GOC", "Class"),  # reshape_model
+        ("Variable", "Dataset Name"),  # reshape_sdtmig, set_domain_sort_order
+        ("Variable", "Variable Name"),  # set_domain_sort_order
+        ("Variable", "Codelist Code"),  # link_cdisc
+        ("Variable", "dataElementName"),  # load_link_sdtm_ttl
+        ("Codelist", "Code"),  # reshape_terminology, link_cdisc
+        ("Term", "Codelist Code"),  # reshape_terminology
+        ("Term", "CDISC Submission Value"),  # link_cdisc
+        ("DataElement", "dataElementName"),  # load_link_sdtm_ttl
+        ("VariableGrouping", "contextLabel"),  # reshape_model, load_link_sdtm_ttl
+    ]
 
     def __init__(self, standards_folder: str = None, sdtm_file: str = None, sdtmig_file: str = None, terminology_file: str = None,
-                 *args, **kwargs):
+                 batch_size: int = 10000, codelist_only: bool = False, *args, **kwargs):
         """
         :param standards_folder: Directory where standard files are stored
         :param sdtm_file: Name of file containing SDTM Model metadata
         :param sdtmig_file: Name of file containing SDTMIG metadata
         :param terminology_file: Name of file containing SDTM Terminology
+        :param batch_size: Maximum number of nodes updated per transaction by the relabel/reshape steps
+        (see run_in_batches)
+        :param codelist_only: If True the Variables are only linked to their Codelist (HAS_CODELIST) instead of also
+        to every Term of it (HAS_CONTROLLED_TERM) - the terms are then resolved on demand (see controlled_terms.py).
+        The Terms of the `Value List` of the Variables are linked in both cases
         """
         super().__init__(rdf=True, *args, **kwargs)
         assert os.path.exists(standards_folder)
@@ -24,79 +66,278 @@ class CdiscStandardLoader(ModelApplier):
         self.sdtm_file = sdtm_file
         self.sdtmig_file = sdtmig_file
         self.terminology_file = terminology_file
+        self.batch_size = batch_size
+        self.codelist_only = codelist_only
+        self.allow_labels(sdtm_file, sdtmig_file, terminology_file, *self.NODE_LABELS)
 
-    def load_standard(self, extract_terms: bool = True, extract_vld: bool = True):
+    def load_standard(self, extract_terms: bool = True, extract_vld: bool = True, direct: bool = False,
+                      force: bool = False, profile: str = None):
+        """
+        :param direct: If True the standard files are parsed once in Python and written to Neo4j already labelled
+        and with the derived properties (see ingest_standard) instead of being loaded as `Source Data Row` nodes
+        and relabelled in Neo4j
+        :param force: If False the fingerprint of the inputs (see input_fingerprint) is compared with the one saved
+        by the previous load: nothing is done if they are the same and only the affected stages are rerun (after
+        removing the values they set - see PARTIAL_RELOAD_STAGES) if only the domain labels or domain sort order
+        files changed. If True the standard is always fully loaded
+        :param profile: If provided, path of a json report with the wall time, rows and update counters of every
+        query, rolled up per stage (see QueryProfiler)
+        :return: list of the stages that were run
+        """
         print("Loading content")
         print("Standards folder:", self.standards_folder)
         print("Standards model:", self.sdtm_file)
         print("Standards Implementation Guide:", self.sdtmig_file)
         print("Terminology file:", self.terminology_file)
 
-        fdl = file_data_loader.FileDataLoader()
-        df = fdl.load_file(self.standards_folder, self.sdtm_file)
-        q = f"""
-        MATCH (n:`Source Data Row`)
-        REMOVE n:`Source Data Row`
-        SET    n:`{self.sdtm_file}`
+        if profile:
+            self.profiler = QueryProfiler()
+        try:
+            with self.profile_stage('fingerprint'):
+                fingerprint = self.input_fingerprint(extract_terms=extract_terms, extract_vld=extract_vld)
+                stages = None if force else self.changed_stages(fingerprint)
+            if stages == []:
+                print("Standard inputs unchanged since the last load - nothing to do")
+                return stages
+
+            with open(os.path.join(self.standards_folder, self.DOMAIN_SORT_ORDER_FILE), 'r') as json_file:
+                json_data = json.load(json_file)
+            self.DOMAIN_SORT_ORDER = json_data["domain_sort_order"]
+            with open(os.path.join(self.standards_folder, self.DOMAIN_LABELS_FILE), 'r') as json_file:
+                json_data = json.load(json_file)
+            self.DOMAIN_LABELS = json_data["domain_labels"]
+
+            if stages is None:
+                stages = ['load_files', 'reshape_model', 'reshape_sdtmig', 'reshape_terminology', 'link_cdisc',
+                          'load_link_sdtm_ttl']
+                with self.profile_stage('load_files'):
+                    self.create_schema()
+                    if direct:
+                        self.ingest_standard()
+                    else:
+                        fdl = file_data_loader.FileDataLoader()
+                        for file in [self.sdtm_file, self.sdtmig_file, self.terminology_file]:
+                            with self.profile_call("load_standard.load_file") as entry:
+                                df = fdl.load_file(self.standards_folder, file)
+                                entry['rows'] = len(df)
+                            self.run_in_batches(
+                                "load_standard.relabel_source_data_rows",
+                                match="MATCH (n:`Source Data Row`)",
+                                update="""
+                                REMOVE n:`Source Data Row`
+                                SET    n:`<file>`
+                                """,
+                                labels={'file': file}
+                            )
+                with self.profile_stage('reshape_model'):
+                    self.reshape_model(relabel=not direct)
+                with self.profile_stage('reshape_sdtmig'):
+                    self.reshape_sdtmig(relabel=not direct)
+                with self.profile_stage('reshape_terminology'):
+                    self.reshape_terminology(relabel=not direct)
+                with self.profile_stage('link_cdisc'):
+                    self.link_cdisc(extract_terms=extract_terms, extract_vld=extract_vld)
+                with self.profile_stage('load_link_sdtm_ttl'):
+                    self.load_link_sdtm_ttl(bulk=True)
+            else:
+                print("Rerunning stages with changed inputs:", stages)
+                for stage in stages:
+                    with self.profile_stage(stage):
+                        getattr(self, stage)(reset=True)
+            self.save_fingerprint(fingerprint)
+            return stages
+        finally:
+            if profile:
+                self.profiler.write_report(profile)
+                print("Profile report:", profile)
+                self.profiler = None
+
+    def input_fingerprint(self, extract_terms: bool = True, extract_vld: bool = True) -> dict:
+        """
+        :return: dictionary with the names and sha256 hashes of all the input files of load_standard,
+        the load options and LOADER_VERSION
         """
-        self.query(q)
+        files = {
+            'sdtm': self.sdtm_file,
+            'sdtmig': self.sdtmig_file,
+            'terminology': self.terminology_file,
+            'domain_sort_order': self.DOMAIN_SORT_ORDER_FILE,
+            'domain_labels': self.DOMAIN_LABELS_FILE,
+            'ttl': self.TTL_FILE,
+        }
+        return cdisc_standard_parser.input_fingerprint(
+            self.standards_folder, files, loader_version=self.LOADER_VERSION, extract_terms=extract_terms,
+            extract_vld=extract_vld, codelist_only=self.codelist_only
+        )
 
-        df = fdl.load_file(self.standards_folder, self.sdtmig_file)
-        q = f"""
-        MATCH (n:`Source Data Row`)
-        REMOVE n:`Source Data Row`
-        SET    n:`{self.sdtmig_file}`
+    def get_fingerprint(self) -> dict:
+        """
+        :return: the fingerprint saved by the last load_standard (None if the standard was never loaded)
+        """
+        q = """
+        MATCH (f:`Standard Load Fingerprint`)
+        RETURN f{.*} as fingerprint
         """
-        self.query(q)
+        res = self.run_query("get_fingerprint.get_fingerprint", q)
+        return res[0]['fingerprint'] if res else None
 
-        df = fdl.load_file(self.standards_folder, self.terminology_file)
-        q = f"""
-        MATCH (n:`Source Data Row`)
-        REMOVE n:`Source Data Row`
-        SET    n:`{self.terminology_file}`
-        """
-        self.query(q)
-
-        with open(os.path.join(self.standards_folder, "sdtmig3_2_domain_sort_order.json"), 'r') as json_file:
-            json_data = json.load(json_file)
-        self.DOMAIN_SORT_ORDER = json_data["domain_sort_order"]
-        with open(os.path.join(self.standards_folder, "sdtmig3_3_domain_labels.json"), 'r') as json_file:
-            json_data = json.load(json_file)
-        self.DOMAIN_LABELS = json_data["domain_labels"]
-        self.reshape_model()
-        self.reshape_sdtmig()
-        self.reshape_terminology()
-        self.link_cdisc()
-        self.load_link_sdtm_ttl(local=False)
-
-    def reshape_model(self):
-        # Create nodes for General Observation Classes
-        q = f"""
-        MATCH (n:`{self.sdtm_file}`)
-        WITH collect(distinct(n.Class)) as gocs
-        UNWIND gocs as goc
-        MERGE (d:ObservationClass {{Class: toUpper(goc), label:goc}})
-        RETURN count(d)
+    def save_fingerprint(self, fingerprint: dict):
+        q = """
+        MERGE (f:`Standard Load Fingerprint`)
+        SET f = $fingerprint
+        SET f.loaded_at = datetime()
         """
-        self.query(q)
+        self.run_query("save_fingerprint.save_fingerprint", q, {'fingerprint': fingerprint})
 
-        # Change label on general observation class variables
-        q = f"""
-        MATCH (n:`{self.sdtm_file}`)
-        WHERE n.`Dataset Name` = ""
-        REMOVE n:`{self.sdtm_file}`
-        SET    n:GOC
+    def changed_stages(self, fingerprint: dict) -> list:
         """
-        self.query(q)
+        :param fingerprint: fingerprint of the current inputs (see input_fingerprint)
+        :return: list of stages to rerun for the entries that differ from the saved fingerprint (see
+        PARTIAL_RELOAD_STAGES) or None if the full load is needed
+        """
+        saved = self.get_fingerprint()
+        if not saved:
+            return None
+        changed = [key for key, value in fingerprint.items() if saved.get(key) != value]
+        if any(key not in self.PARTIAL_RELOAD_STAGES for key in changed):
+            return None
+        return [stage for key, stage in self.PARTIAL_RELOAD_STAGES.items() if key in changed]
 
-        # Change label on special purpose class variables
-        q = f"""
-        MATCH (n:`{self.sdtm_file}`)
-        WHERE n.`Dataset Name` <> ""
-        REMOVE n:`{self.sdtm_file}`
-        SET    n:Special_Purpose_Variable
+    def create_schema(self, timeout: int = 300):
+        """
+        Creates up front the uniqueness constraints and indexes (SCHEMA_CONSTRAINTS, SCHEMA_INDEXES) that the joins
+        of the later loading steps rely on and verifies that they are ONLINE before proceeding
+        :param timeout: Number of seconds to wait for the indexes to come online
+        :return: None
+        """
+        for label, key in self.SCHEMA_CONSTRAINTS:
+            with self.profile_call("create_schema.create_constraint"):
+                self.create_constraint(label=label, key=key)
+        for label, key in self.SCHEMA_INDEXES:
+            with self.profile_call("create_schema.create_index"):
+                self.create_index(label=label, key=key)
+
+        self.run_query("create_schema.await_indexes", "CALL db.awaitIndexes($timeout)", {'timeout': timeout})
+        q = """
+        CALL db.indexes() YIELD labelsOrTypes, properties, state
+        WHERE size(labelsOrTypes) = 1 AND size(properties) = 1
+        RETURN labelsOrTypes[0] as label, properties[0] as key, state
+        """
+        states = {(r['label'], r['key']): r['state'] for r in self.run_query("create_schema.index_states", q)}
+        not_online = [f"{label}.{key}" for label, key in self.SCHEMA_CONSTRAINTS + self.SCHEMA_INDEXES
+                      if states.get((label, key)) != 'ONLINE']
+        if not_online:
+            raise Exception(f"The following indexes are not ONLINE: {not_online}")
+
+    def run_in_batches(self, name: str, match: str, update: str, params: dict = None, labels: dict = None) -> int:
+        """
+        Runs a node-wise update in transactions of at most batch_size nodes instead of in a single transaction:
+        the ids of the nodes matched as n by `match` are collected first and `update` is then run for each batch of
+        ids, printing the progress
+        EXAMPLE:
+            run_in_batches("reshape_terminology.relabel_codelists",
+                           match='MATCH (n:`<terminology_file>`) WHERE n.`Codelist Code` = ""',
+                           update='REMOVE n:`<terminology_file>` SET n:Codelist',
+                           labels={'terminology_file': self.terminology_file})
+        :param name: name of the query in the QueryCatalog (the matching query is named name + '.match')
+        :param match: Cypher clauses matching the nodes to update as n
+        :param update: Cypher clauses updating n
+        :param params: query parameters (available to both match and update)
+        :param labels: dictionary with placeholder names as keys and (whitelisted) labels as values
+        :return: number of nodes updated
+        """
+        q = match + """
+        RETURN id(n) as id
+        """
+        ids = [r['id'] for r in self.run_query(f"{name}.match", q, params, labels)]
+        q = """
+        UNWIND $ids as id
+        MATCH (n)
+        WHERE id(n) = id
+        """ + update
+        for i in range(0, len(ids), self.batch_size):
+            self.run_query(name, q, {**(params or {}), 'ids': ids[i:i + self.batch_size]}, labels)
+            print(f"{name}: {min(i + self.batch_size, len(ids))}/{len(ids)}")
+        return len(ids)
+
+    def ingest_standard(self, chunk_size: int = 10000):
+        """
+        Parses the SDTM, SDTMIG and Terminology files once in Python, classifies the rows
+        (GOC/Special_Purpose_Variable, Variable, Codelist/Term) and writes them already labelled and with the
+        properties derived in reshape_model, reshape_sdtmig and reshape_terminology with batched UNWIND writes.
+        N.B. Unlike FileDataLoader.load_file no `Source Data Table`/`Source Data Column` nodes are created for the
+        standard files
+        :param chunk_size: Maximum number of rows written per query
+        :return: None
+        """
+        sdtm_rows = cdisc_standard_parser.read_standard_csv(self.standards_folder, self.sdtm_file)
+        gocs, special_purpose = cdisc_standard_parser.split_sdtm_rows(sdtm_rows)
+        sdtmig_rows = cdisc_standard_parser.read_standard_csv(self.standards_folder, self.sdtmig_file)
+        variables = cdisc_standard_parser.sdtmig_variable_rows(sdtmig_rows)
+        terminology_rows = cdisc_standard_parser.read_standard_csv(self.standards_folder, self.terminology_file)
+        codelists, terms = cdisc_standard_parser.split_terminology_rows(terminology_rows)
+
+        for label, rows in [
+            ("GOC", gocs),
+            ("Special_Purpose_Variable", special_purpose),
+            ("Variable", variables),
+            ("Codelist", codelists),
+            ("Term", terms),
+        ]:
+            if self.debug:
+                print(label, len(rows))
+            q = """
+            UNWIND $rows as row
+            CREATE (n:`<label>`)
+            SET n = row
+            """
+            for i in range(0, len(rows), chunk_size):
+                self.run_query("ingest_standard.create_nodes", q, {'rows': rows[i:i + chunk_size]},
+                               labels={'label': label})
+
+    def reshape_model(self, relabel: bool = True):
+        """
+        :param relabel: If False the SDTM Model rows are expected to be labelled already (see ingest_standard)
+        """
+        if relabel:
+            # Change label on general observation class variables
+            self.run_in_batches(
+                "reshape_model.relabel_goc",
+                match="""
+                MATCH (n:`<sdtm_file>`)
+                WHERE n.`Dataset Name` = ""
+                """,
+                update="""
+                REMOVE n:`<sdtm_file>`
+                SET    n:GOC
+                """,
+                labels={'sdtm_file': self.sdtm_file}
+            )
+
+            # Change label on special purpose class variables
+            self.run_in_batches(
+                "reshape_model.relabel_special_purpose",
+                match="""
+                MATCH (n:`<sdtm_file>`)
+                WHERE n.`Dataset Name` <> ""
+                """,
+                update="""
+                REMOVE n:`<sdtm_file>`
+                SET    n:Special_Purpose_Variable
+                """,
+                labels={'sdtm_file': self.sdtm_file}
+            )
+
+        # Create nodes for General Observation Classes
+        q = """
+        MATCH (n)
+        WHERE n:GOC OR n:Special_Purpose_Variable
+        WITH collect(distinct(n.Class)) as gocs
+        UNWIND gocs as goc
+        MERGE (d:ObservationClass {Class: toUpper(goc), label:goc})
+        RETURN count(d)
         """
-        self.query(q)
+        self.run_query("reshape_model.create_observation_classes", q)
 
         # Link General Observation Class to variables GOC-[CLASS_SPECIFIC_VARIABLE_GROUPING]-(VariableGrouping)
         # First create variable grouping node
@@ -107,7 +348,7 @@ class CdiscStandardLoader(ModelApplier):
         MERGE (oc)-[:CLASS_SPECIFIC_VARIABLE_GROUPING]->(vg)
         RETURN count(vg)
         """
-        self.query(q)
+        self.run_query("reshape_model.create_variable_groupings", q)
 
         # Link General Observation Class to variable grouping node
         q = """
@@ -117,36 +358,44 @@ class CdiscStandardLoader(ModelApplier):
         MERGE (v)-[:context]->(vg)
         return count(v)
         """
-        self.query(q)
+        self.run_query("reshape_model.link_goc_variable_groupings", q)
 
-    def reshape_sdtmig(self):
-        # Change label on domain variables
-        # Adaptions for load_link_sdtm_ttl
-        # - Add property Variable (Variable Name) (lls)
-        # Adaption for generate model
-        # - Add property Label (Variable Label)
-        q = f"""
-        MATCH (n:`{self.sdtmig_file}`)
-        REMOVE n:`{self.sdtmig_file}`
-        SET    n:Variable
-        SET    n.Variable = n.`Variable Name` 
-        SET    n.Label = n.`Variable Label` 
+    def reshape_sdtmig(self, relabel: bool = True):
         """
-        self.query(q)
+        :param relabel: If False the SDTMIG rows are expected to be labelled already and to have the derived
+        properties (see ingest_standard)
+        """
+        if relabel:
+            # Change label on domain variables
+            # Adaptions for load_link_sdtm_ttl
+            # - Add property Variable (Variable Name) (lls)
+            # Adaption for generate model
+            # - Add property Label (Variable Label)
+            self.run_in_batches(
+                "reshape_sdtmig.relabel_variables",
+                match="MATCH (n:`<sdtmig_file>`)",
+                update="""
+                REMOVE n:`<sdtmig_file>`
+                SET    n:Variable
+                SET    n.Variable = n.`Variable Name` 
+                SET    n.Label = n.`Variable Label` 
+                """,
+                labels={'sdtmig_file': self.sdtmig_file}
+            )
 
         # Add domains/dataset
         # Adaptions for load_link_sdtm_ttl
         # - Add label Dataset
-        q = f"""
+        q = """
         MATCH (n:Variable)
         WITH collect(distinct(n.`Dataset Name`)) as domains
         UNWIND domains as domain
-        MERGE (d:Domain:Dataset {{Domain: domain, Dataset: domain}})
+        MERGE (d:Domain:Dataset {Domain: domain, Dataset: domain})
         """
-        self.query(q)
+        self.run_query("reshape_sdtmig.create_domains", q)
 
         # Relate variables to domain and set class of domain
-        q = f"""
+        q = """
         MATCH (d:Domain)
         MATCH (v:Variable)
         WHERE d.Domain = v.`Dataset Name`
@@ -154,136 +403,292 @@ class CdiscStandardLoader(ModelApplier):
         SET d.Class = toUpper(v.Class)
         RETURN count(v)
         """
-        self.query(q)
+        self.run_query("reshape_sdtmig.link_domain_variables", q)
 
-        # Remove empty value list
-        q = """
-        MATCH (n:Variable)
-        WHERE n.`Value List` = ""
-        REMOVE n.`Value List`
-        RETURN count(n)
-        """
-        self.query(q)
+        if relabel:
+            # Remove empty value list
+            self.run_in_batches(
+                "reshape_sdtmig.remove_empty_value_list",
+                match="""
+                MATCH (n:Variable)
+                WHERE n.`Value List` = ""
+                """,
+                update="REMOVE n.`Value List`"
+            )
 
-        # Add property for codelist to variable
-        # Adapt for generate_excel_based_model
-        # - Add property Label (Variable Label)
-        q = """
-        MATCH (v:Variable)
-        WHERE v.`CDISC CT Codelist Code(s)` <> ""
-        SET v.`Codelist Code` = v.`CDISC CT Codelist Code(s)`
-        SET v.Label = v.`Variable Label`
-        RETURN count(v)
-        """
-        self.query(q)
+            # Add property for codelist to variable
+            # Adapt for generate_excel_based_model
+            # - Add property Label (Variable Label)
+            self.run_in_batches(
+                "reshape_sdtmig.set_codelist_code",
+                match="""
+                MATCH (n:Variable)
+                WHERE n.`CDISC CT Codelist Code(s)` <> ""
+                """,
+                update="""
+                SET n.`Codelist Code` = n.`CDISC CT Codelist Code(s)`
+                SET n.Label = n.`Variable Label`
+                """
+            )
 
-        # Add domain labels
-        # Adapt for generate_excel_based_model
-        # - Add property Description (Label)
-        for [domain, label] in self.DOMAIN_LABELS.items():
-            q = f"""
-            MATCH (d:Domain)
-            WHERE d.Domain = $domain
-            SET d.label = $label
-            SET d.Description = $label
-            RETURN d.label
-            """
-            if (self.debug == True):
-                print(domain, label)
-                print(q)
-            self.query(q, {'domain': domain, 'label': label})
+        self.set_domain_labels()
 
         # Link domains to General Observation Classes
-        q = f"""
+        q = """
         MATCH (d:Domain)
         MATCH (g:ObservationClass)
         WHERE g.Class = d.Class
         MERGE (g)-[:HAS_DATASET]->(d)
         RETURN count(d)
         """
-        self.query(q)
+        self.run_query("reshape_sdtmig.link_observation_class_domains", q)
 
-    def reshape_terminology(self):
-        # Change label on codelists
-        q = f"""
-        MATCH (n:`{self.terminology_file}`)
-        WHERE n.`Codelist Code` = ""
-        REMOVE n:`{self.terminology_file}`
-        SET    n:Codelist
+    def reshape_terminology(self, relabel: bool = True):
         """
-        self.query(q)
-
-        # Change label on codelist items
-        # Adapt for generate_excel_based_model
-        # - Add property Term (CDISC Submission Value)
-        # - Add property `NCI Codelist Code` (Codelist Code)
-        # - Add property `NCI Term Code` (Code)
-        q = f"""
-        MATCH (n:`{self.terminology_file}`)
-        WHERE n.`Codelist Code` <> ""
-        REMOVE n:`{self.terminology_file}`
-        SET    n:Term
-        SET    n.Term = n.`CDISC Submission Value`
-        SET    n.`NCI Codelist Code` = n.`Codelist Code`
-        SET    n.`NCI Term Code` = n.Code
+        :param relabel: If False the Terminology rows are expected to be labelled already and to have the derived
+        properties (see ingest_standard)
         """
-        self.query(q)
+        if relabel:
+            # Change label on codelists
+            self.run_in_batches(
+                "reshape_terminology.relabel_codelists",
+                match="""
+                MATCH (n:`<terminology_file>`)
+                WHERE n.`Codelist Code` = ""
+                """,
+                update="""
+                REMOVE n:`<terminology_file>`
+                SET    n:Codelist
+                """,
+                labels={'terminology_file': self.terminology_file}
+            )
+
+            # Change label on codelist items
+            # Adapt for generate_excel_based_model
+            # - Add property Term (CDISC Submission Value)
+            # - Add property `NCI Codelist Code` (Codelist Code)
+            # - Add property `NCI Term Code` (Code)
+            self.run_in_batches(
+                "reshape_terminology.relabel_terms",
+                match="""
+                MATCH (n:`<terminology_file>`)
+                WHERE n.`Codelist Code` <> ""
+                """,
+                update="""
+                REMOVE n:`<terminology_file>`
+                SET    n:Term
+                SET    n.Term = n.`CDISC Submission Value`
+                SET    n.`NCI Codelist Code` = n.`Codelist Code`
+                SET    n.`NCI Term Code` = n.Code
+                """,
+                labels={'terminology_file': self.terminology_file}
+            )
 
         # Link codelist item to codelist
-        q = f"""
+        self.run_in_batches(
+            "reshape_terminology.link_codelist_terms",
+            match="MATCH (n:Term)",
+            update="""
+            MATCH (c:Codelist)
+            WHERE n.`Codelist Code` = c.Code
+            MERGE (c)-[:HAS_TERM]->(n)
+            """
+        )
+
+    def load_terminology_delta(self, terminology_file: str, extract_terms: bool = True, chunk_size: int = 10000):
+        """
+        Loads a new release of the SDTM Terminology incrementally instead of with clean_slate and load_standard:
+        the new file is compared with the loaded Codelist and Term nodes by (`Codelist Code`, Code) (see
+        cdisc_standard_parser.diff_terminology) and only the differences are written:
+         - new codelists/terms are created
+         - changed properties are updated
+         - codelists/terms no longer in the file are retired: relabelled `Retired Codelist`/`Retired Term`
+           (with property `Retired By` = terminology_file) and unlinked from codelists and variables
+        HAS_TERM, HAS_CODELIST and HAS_CONTROLLED_TERM are then relinked only for the affected codelists and terms
+        (HAS_CONTROLLED_TERM only for the `Value List` terms if codelist_only).
+        Only the standard is updated: the Classes of the model (see CdiscModelManager.generate_excel_based_model)
+        keep their HAS_CODELIST/HAS_CONTROLLED_TERM relationships and the Term labels of the previous release -
+        the model has to be regenerated afterwards.
+        The terminology_file of the loader is not changed (the one of the saved fingerprint is - so that the next
+        load_standard reloads the terminology_file of the loader).
+        :param terminology_file: Name of the new terminology file (in the standards folder)
+        :param extract_terms: As in link_cdisc - if True, new terms get the property `Term Code`
+        :param chunk_size: Maximum number of rows written per query
+        :return: dictionary with the number of inserted, updated and retired nodes and of the affected codelists
+        """
+        assert os.path.exists(os.path.join(self.standards_folder, terminology_file))
+        print("Loading terminology delta:", terminology_file)
+        codelists, terms = cdisc_standard_parser.split_terminology_rows(
+            cdisc_standard_parser.read_standard_csv(self.standards_folder, terminology_file)
+        )
+        if extract_terms:
+            for term in terms:
+                term['Term Code'] = term['Code']
+        rows = [{'label': 'Codelist', 'props': row} for row in codelists] + \
+               [{'label': 'Term', 'props': row} for row in terms]
+
+        q = """
+        MATCH (n)
+        WHERE n:Codelist OR n:Term
+        RETURN id(n) as id, CASE WHEN n:Term THEN 'Term' ELSE 'Codelist' END as label, n{.*} as props
+        """
+        loaded = self.run_query("load_terminology_delta.get_loaded", q)
+        inserts, updates, retirements = cdisc_standard_parser.diff_terminology(loaded, rows)
+        updated_ids = {update['id'] for update in updates}
+        updated = [node for node in loaded if node['id'] in updated_ids]
+        affected_codelists = sorted({
+            row['props'].get('Code') if row['label'] == 'Codelist' else row['props'].get('Codelist Code')
+            for row in inserts + updated + retirements
+        })
+        print(f"Inserts: {len(inserts)}, updates: {len(updates)}, retirements: {len(retirements)}, "
+              f"affected codelists: {len(affected_codelists)}")
+
+        # Retiring codelists and terms (the links from the Classes of the model are kept until it is regenerated)
+        q = """
+        UNWIND $ids as id
+        MATCH (n)
+        WHERE id(n) = id
+        OPTIONAL MATCH (n)-[r:HAS_TERM]-()
+        DELETE r
+        WITH DISTINCT n
+        OPTIONAL MATCH (n)<-[r:HAS_CODELIST|HAS_CONTROLLED_TERM]-(:Variable)
+        DELETE r
+        WITH DISTINCT n
+        REMOVE n:`<label>`
+        SET n:`<retired_label>`, n.`Retired By` = $terminology_file
+        """
+        for label in ['Codelist', 'Term']:
+            ids = [node['id'] for node in retirements if node['label'] == label]
+            for i in range(0, len(ids), chunk_size):
+                self.run_query("load_terminology_delta.retire", q,
+                               {'ids': ids[i:i + chunk_size], 'terminology_file': terminology_file},
+                               labels={'label': label, 'retired_label': f"Retired {label}"})
+
+        # Updating changed properties (and removing the links to variables of updated terms - relinked below)
+        q = """
+        UNWIND $updates as row
+        MATCH (n)
+        WHERE id(n) = row.id
+        SET n += row.props
+        WITH n
+        OPTIONAL MATCH (n)<-[r:HAS_CONTROLLED_TERM]-(:Variable)
+        DELETE r
+        """
+        for i in range(0, len(updates), chunk_size):
+            self.run_query("load_terminology_delta.update", q, {'updates': updates[i:i + chunk_size]})
+
+        # Creating new codelists and terms
+        q = """
+        UNWIND $rows as row
+        CREATE (n:`<label>`)
+        SET n = row
+        """
+        for label in ['Codelist', 'Term']:
+            new_rows = [row['props'] for row in inserts if row['label'] == label]
+            for i in range(0, len(new_rows), chunk_size):
+                self.run_query("load_terminology_delta.insert", q, {'rows': new_rows[i:i + chunk_size]},
+                               labels={'label': label})
+
+        # Relinking the affected codelists (as reshape_terminology and link_cdisc do)
+        q = """
+        UNWIND $codes as code
         MATCH (c:Codelist)
+        WHERE c.Code = code
         MATCH (t:Term)
-        WHERE t.`Codelist Code` = c.Code
+        WHERE t.`Codelist Code` = code
         MERGE (c)-[:HAS_TERM]->(t)
         RETURN count(t)
         """
-        self.query(q)
-
-    def link_cdisc(self, extract_terms: bool = True, extract_vld: bool = True):
-        print("Linking CDISC content")
-        for [domain, sort_order] in self.DOMAIN_SORT_ORDER.items():
-            # hardcode adding --SEQ into the 'Sort Order'
-            if (self.debug == True):
-                print(domain, sort_order)
-            q = f"""
-            MATCH (n:Domain)-[:HAS_VARIABLE]->(v:Variable)
-            WHERE v.`Variable Name` ends with "SEQ" AND n.Domain = "{domain}"
-            WITH  n, v.`Variable Name` as seq
-            SET n.`Sort Order` = CASE WHEN seq in apoc.text.split("{sort_order}", ",") THEN "{sort_order}" ELSE "{sort_order}" + "," + seq END
-            RETURN n["Sort Order"]
+        self.run_query("load_terminology_delta.link_codelist_terms", q, {'codes': affected_codelists})
+        if self.codelist_only:
+            q = """
+            UNWIND $codes as code
+            MATCH (v:Variable)
+            WHERE v.`Codelist Code` = code
+            MATCH (c:Codelist)
+            WHERE c.Code = code
+            MERGE (v)-[:HAS_CODELIST]->(c)
+            RETURN COUNT(v)
             """
-            self.query(q)
-
-            # Variables need to have a property Order = sort order
-            variables = sort_order.split(",")
-            # Add --SEQ if not mentioned.
-            add_seq = [var for var in variables if re.findall('SEQ', var.upper())]
-            # N.B! Only to applicable to domains that can have --SEQ variable. Not trial design DM and SV.
-            if not add_seq and not domain in ['DM', 'SV', 'TA', 'TE', 'TV', 'TS', 'TI']:
-                variables.append(domain+'SEQ')
-
-            for i, var in enumerate(variables, start=1):
-                q = f"""
-                MATCH (v:Variable)
-                WHERE v.`Dataset Name` = '{domain}' AND v.`Variable Name` = '{var}'
-                SET v.Order = {i}
-                RETURN v.Order
-                """
-                self.query(q)
+            self.run_query("load_terminology_delta.link_codelists_only", q, {'codes': affected_codelists})
+        else:
+            q = """
+            UNWIND $codes as code
+            MATCH (v:Variable)
+            WHERE v.`Codelist Code` = code
+            MATCH (c:Codelist)
+            WHERE c.Code = code
+            MERGE (v)-[:HAS_CODELIST]->(c)
+            WITH *
+            MATCH (c)-[:HAS_TERM]->(t:Term)
+            MERGE (v)-[:HAS_CONTROLLED_TERM]->(t)
+            RETURN COUNT(v)
+            """
+            self.run_query("load_terminology_delta.link_codelists", q, {'codes': affected_codelists})
 
-        # Add relationship to Codelist for variable
-        # CREATE (v:Variable)-[:HAS_CONTROLLED_TERM]->(t:Term) Info on exact terms does not exist
+        # Relinking the value lists to the new and updated terms
         q = """
+        UNWIND $values as value
         MATCH (v:Variable)
-        MATCH (c:Codelist)
-        WHERE v.`Codelist Code` = c.Code
-        MERGE (v)-[:HAS_CODELIST]->(c)
-        WITH *
-        MATCH (c)-[:HAS_TERM]->(t:Term)
+        WHERE v.`Value List` = value OR (v.`Value List` contains ";" AND value IN apoc.text.split(v.`Value List`, "; "))
+        MATCH (t:Term)
+        WHERE t.`CDISC Submission Value` = value
         MERGE (v)-[:HAS_CONTROLLED_TERM]->(t)
-        RETURN COUNT(v)
+        RETURN count(t)
+        """
+        values = {row['props'].get('CDISC Submission Value') for row in inserts + updated if row['label'] == 'Term'}
+        values |= {update['props'].get('CDISC Submission Value') for update in updates}
+        self.run_query("load_terminology_delta.link_value_list_terms", q, {'values': sorted(v for v in values if v)})
+
+        q = """
+        MATCH (f:`Standard Load Fingerprint`)
+        SET f.terminology_file = $terminology_file, f.terminology_sha256 = $terminology_sha256
         """
-        self.query(q)
+        self.run_query("load_terminology_delta.update_fingerprint", q, {
+            'terminology_file': terminology_file,
+            'terminology_sha256': cdisc_standard_parser.file_sha256(
+                os.path.join(self.standards_folder, terminology_file)),
+        })
+        print("Terminology delta loaded")
+        return {'inserted': len(inserts), 'updated': len(updates), 'retired': len(retirements),
+                'codelists': len(affected_codelists)}
+
+    def link_cdisc(self, extract_terms: bool = True, extract_vld: bool = True):
+        print("Linking CDISC content")
+        self.set_domain_sort_order()
+
+        # Add relationship to Codelist for variable
+        # CREATE (v:Variable)-[:HAS_CONTROLLED_TERM]->(t:Term) Info on exact terms does not exist
+        if self.codelist_only:
+            # No fan-out to the Terms of the Codelist (resolved on demand - see controlled_terms.py)
+            self.run_in_batches(
+                "link_cdisc.link_codelists_only",
+                match="""
+                MATCH (n:Variable)
+                WHERE n.`Codelist Code` IS NOT NULL
+                """,
+                update="""
+                MATCH (c:Codelist)
+                WHERE n.`Codelist Code` = c.Code
+                MERGE (n)-[:HAS_CODELIST]->(c)
+                """
+            )
+        else:
+            self.run_in_batches(
+                "link_cdisc.link_codelists",
+                match="""
+                MATCH (n:Variable)
+                WHERE n.`Codelist Code` IS NOT NULL
+                """,
+                update="""
+                MATCH (c:Codelist)
+                WHERE n.`Codelist Code` = c.Code
+                MERGE (n)-[:HAS_CODELIST]->(c)
+                WITH *
+                MATCH (c)-[:HAS_TERM]->(t:Term)
+                MERGE (n)-[:HAS_CONTROLLED_TERM]->(t)
+                """
+            )
 
         # Add relationship to terms for variable
         # TODO: This might not be needed. Adds variable.`Value List` relationship to terms
@@ -298,7 +703,7 @@ class CdiscStandardLoader(ModelApplier):
         MERGE (v)-[:HAS_CONTROLLED_TERM]->(t)
         RETURN count(v), count(t)
         """
-        self.query(q)
+        self.run_query("link_cdisc.link_value_list_terms", q)
         # 2. Add for when VALUE LIST is just a singe term
         # NB: The only values in SDTMIG 3.2 are domain codes (e.g. DM, AE etc.) and they do not exist in CT downloaded from CDISC Library
         #     So this statement has no effect at all at the moment.
@@ -310,15 +715,15 @@ class CdiscStandardLoader(ModelApplier):
         MERGE (v)-[:HAS_CONTROLLED_TERM]->(t)
         RETURN v, t
         """
-        self.query(q)
+        self.run_query("link_cdisc.link_value_list_term", q)
 
         if extract_terms:
             # SET t.`Codelist Code` = t.Code # Codelist Code is already assigned earlier
-            q = """
-            MATCH (t:Term)       
-            SET t.`Term Code` = t.Code
-            """
-            self.query(q)
+            self.run_in_batches(
+                "link_cdisc.set_term_code",
+                match="MATCH (n:Term)",
+                update="SET n.`Term Code` = n.Code"
+            )
 
             # TODO: No Term is linked to Variable (HAS_CONTROLLED_TERM), so this will not do anything
             # # #merging duplicate Terms together
@@ -354,23 +759,147 @@ class CdiscStandardLoader(ModelApplier):
 
         print("CDISC Data Link Complete")
 
-    def load_link_sdtm_ttl(self, local=True):
-        self.rdf_config()
-        if local:
+    def set_domain_labels(self, reset: bool = False):
+        """
+        Sets Domain.label and Domain.Description for all domains of DOMAIN_LABELS in one batched query
+        :param reset: If True the label and Description of all the domains are removed first (so that the domains
+        no longer in DOMAIN_LABELS are as after a full load)
+        :return: None
+        """
+        # Add domain labels
+        # Adapt for generate_excel_based_model
+        # - Add property Description (Label)
+        domain_labels = [{'domain': domain, 'label': label} for domain, label in self.DOMAIN_LABELS.items()]
+        if (self.debug == True):
+            print(domain_labels)
+        if reset:
+            q = """
+            MATCH (d:Domain)
+            REMOVE d.label, d.Description
+            """
+            self.run_query("set_domain_labels.reset", q)
+        q = """
+        UNWIND $domain_labels as row
+        MATCH (d:Domain)
+        WHERE d.Domain = row.domain
+        SET d.label = row.label
+        SET d.Description = row.label
+        RETURN d.label
+        """
+        self.run_query("set_domain_labels.domains", q, {'domain_labels': domain_labels})
+
+    def set_domain_sort_order(self, reset: bool = False):
+        """
+        Sets Domain.`Sort Order` (with --SEQ added to the sort order when the domain has a --SEQ variable)
+        and Variable.Order for all domains of DOMAIN_SORT_ORDER in 2 batched queries
+        :param reset: If True the `Sort Order` of all the domains and the Order of all the variables are removed
+        first (so that the domains and variables no longer in DOMAIN_SORT_ORDER are as after a full load)
+        :return: None
+        """
+        domains, variables = cdisc_standard_parser.resolve_domain_sort_order(self.DOMAIN_SORT_ORDER)
+        if self.debug:
+            print(domains)
+        if reset:
+            q = """
+            MATCH (n:Domain)
+            REMOVE n.`Sort Order`
+            """
+            self.run_query("set_domain_sort_order.reset_domains", q)
+            q = """
+            MATCH (v:Variable)
+            WHERE v.Order IS NOT NULL
+            REMOVE v.Order
+            """
+            self.run_query("set_domain_sort_order.reset_variables", q)
+        q = """
+        UNWIND $domains as row
+        MATCH (n:Domain)-[:HAS_VARIABLE]->(v:Variable)
+        WHERE n.Domain = row.domain AND v.`Variable Name` ends with "SEQ"
+        WITH n, row, v.`Variable Name` as seq
+        SET n.`Sort Order` = CASE WHEN seq in split(row.sort_order, ",") THEN row.sort_order ELSE row.sort_order + "," + seq END
+        RETURN count(n)
+        """
+        self.run_query("set_domain_sort_order.domains", q, {'domains': domains})
+
+        # Variables need to have a property Order = sort order
+        q = """
+        UNWIND $variables as row
+        MATCH (v:Variable)
+        WHERE v.`Dataset Name` = row.domain AND v.`Variable Name` = row.variable
+        SET v.Order = row.order
+        RETURN count(v)
+        """
+        self.run_query("set_domain_sort_order.variables", q, {'variables': variables})
+
+    def import_ttl(self, filename: str = 'sdtm-1-3.ttl', cache_folder: str = None, chunk_size: int = 10000):
+        """
+        Imports a Turtle file of the standards folder without n10s and without network access: the file is parsed
+        locally (see ttl_parser.load_ttl_graph - the parsed graph is cached by file hash) and the resulting
+        Resource nodes and relationships are written with batched UNWIND queries.
+        The nodes and relationships are the same as the ones created by rdf_import_subgraph_inline with
+        handleVocabUris: 'IGNORE'
+        :param filename: Name of the Turtle file
+        :param cache_folder: Directory of the parsed graph cache (default: .ttl_cache in the standards folder)
+        :param chunk_size: Maximum number of nodes/relationships written per query
+        :return: dictionary with the number of nodes and relationships imported
+        """
+        if cache_folder is None:
+            cache_folder = os.path.join(self.standards_folder, '.ttl_cache')
+        graph = ttl_parser.load_ttl_graph(os.path.join(self.standards_folder, filename), cache_folder)
+
+        q = """
+        UNWIND $nodes as row
+        MERGE (n:Resource {uri: row.uri})
+        SET n += row.props
+        WITH n, row
+        CALL apoc.create.addLabels(n, row.labels) YIELD node
+        RETURN count(node)
+        """
+        for i in range(0, len(graph['nodes']), chunk_size):
+            self.run_query("import_ttl.merge_resources", q, {'nodes': graph['nodes'][i:i + chunk_size]})
+
+        q = """
+        UNWIND $rels as row
+        MATCH (a:Resource {uri: row[0]}), (b:Resource {uri: row[2]})
+        CALL apoc.merge.relationship(a, row[1], {}, {}, b, {}) YIELD rel
+        RETURN count(rel)
+        """
+        for i in range(0, len(graph['rels']), chunk_size):
+            self.run_query("import_ttl.merge_relationships", q, {'rels': graph['rels'][i:i + chunk_size]})
+
+        return {'nodes': len(graph['nodes']), 'relationships': len(graph['rels'])}
+
+    def load_link_sdtm_ttl(self, local=True, bulk=False):
+        """
+        :param local: If True the bundled sdtm-1-3.ttl is imported inline with n10s, otherwise it is fetched from
+        the phuse-org/rdf.cdisc.org GitHub repository
+        :param bulk: If True the bundled sdtm-1-3.ttl is parsed locally and bulk written (see import_ttl) -
+        neither n10s nor network access are needed; local is then ignored
+        """
+        if bulk:
+            print(self.import_ttl(self.TTL_FILE))
+        elif local:
+            with self.profile_call("load_link_sdtm_ttl.rdf_config"):
+                self.rdf_config()
             with open(os.path.join(self.standards_folder, 'sdtm-1-3.ttl')) as f:
                 rdf = f.read()
+            with self.profile_call("load_link_sdtm_ttl.rdf_import_subgraph_inline"):
                 print(
                     self.rdf_import_subgraph_inline(rdf, "Turtle")
                 )
         else:
-            print(
-                self.rdf_import_fetch(
-                    "https://raw.githubusercontent.com/phuse-org/rdf.cdisc.org/master/std/sdtm-1-3.ttl",
-                    "Turtle"
+            with self.profile_call("load_link_sdtm_ttl.rdf_config"):
+                self.rdf_config()
+            with self.profile_call("load_link_sdtm_ttl.rdf_import_fetch"):
+                print(
+                    self.rdf_import_fetch(
+                        "https://raw.githubusercontent.com/phuse-org/rdf.cdisc.org/master/std/sdtm-1-3.ttl",
+                        "Turtle"
+                    )
                 )
-            )
 
-        self.create_index(label="DataElement", key="dataElementName")
+        with self.profile_call("load_link_sdtm_ttl.create_index"):
+            self.create_index(label="DataElement", key="dataElementName")
 
         # linking ObservationClass to VariableGrouping (only class specific)
         q = """
@@ -383,17 +912,28 @@ class CdiscStandardLoader(ModelApplier):
             END
         MERGE (oc)-[:CLASS_SPECIFIC_VARIABLE_GROUPING]->(vg)
         """
-        self.query(q)
+        self.run_query("load_link_sdtm_ttl.link_observation_class_variable_groupings", q)
 
         # adding properties dataElementName
+        # (Variables are matched to DataElement names in Python - see cdisc_standard_parser.match_data_elements)
+        q = """
+        MATCH (de:DataElement)
+        RETURN de.dataElementName as name, de.dataElementLabel as label
+        """
+        data_elements = self.run_query("load_link_sdtm_ttl.get_data_elements", q)
+        q = """
+        MATCH (v:Variable)
+        RETURN id(v) as id, v.Variable as variable, v.`Dataset Name` as dataset
+        """
+        variables = self.run_query("load_link_sdtm_ttl.get_variables", q)
+        matches = cdisc_standard_parser.match_data_elements(variables, data_elements)
         q = """ 
-        MATCH (v:Variable), (de:DataElement)
-        WHERE v.Variable =~ apoc.text.replace(de.dataElementName, '-', '.')
-           AND NOT (v.Variable STARTS WITH 'RF' and v.Dataset = 'DM')
-        WITH DISTINCT v, de.dataElementName as dataElementName, de.dataElementLabel as dataElementLabel
-        SET v.dataElementName = dataElementName, v.dataElementLabel = dataElementLabel 
+        UNWIND $matches as row
+        MATCH (v:Variable)
+        WHERE id(v) = row.id
+        SET v.dataElementName = row.dataElementName, v.dataElementLabel = row.dataElementLabel
         """
-        self.query(q)
+        self.run_query("load_link_sdtm_ttl.set_data_element_name", q, {'matches': matches})
 
         # linking Variable to DataElements (on dataElementName there might be >1 DataElement per Variable -
         # need to filter on VariableGrouping~ObservationClass)
@@ -407,7 +947,7 @@ class CdiscStandardLoader(ModelApplier):
         UNWIND coll as da
         MERGE (v)-[:IS_DATA_ELEMENT]->(da)
         """
-        self.query(q)
+        self.run_query("load_link_sdtm_ttl.link_unique_data_elements", q)
 
         # 2 else
         q = """
@@ -416,61 +956,74 @@ class CdiscStandardLoader(ModelApplier):
         WHERE NOT EXISTS ((v)-[:IS_DATA_ELEMENT]->()) AND da.dataElementName = v.dataElementName        
         MERGE (v)-[:IS_DATA_ELEMENT]->(da)               
         """
-        self.query(q)
+        self.run_query("load_link_sdtm_ttl.link_class_specific_data_elements", q)
+
+        self.compute_statistics()
 
-        # saveing counts of data elements with the same name
+        print("SDTM TTL Loaded and Linked")
+
+    def compute_statistics(self):
+        """
+        Sets in one pass per label the metadata statistics used by generate_excel_based_model:
+        DataElement vg, vg_short and n_with_same_name and Variable n_with_same_label and n_with_same_name.
+        The counts are computed in Python (see cdisc_standard_parser.metadata_statistics) and written back in
+        batches of batch_size
+        :return: None
+        """
         q = """
         MATCH (da:DataElement)
-        OPTIONAL MATCH (da:DataElement)-[:context]->(vg:VariableGrouping)
-        WITH *, 
-        {
-          `Interventions Observation Class Variables`: "Interventions",
-          `General Observation Class Timing Variables`: "GO Timing",
-          `Findings Observation Class Variables`: "Findings",
-          `General Observation Class Identifier Variables`: "GO Identifier",
-          `Event Observation Class Variables`: "Events",
-          `Findings About Events or Interventions Variables`: "FA"
-        } as vg_mapping 
-        SET da.vg = vg.contextLabel                
-        SET da.vg_short = vg_mapping[vg.contextLabel]
-        WITH DISTINCT da.dataElementName as name, collect(da) as coll
-        WITH *, size(coll) as sz
-        UNWIND coll as da
-        SET da.n_with_same_name = sz 
+        OPTIONAL MATCH (da)-[:context]->(vg:VariableGrouping)
+        RETURN id(da) as id, da.dataElementName as name, vg.contextLabel as vg
         """
-        self.query(q)
-
-        # saveing counts of variables with the same label
+        data_elements = self.run_query("compute_statistics.get_data_elements", q)
         q = """
         MATCH (v:Variable)
-        WITH v.Label as lbl, collect(v) as coll
-        WITH *, size(coll) as sz
-        UNWIND coll as v
-        SET v.n_with_same_label = sz
+        RETURN id(v) as id, v.Label as label, v.Variable as name
         """
-        self.query(q)
+        variables = self.run_query("compute_statistics.get_variables", q)
+        de_rows, variable_rows = cdisc_standard_parser.metadata_statistics(data_elements, variables)
 
-        # saveing counts of variables with the same name
+        # saveing variable grouping and counts of data elements with the same name
         q = """
-        MATCH (v:Variable)
-        WITH v.Variable as name, collect(v) as coll
-        WITH *, size(coll) as sz
-        UNWIND coll as v
-        SET v.n_with_same_name = sz
+        UNWIND $rows as row
+        MATCH (da:DataElement)
+        WHERE id(da) = row.id
+        SET da.vg = row.vg, da.vg_short = row.vg_short, da.n_with_same_name = row.n_with_same_name
         """
-        self.query(q)
+        for i in range(0, len(de_rows), self.batch_size):
+            self.run_query("compute_statistics.set_data_element_statistics", q,
+                           {'rows': de_rows[i:i + self.batch_size]})
 
-        print("SDTM TTL Loaded and Linked")
+        # saveing counts of variables with the same label and with the same name
+        q = """
+        UNWIND $rows as row
+        MATCH (v:Variable)
+        WHERE id(v) = row.id
+        SET v.n_with_same_label = row.n_with_same_label, v.n_with_same_name = row.n_with_same_name
+        """
+        for i in range(0, len(variable_rows), self.batch_size):
+            self.run_query("compute_statistics.set_variable_statistics", q,
+                           {'rows': variable_rows[i:i + self.batch_size]})
 
-    def propagate_relationships(self, on_children=True, on_parents=True):  # not used kept for code reference
+    def propagate_relationships(self, on_children=True, on_parents=True, refresh_closure=True):  # not used kept for code reference
+        """
+        Copies the Relationships of the SUBCLASS_OF ancestors/descendants of each Class onto the Class.
+        The hierarchy is traversed in a single hop through the SUBCLASS_OF_CLOSURE relationships
+        (see class_hierarchy.SubclassClosureMixin) - with on_children and on_parents both the ancestors and the
+        descendants of the Class are used
+        :param refresh_closure: Whether to recompute the SUBCLASS_OF_CLOSURE relationships first
+        """
+        if refresh_closure:
+            self.refresh_subclass_closure()
         la = ('' if (on_children and on_parents) or not on_children else '<')
         ra = ('' if (on_children and on_parents) or not on_parents else '>')
+        direction = {'': 'both', '<': 'on_children', '>': 'on_parents'}[la + ra]
         q = f"""
         //propagate_relationships_of_parents_on_children
         MATCH (c:Class)
-        OPTIONAL MATCH path = (c){la}-[:SUBCLASS_OF*1..50]-{ra}(parent)<-[r1:FROM]-(r:Relationship)-[r2:TO]->(fromto)
+        OPTIONAL MATCH path = (c){la}-[:SUBCLASS_OF_CLOSURE]-{ra}(parent)<-[r1:FROM]-(r:Relationship)-[r2:TO]->(fromto)
         WITH c, collect(path) as coll
-        OPTIONAL MATCH path = (c){la}-[:SUBCLASS_OF*1..50]-{ra}(parent)<-[r1:TO]-(r:Relationship)-[r2:FROM]->(fromto)
+        OPTIONAL MATCH path = (c){la}-[:SUBCLASS_OF_CLOSURE]-{ra}(parent)<-[r1:TO]-(r:Relationship)-[r2:FROM]->(fromto)
         WITH c, coll + collect(path) as coll
         UNWIND coll as path
         WITH 
@@ -496,4 +1049,4 @@ class CdiscStandardLoader(ModelApplier):
         ) YIELD value
         RETURN value 
         """
-        self.query(q)
+        self.run_query(f"propagate_relationships.{direction}", q)
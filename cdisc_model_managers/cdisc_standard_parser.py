@@ -0,0 +1,262 @@
+import os
+import re
+import hashlib
+from collections import Counter
+import pandas as pd
+
+# Version of the loading logic - bump it when a change of the loader requires the standard to be reloaded
+# (saved in the fingerprint by CdiscStandardLoader and ModelBuilder)
+LOADER_VERSION = 1
+
+
+def read_standard_csv(folder: str, filename: str) -> list:
+    """
+    Reads a csv file downloaded from the CDISC Library the same way FileDataLoader.read_file does
+    (quoted values, missing strings replaced with '') and returns its rows as a list of dictionaries.
+    The provenance properties _domain_, _filename_ and _folder_ are added to each row as FileDataLoader.load_file does
+    and NaN values of numeric columns are dropped (as NeoInterface.load_df does with ignore_nan=True)
+    :param folder: Directory where the file is stored
+    :param filename: Name of the csv file
+    :return: list of dictionaries - one per row of the file
+    """
+    df = pd.read_csv(os.path.join(folder, filename), quotechar='"')
+    col_obj = [col for col in df.columns if pd.api.types.is_string_dtype(df[col])]
+    df[col_obj] = df[col_obj].fillna(value='')
+    domain = ".".join(filename.split(".")[:-1]).upper()
+    rows = []
+    for record in df.to_dict(orient='records'):
+        row = {key: value for key, value in record.items() if not (isinstance(value, float) and pd.isna(value))}
+        row.update({'_domain_': domain, '_filename_': filename, '_folder_': folder})
+        rows.append(row)
+    return rows
+
+
+def file_sha256(path: str) -> str:
+    """
+    :param path: path of a file
+    :return: sha256 hex digest of the content of the file
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def input_fingerprint(standards_folder: str, files: dict, **options) -> dict:
+    """
+    Fingerprint of the inputs of CdiscStandardLoader.load_standard (and of ModelBuilder.build)
+    :param standards_folder: Directory where the files are stored
+    :param files: dictionary with a key and the name of each input file
+    :param options: load options (and version of the loading logic)
+    :return: dictionary with the options and the name ({key}_file) and sha256 hash ({key}_sha256) of each file
+    """
+    fingerprint = dict(options)
+    for key, file in files.items():
+        fingerprint[f"{key}_file"] = file
+        fingerprint[f"{key}_sha256"] = file_sha256(os.path.join(standards_folder, file))
+    return fingerprint
+
+
+def split_sdtm_rows(rows: list) -> (list, list):
+    """
+    Splits the rows of the SDTM Model file into General Observation Class variables (no `Dataset Name`)
+    and Special Purpose variables
+    :return: list of GOC rows, list of Special_Purpose_Variable rows
+    """
+    gocs = [row for row in rows if row.get('Dataset Name') == ""]
+    special_purpose = [row for row in rows if row.get('Dataset Name') != ""]
+    return gocs, special_purpose
+
+
+def sdtmig_variable_rows(rows: list) -> list:
+    """
+    Adds to the rows of the SDTMIG file the properties derived in CdiscStandardLoader.reshape_sdtmig:
+    Variable (Variable Name), Label (Variable Label) and `Codelist Code` (CDISC CT Codelist Code(s));
+    empty `Value List` values are removed
+    :return: list of Variable rows
+    """
+    variables = []
+    for row in rows:
+        row = dict(row)
+        row['Variable'] = row.get('Variable Name')
+        row['Label'] = row.get('Variable Label')
+        if row.get('Value List') == "":
+            del row['Value List']
+        if row.get('CDISC CT Codelist Code(s)', "") != "":
+            row['Codelist Code'] = row['CDISC CT Codelist Code(s)']
+        variables.append(row)
+    return variables
+
+
+def split_terminology_rows(rows: list) -> (list, list):
+    """
+    Splits the rows of the SDTM Terminology file into Codelists (no `Codelist Code`) and Terms.
+    Terms get the properties derived in CdiscStandardLoader.reshape_terminology:
+    Term (CDISC Submission Value), `NCI Codelist Code` (Codelist Code) and `NCI Term Code` (Code)
+    :return: list of Codelist rows, list of Term rows
+    """
+    codelists, terms = [], []
+    for row in rows:
+        if row.get('Codelist Code') == "":
+            codelists.append(row)
+        else:
+            row = dict(row)
+            row['Term'] = row.get('CDISC Submission Value')
+            row['NCI Codelist Code'] = row.get('Codelist Code')
+            row['NCI Term Code'] = row.get('Code')
+            terms.append(row)
+    return codelists, terms
+
+
+# Domains that cannot have a --SEQ variable (trial design domains, DM and SV)
+DOMAINS_WITHOUT_SEQ = ['DM', 'SV', 'TA', 'TE', 'TV', 'TS', 'TI']
+
+
+def resolve_domain_sort_order(domain_sort_order: dict) -> (list, list):
+    """
+    Resolves the domain sort order map (see sdtmig3_2_domain_sort_order.json) into parameter lists for
+    CdiscStandardLoader.set_domain_sort_order.
+    Variables get Order = position in the sort order; --SEQ is appended when not mentioned
+    (only for domains that can have a --SEQ variable)
+    :param domain_sort_order: dictionary with domain as key and comma separated sort order variables as value
+    :return: list of {'domain', 'sort_order'} and list of {'domain', 'variable', 'order'}
+    """
+    domains, variables = [], []
+    for domain, sort_order in domain_sort_order.items():
+        domains.append({'domain': domain, 'sort_order': sort_order})
+        domain_variables = sort_order.split(",")
+        # Add --SEQ if not mentioned.
+        add_seq = [var for var in domain_variables if 'SEQ' in var.upper()]
+        if not add_seq and domain not in DOMAINS_WITHOUT_SEQ:
+            domain_variables.append(domain + 'SEQ')
+        for i, var in enumerate(domain_variables, start=1):
+            variables.append({'domain': domain, 'variable': var, 'order': i})
+    return domains, variables
+
+
+def match_data_elements(variables: list, data_elements: list) -> list:
+    """
+    Matches Variables to the SDTM DataElements (sdtm-1-3.ttl) they implement, as the regex
+    `Variable =~ dataElementName with '-' replaced by '.'` does, using an index instead of testing each pair:
+    DataElement names without '-' are matched exactly and `--XXX` names through a suffix map (any two character
+    domain prefix followed by XXX). RF* variables of DM are excluded.
+    :param variables: list of {'id', 'variable', 'dataset'} (dataset: `Dataset Name` of the Variable)
+    :param data_elements: list of {'name', 'label'}
+    :return: list of {'id', 'dataElementName', 'dataElementLabel'} - one per matched Variable
+    """
+    exact, suffixes, patterns = {}, {}, []
+    for de in data_elements:
+        name = de['name']
+        if name is None:
+            continue
+        if '-' not in name:
+            exact.setdefault(name, []).append(de)
+        elif name.startswith('--') and '-' not in name[2:]:
+            suffixes.setdefault(name[2:], []).append(de)
+        else:
+            patterns.append((re.compile('.'.join(re.escape(part) for part in name.split('-'))), de))
+    matches = []
+    for v in variables:
+        name = v['variable']
+        if name is None or (name.startswith('RF') and v.get('dataset') == 'DM'):
+            continue
+        candidates = exact.get(name, []) + (suffixes.get(name[2:], []) if len(name) > 2 else [])
+        candidates += [de for pattern, de in patterns if pattern.fullmatch(name)]
+        if candidates:
+            de = sorted(candidates, key=lambda x: (x['name'], x.get('label') or ''))[-1]
+            matches.append({'id': v['id'], 'dataElementName': de['name'], 'dataElementLabel': de.get('label')})
+    return matches
+
+
+# Properties added to each row by read_standard_csv (not compared by diff_terminology)
+PROVENANCE_PROPERTIES = ['_domain_', '_filename_', '_folder_']
+
+
+def diff_terminology(loaded: list, rows: list) -> (list, list, list):
+    """
+    Compares the Codelist and Term nodes loaded in Neo4j with the rows of a new terminology file by
+    (`Codelist Code`, Code). Only the columns of the new file are compared (the provenance properties are not).
+    :param loaded: list of {'id', 'label', 'props'} of the loaded Codelist/Term nodes
+    :param rows: list of {'label', 'props'} with the Codelist/Term rows of the new file (see split_terminology_rows)
+    :return: list of rows to insert ({'label', 'props'}), list of updates ({'id', 'label', 'props'} with the changed
+    properties - None for the removed ones) and list of retired nodes ({'id', 'label', 'props'})
+    """
+    new = {(row['props'].get('Codelist Code'), row['props'].get('Code')): row for row in rows}
+    columns = set().union(*[row['props'].keys() for row in rows]) - set(PROVENANCE_PROPERTIES)
+    updates, retirements, found = [], [], set()
+    for node in loaded:
+        key = (node['props'].get('Codelist Code'), node['props'].get('Code'))
+        row = new.get(key)
+        if row is None or row['label'] != node['label']:
+            retirements.append(node)
+            continue
+        found.add(key)
+        changed = {col: row['props'].get(col) for col in columns
+                   if row['props'].get(col) != node['props'].get(col)}
+        if changed:
+            updates.append({'id': node['id'], 'label': node['label'], 'props': changed})
+    inserts = [row for key, row in new.items() if key not in found]
+    return inserts, updates, retirements
+
+
+# Short names of the SDTM VariableGroupings (sdtm-1-3.ttl contextLabel)
+VARIABLE_GROUPING_SHORT_NAMES = {
+    "Interventions Observation Class Variables": "Interventions",
+    "General Observation Class Timing Variables": "GO Timing",
+    "Findings Observation Class Variables": "Findings",
+    "General Observation Class Identifier Variables": "GO Identifier",
+    "Event Observation Class Variables": "Events",
+    "Findings About Events or Interventions Variables": "FA",
+}
+
+
+def metadata_statistics(data_elements: list, variables: list) -> (list, list):
+    """
+    Computes in one pass per label the statistics used by CdiscModelManager.generate_excel_based_model:
+    for DataElements vg/vg_short (VariableGrouping contextLabel and its short name) and n_with_same_name,
+    for Variables n_with_same_label and n_with_same_name
+    :param data_elements: list of {'id', 'name', 'vg'} (dataElementName and contextLabel of the VariableGrouping)
+    :param variables: list of {'id', 'label', 'name'} (Label and Variable)
+    :return: list of {'id', 'vg', 'vg_short', 'n_with_same_name'} and list of
+    {'id', 'n_with_same_label', 'n_with_same_name'}
+    """
+    de_names = Counter(de['name'] for de in data_elements)
+    de_rows = [{'id': de['id'], 'vg': de['vg'], 'vg_short': VARIABLE_GROUPING_SHORT_NAMES.get(de['vg']),
+                'n_with_same_name': de_names[de['name']]} for de in data_elements]
+    labels = Counter(v['label'] for v in variables)
+    names = Counter(v['name'] for v in variables)
+    variable_rows = [{'id': v['id'], 'n_with_same_label': labels[v['label']], 'n_with_same_name': names[v['name']]}
+                     for v in variables]
+    return de_rows, variable_rows
+
+
+def automap_columns(columns: list, variables: list, term_classes: list) -> (list, list, list):
+    """
+    Joins the Source Data Columns with the classes they map to (see CdiscModelManager.automap_columns):
+    the Variable with the column name in the Dataset of the table when it is a Class, otherwise the parent classes of
+    its DataElement, and the Term Classes with the column name as short_label
+    :param columns: list of {'id', 'table', 'column'} (Source Data Table _domain_, Source Data Column _columnname_)
+    :param variables: list of {'id', 'table', 'column', 'is_class', 'Order', 'Core', 'dehl_ids'}
+    (Dataset, Variable and ids of the parent classes of the DataElements)
+    :param term_classes: list of {'id', 'short_label'}
+    :return: list of {'sdc', 'class_id'} (MAPS_TO_CLASS to merge), list of {'id', 'Order', 'Core'} (Source Data Column
+    properties) and list of {'table', 'column'} (columns that are not mapped to any class)
+    """
+    variables_by_column = {}
+    for v in variables:
+        variables_by_column.setdefault((v['table'], v['column']), []).append(v)
+    terms_by_short_label = {}
+    for t in term_classes:
+        terms_by_short_label.setdefault(t['short_label'], []).append(t['id'])
+    maps, properties, unmapped = [], [], []
+    for col in columns:
+        class_ids = []
+        for v in variables_by_column.get((col['table'], col['column']), []):
+            class_ids += [v['id']] if v['is_class'] else v['dehl_ids']
+            properties.append({'id': col['id'], 'Order': v.get('Order'), 'Core': v.get('Core')})
+        class_ids += terms_by_short_label.get(col['column'], [])
+        maps += [{'sdc': col['id'], 'class_id': class_id} for class_id in dict.fromkeys(class_ids)]
+        if not class_ids:
+            unmapped.append({'table': col['table'], 'column': col['column']})
+    return maps, properties, unmapped
@@ -0,0 +1,90 @@
+from collections import defaultdict
+
+# Relationship from each node to each of its (transitive) SUBCLASS_OF ancestors, with the depth as property
+CLOSURE_REL = "SUBCLASS_OF_CLOSURE"
+
+
+def subclass_closure(edges: list) -> list:
+    """
+    Computes the transitive closure of the SUBCLASS_OF hierarchy
+    :param edges: list of [child id, parent id]
+    :return: list of {'descendant', 'ancestor', 'depth'} - one per (descendant, ancestor) pair with the length of the
+    shortest SUBCLASS_OF path between them (cycles are followed only once)
+    """
+    parents = defaultdict(list)
+    for child, parent in edges:
+        if parent not in parents[child]:
+            parents[child].append(parent)
+    closure = []
+    for node in list(parents):
+        depths = {}
+        level, depth = parents[node], 1
+        while level:
+            next_level = []
+            for ancestor in level:
+                if ancestor != node and ancestor not in depths:
+                    depths[ancestor] = depth
+                    next_level += parents.get(ancestor, [])
+            level, depth = next_level, depth + 1
+        closure += [{'descendant': node, 'ancestor': ancestor, 'depth': d} for ancestor, d in depths.items()]
+    return closure
+
+
+class SubclassClosureMixin:
+    """
+    Maintains the (:Class)-[:SUBCLASS_OF_CLOSURE{depth}]->(:Class) relationships from each class to all its
+    SUBCLASS_OF ancestors, so that ancestor/descendant lookups are single-hop instead of variable-length expansions
+    (to be mixed into NeoInterface subclasses with NamedQueryMixin)
+    """
+    def refresh_subclass_closure(self, chunk_size: int = 10000) -> int:
+        """
+        Recomputes the SUBCLASS_OF_CLOSURE relationships from the current SUBCLASS_OF relationships
+        (called by generate_excel_based_model - call it again after changing the class hierarchy)
+        :param chunk_size: Maximum number of relationships written per query
+        :return: number of SUBCLASS_OF_CLOSURE relationships
+        """
+        q = """
+        MATCH (child)-[:SUBCLASS_OF]->(parent)
+        RETURN id(child) as child, id(parent) as parent
+        """
+        edges = [[r['child'], r['parent']] for r in self.run_query("refresh_subclass_closure.get_edges", q)]
+        closure = subclass_closure(edges)
+
+        q = f"""
+        MATCH ()-[r:{CLOSURE_REL}]->()
+        DELETE r
+        """
+        self.run_query("refresh_subclass_closure.delete_closure", q)
+        q = f"""
+        UNWIND $rows as row
+        MATCH (descendant), (ancestor)
+        WHERE id(descendant) = row.descendant AND id(ancestor) = row.ancestor
+        CREATE (descendant)-[:{CLOSURE_REL}{{depth: row.depth}}]->(ancestor)
+        """
+        for i in range(0, len(closure), chunk_size):
+            self.run_query("refresh_subclass_closure.create_closure", q, {'rows': closure[i:i + chunk_size]})
+        return len(closure)
+
+    def get_class_ancestors(self, label: str) -> list:
+        """
+        :param label: label of a Class
+        :return: list of {'label', 'depth'} - the SUBCLASS_OF ancestors of the class, nearest first
+        """
+        q = f"""
+        MATCH (c:Class{{label:$label}})-[r:{CLOSURE_REL}]->(ancestor)
+        RETURN ancestor.label as label, r.depth as depth
+        ORDER BY depth, label
+        """
+        return self.run_query("get_class_ancestors", q, {'label': label})
+
+    def get_class_descendants(self, label: str) -> list:
+        """
+        :param label: label of a Class
+        :return: list of {'label', 'depth'} - the SUBCLASS_OF descendants of the class, nearest first
+        """
+        q = f"""
+        MATCH (c:Class{{label:$label}})<-[r:{CLOSURE_REL}]-(descendant)
+        RETURN descendant.label as label, r.depth as depth
+        ORDER BY depth, label
+        """
+        return self.run_query("get_class_descendants", q, {'label': label})
@@ -0,0 +1,51 @@
+# Cypher fragment resolving the controlled terms of each bound (c): the Terms it HAS_CONTROLLED_TERM and the Terms of
+# the Codelists it HAS_CODELIST - each replaced by the Term it is TERM_POOLED_INTO if c HAS_CONTROLLED_TERM that
+# pooled Term (see CdiscModelManager.generate_excel_based_model). Yields one row per (c, t) - with any other variable
+# in scope dropped but c
+CONTROLLED_TERMS = """
+    OPTIONAL MATCH (c)-[:HAS_CODELIST]->(:Codelist)-[:HAS_TERM]->(term:Term)
+    OPTIONAL MATCH (term)-[:TERM_POOLED_INTO]->(pooled:Term)<-[:HAS_CONTROLLED_TERM]-(c)
+    WITH c, collect(DISTINCT coalesce(pooled, term)) as codelist_terms
+    OPTIONAL MATCH (c)-[:HAS_CONTROLLED_TERM]->(direct:Term)
+    WITH c, codelist_terms + collect(direct) as terms
+    UNWIND terms as t
+    WITH DISTINCT c, t
+"""
+
+
+class ControlledTermsMixin:
+    """
+    Resolves the controlled terms of the Classes on demand - so that they are the same whether the standard was loaded
+    with a (:Variable)-[:HAS_CONTROLLED_TERM]->(:Term) relationship for each Term of the Codelist of each Variable
+    or with the (:Variable)-[:HAS_CODELIST]->(:Codelist) relationships only (CdiscStandardLoader(codelist_only=True))
+    (to be mixed into NeoInterface subclasses with NamedQueryMixin)
+    """
+    def get_controlled_terms(self, labels: list = None) -> dict:
+        """
+        :param labels: labels of the Classes (all the Classes with controlled terms if None)
+        :return: dictionary with the label of each Class as key and the list of its Terms as value (each as a
+        dictionary of its properties), ordered by rdfs:label, Codelist Code and Term Code
+        """
+        q = f"""
+        MATCH (c:Class)
+        WHERE $labels IS NULL OR c.label IN $labels
+        {CONTROLLED_TERMS}
+        WITH c, t
+        ORDER BY c.label, t.`rdfs:label`, t.`Codelist Code`, t.`Term Code`
+        RETURN c.label as label, collect(t{{.*}}) as terms
+        """
+        res = self.run_query("get_controlled_terms", q, {'labels': labels})
+        return {r['label']: r['terms'] for r in res}
+
+    def is_codelist_only(self) -> bool:
+        """
+        :return: True if the standard was loaded with CdiscStandardLoader(codelist_only=True)
+        (read from the fingerprint saved by load_standard - also written by CdiscModelManager.load_built_model and
+        part of the metadata snapshots)
+        """
+        q = """
+        MATCH (f:`Standard Load Fingerprint`)
+        RETURN f.codelist_only as codelist_only
+        """
+        res = self.run_query("is_codelist_only", q)
+        return bool(res and res[0]['codelist_only'])
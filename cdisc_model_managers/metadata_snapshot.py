@@ -0,0 +1,96 @@
+import gzip
+import json
+import datetime
+import neo4j.time
+
+SNAPSHOT_FORMAT = "neo4cdisc-metadata-snapshot"
+SNAPSHOT_VERSION = 1
+# Neo4j temporal types - saved as {"$type": <key>, "value": <ISO 8601 string>}
+TEMPORAL_TYPES = {
+    'datetime': neo4j.time.DateTime,
+    'date': neo4j.time.Date,
+    'time': neo4j.time.Time,
+    'duration': neo4j.time.Duration,
+}
+# Python temporal types (as returned by NeoInterface.query with convert_dates=True) - saved as the Neo4j type
+NATIVE_TEMPORAL_TYPES = [
+    (datetime.datetime, neo4j.time.DateTime),  # checked first: datetime is a date
+    (datetime.date, neo4j.time.Date),
+    (datetime.time, neo4j.time.Time),
+]
+
+
+def encode_value(value):
+    """
+    :param value: property value as returned by the Neo4j driver
+    :return: the value with the temporal values (also in lists) replaced by {"$type", "value"} dictionaries
+    """
+    for native, cls in NATIVE_TEMPORAL_TYPES:
+        if isinstance(value, native):
+            value = cls.from_native(value)
+            break
+    for key, cls in TEMPORAL_TYPES.items():
+        if isinstance(value, cls):  # checked first: Duration is a tuple
+            return {'$type': key, 'value': value.iso_format()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"Cannot save a property value of type {type(value).__name__} in a metadata snapshot")
+
+
+def decode_value(obj: dict):
+    """
+    json object hook converting the {"$type", "value"} dictionaries written by encode_value back to Neo4j temporal
+    values
+    """
+    if set(obj) == {'$type', 'value'}:
+        if obj['$type'] not in TEMPORAL_TYPES:
+            raise ValueError(f"Unsupported value type {obj['$type']} in metadata snapshot")
+        return TEMPORAL_TYPES[obj['$type']].from_iso_format(obj['value'])
+    return obj
+
+
+def encode_props(props: dict) -> dict:
+    """
+    :return: the properties with their values encoded with encode_value
+    """
+    return {key: encode_value(value) for key, value in props.items()}
+
+
+def write_snapshot(path: str, labels: list, nodes: list, rels: list) -> None:
+    """
+    Writes a metadata snapshot as gzipped json:
+    {'format', 'version', 'labels', 'nodes': [[id, labels, properties]], 'rels': [[from id, type, to id, properties]]}
+    (temporal property values are encoded with encode_value - a TypeError is raised for any other type that json
+    does not support)
+    :param path: path of the snapshot file
+    :param labels: labels of the nodes included in the snapshot
+    :param nodes: list of {'id', 'labels', 'props'}
+    :param rels: list of {'from_id', 'type', 'to_id', 'props'}
+    :return: None
+    """
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'labels': labels,
+        'nodes': [[node['id'], node['labels'], encode_props(node['props'])] for node in nodes],
+        'rels': [[rel['from_id'], rel['type'], rel['to_id'], encode_props(rel['props'])] for rel in rels],
+    }
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+
+
+def read_snapshot(path: str) -> dict:
+    """
+    Reads a metadata snapshot written by write_snapshot (with the temporal property values decoded - see decode_value)
+    :param path: path of the snapshot file
+    :return: dictionary {'format', 'version', 'labels', 'nodes', 'rels'}
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        snapshot = json.load(f, object_hook=decode_value)
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a metadata snapshot")
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported metadata snapshot version {snapshot.get('version')} (expected {SNAPSHOT_VERSION})")
+    return snapshot
@@ -0,0 +1,705 @@
+import os
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from cdisc_model_managers import cdisc_standard_parser
+from cdisc_model_managers import ttl_parser
+
+RDFSLABEL = "rdfs:label"  # ModelManager.RDFSLABEL
+
+# Labels of the ObservationClass Classes (generate_excel_based_model)
+OBSERVATION_CLASS_LABELS = {
+    'INTERVENTIONS': 'Intervention',
+    'EVENTS': 'Event',
+    'FINDINGS ABOUT': 'Finding About',
+    'FINDINGS': 'Finding',
+    'RELATIONSHIP': 'Relationship (SDTM)',
+    'SPECIAL PURPOSE': 'Special Purpose',
+    'TRIAL DESIGN': 'Trial Design',
+}
+# VariableGroupings of the ObservationClasses in sdtm-1-3.ttl (load_link_sdtm_ttl)
+CLASS_SPECIFIC_VARIABLE_GROUPINGS = {
+    'FINDINGS': "Findings Observation Class Variables",
+    'EVENTS': "Event Observation Class Variables",
+    'INTERVENTIONS': "Interventions Observation Class Variables",
+}
+# Additional relationships between Classes based on business need (generate_excel_based_model)
+BUSINESS_RELATIONSHIPS = [
+    {'left': 'Subject', 'right': 'Study', 'rel': 'Study'},
+    {'left': 'Body System or Organ Class', 'right': 'Dictionary-Derived Term', 'rel': 'QUALIFIES'},
+    {'left': 'Visit Name', 'right': 'Visit Number', 'rel': 'QUALIFIES'},
+]
+
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+@dataclass(eq=False)
+class Node:
+    __slots__ = ['key', 'labels', 'props', 'graph']
+    key: int
+    labels: list
+    props: dict
+    graph: 'ModelGraph'  # notified of the property changes (see ModelGraph._index)
+
+    def set(self, key: str, value) -> None:
+        # as in Cypher, setting a property to null removes it
+        self.graph._unindex(self, key)
+        if value is None:
+            self.props.pop(key, None)
+        else:
+            self.props[key] = value
+        self.graph._index(self, key)
+
+
+@dataclass(eq=False)
+class Edge:
+    __slots__ = ['start', 'type', 'end']
+    start: int
+    type: str
+    end: int
+
+
+class ModelGraph:
+    """
+    In-memory property graph with the lookups needed by ModelBuilder.
+    Nodes are indexed by (label, property, value) so that find_node/merge_node do not scan all the nodes of the label,
+    and edges are keyed by (start, type, end) so that has_edge and delete_edges do not scan the edges
+    """
+    def __init__(self):
+        self.nodes = {}
+        self._edges = {}  # (start key, type, end key) -> list of the (parallel) Edges
+        self._out = defaultdict(dict)  # (start key, type) -> {end key: end node}
+        self._in = defaultdict(dict)  # (end key, type) -> {start key: start node}
+        self._by_label = defaultdict(list)
+        self._by_prop = defaultdict(dict)  # (label, property, value) -> {node key: node}
+
+    @property
+    def edges(self) -> list:
+        return [e for edges in self._edges.values() for e in edges]
+
+    def create_node(self, labels: list, props: dict = None) -> Node:
+        node = Node(len(self.nodes), [], {}, self)
+        self.nodes[node.key] = node
+        for label in labels:
+            self.add_label(node, label)
+        for key, value in (props or {}).items():
+            node.set(key, value)
+        return node
+
+    def add_label(self, node: Node, label: str) -> None:
+        if label not in node.labels:
+            node.labels.append(label)
+            self._by_label[label].append(node)
+            for key, value in node.props.items():
+                if _hashable(value):
+                    self._by_prop[(label, key, value)][node.key] = node
+
+    def _index(self, node: Node, key: str) -> None:
+        value = node.props.get(key)
+        if value is not None and _hashable(value):
+            for label in node.labels:
+                self._by_prop[(label, key, value)][node.key] = node
+
+    def _unindex(self, node: Node, key: str) -> None:
+        value = node.props.get(key)
+        if value is not None and _hashable(value):
+            for label in node.labels:
+                self._by_prop[(label, key, value)].pop(node.key, None)
+
+    def nodes_with(self, label: str) -> list:
+        return list(self._by_label[label])
+
+    def find_node(self, label: str, props: dict) -> Node:
+        """
+        :return: the first node with the label and the properties (as MERGE matches them) or None
+        """
+        indexed = [(key, value) for key, value in props.items() if value is not None and _hashable(value)]
+        if indexed:
+            candidates = min((self._by_prop.get((label, key, value), {}) for key, value in indexed), key=len)
+            candidates = sorted(candidates.values(), key=lambda n: n.key)
+        else:
+            candidates = self._by_label[label]
+        for node in candidates:
+            if all(node.props.get(key) == value for key, value in props.items()):
+                return node
+        return None
+
+    def merge_node(self, label: str, props: dict) -> Node:
+        return self.find_node(label, props) or self.create_node([label], props)
+
+    def has_edge(self, start: Node, type: str, end: Node) -> bool:
+        return (start.key, type, end.key) in self._edges
+
+    def create_edge(self, start: Node, type: str, end: Node) -> None:
+        self._edges.setdefault((start.key, type, end.key), []).append(Edge(start.key, type, end.key))
+        self._out[(start.key, type)][end.key] = end
+        self._in[(end.key, type)][start.key] = start
+
+    def merge_edge(self, start: Node, type: str, end: Node) -> None:
+        if not self.has_edge(start, type, end):
+            self.create_edge(start, type, end)
+
+    def delete_edges(self, start: Node, type: str, end: Node) -> None:
+        self._edges.pop((start.key, type, end.key), None)
+        self._out[(start.key, type)].pop(end.key, None)
+        self._in[(end.key, type)].pop(start.key, None)
+
+    def out(self, node: Node, type: str, label: str = None) -> list:
+        return [n for n in self._out[(node.key, type)].values()
+                for _ in self._edges[(node.key, type, n.key)] if label is None or label in n.labels]
+
+    def inn(self, node: Node, type: str, label: str = None) -> list:
+        return [n for n in self._in[(node.key, type)].values()
+                for _ in self._edges[(n.key, type, node.key)] if label is None or label in n.labels]
+
+    def merge_relationship(self, start: Node, end: Node, relationship_type: str) -> Node:
+        """
+        As MERGE (start)<-[:FROM]-(:Relationship{relationship_type:relationship_type})-[:TO]->(end)
+        """
+        for rel in self.inn(start, 'FROM', 'Relationship'):
+            if rel.props.get('relationship_type') == relationship_type and self.has_edge(rel, 'TO', end):
+                return rel
+        rel = self.create_node(['Relationship'], {'relationship_type': relationship_type})
+        self.create_edge(rel, 'FROM', start)
+        self.create_edge(rel, 'TO', end)
+        return rel
+
+
+class ModelBuilder:
+    """
+    Builds in memory, from the standard files, the metadata graph that CdiscStandardLoader.load_standard(direct=True)
+    followed by CdiscModelManager.generate_excel_based_model create in Neo4j: each step below mirrors one of their
+    queries. The graph can then be validated and written to Neo4j in one batched load
+    (CdiscModelManager.load_built_model).
+    EXAMPLE:
+        builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+        builder.build()
+        mm.load_built_model(builder)
+    """
+    def __init__(self, standards_folder: str, sdtm_file: str, sdtmig_file: str, terminology_file: str,
+                 ttl_file: str = "sdtm-1-3.ttl", domain_sort_order_file: str = "sdtmig3_2_domain_sort_order.json",
+                 domain_labels_file: str = "sdtmig3_3_domain_labels.json", cache_folder: str = None,
+                 codelist_only: bool = False):
+        """
+        :param standards_folder: Directory where standard files are stored
+        :param sdtm_file: Name of file containing SDTM Model metadata
+        :param sdtmig_file: Name of file containing SDTMIG metadata
+        :param terminology_file: Name of file containing SDTM Terminology
+        :param cache_folder: Directory of the parsed TTL cache (see ttl_parser.load_ttl_graph)
+        :param codelist_only: as in CdiscStandardLoader
+        """
+        self.standards_folder = standards_folder
+        self.sdtm_file = sdtm_file
+        self.sdtmig_file = sdtmig_file
+        self.terminology_file = terminology_file
+        self.ttl_file = ttl_file
+        self.domain_sort_order_file = domain_sort_order_file
+        self.domain_labels_file = domain_labels_file
+        self.cache_folder = cache_folder
+        self.codelist_only = codelist_only
+        self.graph = ModelGraph()
+
+    def build(self, extract_terms: bool = True, extract_vld: bool = True, label_terms: bool = False,
+              create_short_label: bool = False) -> ModelGraph:
+        """
+        :param extract_terms, extract_vld: as in CdiscStandardLoader.load_standard
+        :param label_terms, create_short_label: as in CdiscModelManager.generate_excel_based_model
+        :return: the built graph
+        """
+        self.build_standard(extract_terms=extract_terms, extract_vld=extract_vld)
+        self.build_model(label_terms=label_terms, create_short_label=create_short_label)
+        return self.graph
+
+    ## ---------------------------- CdiscStandardLoader.load_standard ----------------------------- ##
+    def build_standard(self, extract_terms: bool = True, extract_vld: bool = True) -> None:
+        g = self.graph
+        folder = self.standards_folder
+        with open(os.path.join(folder, self.domain_sort_order_file), 'r') as json_file:
+            domain_sort_order = json.load(json_file)["domain_sort_order"]
+        with open(os.path.join(folder, self.domain_labels_file), 'r') as json_file:
+            domain_labels = json.load(json_file)["domain_labels"]
+
+        # ingest_standard
+        gocs, special_purpose = cdisc_standard_parser.split_sdtm_rows(
+            cdisc_standard_parser.read_standard_csv(folder, self.sdtm_file))
+        for row in gocs:
+            g.create_node(['GOC'], row)
+        for row in special_purpose:
+            g.create_node(['Special_Purpose_Variable'], row)
+        for row in cdisc_standard_parser.sdtmig_variable_rows(
+                cdisc_standard_parser.read_standard_csv(folder, self.sdtmig_file)):
+            g.create_node(['Variable'], row)
+        codelists, terms = cdisc_standard_parser.split_terminology_rows(
+            cdisc_standard_parser.read_standard_csv(folder, self.terminology_file))
+        for row in codelists:
+            g.create_node(['Codelist'], row)
+        for row in terms:
+            g.create_node(['Term'], row)
+
+        # reshape_model
+        classes = []
+        for n in g.nodes_with('GOC') + g.nodes_with('Special_Purpose_Variable'):
+            if n.props.get('Class') is not None and n.props['Class'] not in classes:
+                classes.append(n.props['Class'])
+        for goc in classes:
+            g.merge_node('ObservationClass', {'Class': goc.upper(), 'label': goc})
+        for oc in g.nodes_with('ObservationClass'):
+            vg = g.merge_node('VariableGrouping', {'contextLabel': oc.props['label'] + " Observation Class Variables"})
+            g.merge_edge(oc, 'CLASS_SPECIFIC_VARIABLE_GROUPING', vg)
+        for oc in g.nodes_with('ObservationClass'):
+            for vg in g.out(oc, 'CLASS_SPECIFIC_VARIABLE_GROUPING', 'VariableGrouping'):
+                for v in g.nodes_with('GOC'):
+                    if v.props.get('Class') == oc.props['label']:
+                        g.merge_edge(v, 'context', vg)
+
+        # reshape_sdtmig
+        variables_by_dataset = defaultdict(list)
+        for v in g.nodes_with('Variable'):
+            if v.props.get('Dataset Name') is not None:
+                variables_by_dataset[v.props['Dataset Name']].append(v)
+        for domain in variables_by_dataset:
+            d = g.merge_node('Domain', {'Domain': domain, 'Dataset': domain})
+            g.add_label(d, 'Dataset')
+        for d in g.nodes_with('Domain'):
+            for v in variables_by_dataset[d.props['Domain']]:
+                g.merge_edge(d, 'HAS_VARIABLE', v)
+                d.set('Class', v.props['Class'].upper() if v.props.get('Class') is not None else None)
+        for domain, label in domain_labels.items():
+            for d in g.nodes_with('Domain'):
+                if d.props.get('Domain') == domain:
+                    d.set('label', label)
+                    d.set('Description', label)
+        for d in g.nodes_with('Domain'):
+            for oc in g.nodes_with('ObservationClass'):
+                if d.props.get('Class') is not None and oc.props.get('Class') == d.props['Class']:
+                    g.merge_edge(oc, 'HAS_DATASET', d)
+
+        # reshape_terminology
+        terms_by_codelist = defaultdict(list)
+        for t in g.nodes_with('Term'):
+            terms_by_codelist[t.props.get('Codelist Code')].append(t)
+        for c in g.nodes_with('Codelist'):
+            for t in terms_by_codelist.get(c.props.get('Code'), []):
+                g.merge_edge(c, 'HAS_TERM', t)
+
+        # link_cdisc
+        domains, sort_variables = cdisc_standard_parser.resolve_domain_sort_order(domain_sort_order)
+        for row in domains:
+            for n in g.nodes_with('Domain'):
+                if n.props.get('Domain') == row['domain']:
+                    for v in g.out(n, 'HAS_VARIABLE', 'Variable'):
+                        seq = v.props.get('Variable Name')
+                        if seq is not None and seq.endswith("SEQ"):
+                            n.set('Sort Order', row['sort_order'] if seq in row['sort_order'].split(",")
+                                  else row['sort_order'] + "," + seq)
+        for row in sort_variables:
+            for v in variables_by_dataset[row['domain']]:
+                if v.props.get('Variable Name') == row['variable']:
+                    v.set('Order', row['order'])
+        codelists_by_code = defaultdict(list)
+        for c in g.nodes_with('Codelist'):
+            codelists_by_code[c.props.get('Code')].append(c)
+        terms_by_value = defaultdict(list)
+        for t in g.nodes_with('Term'):
+            terms_by_value[t.props.get('CDISC Submission Value')].append(t)
+        for v in g.nodes_with('Variable'):
+            for c in codelists_by_code.get(v.props.get('Codelist Code'), []) if v.props.get('Codelist Code') else []:
+                g.merge_edge(v, 'HAS_CODELIST', c)
+                if not self.codelist_only:
+                    for t in g.out(c, 'HAS_TERM', 'Term'):
+                        g.merge_edge(v, 'HAS_CONTROLLED_TERM', t)
+        for v in g.nodes_with('Variable'):
+            value_list = v.props.get('Value List')
+            if value_list is None:
+                continue
+            for trm in (value_list.split("; ") if ";" in value_list else [value_list]):
+                for t in terms_by_value.get(trm, []):
+                    g.merge_edge(v, 'HAS_CONTROLLED_TERM', t)
+        if extract_terms:
+            for t in g.nodes_with('Term'):
+                t.set('Term Code', t.props.get('Code'))
+
+        # load_link_sdtm_ttl
+        ttl_graph = ttl_parser.load_ttl_graph(os.path.join(folder, self.ttl_file), self.cache_folder)
+        resources = {}
+        for resource in ttl_graph['nodes']:
+            resources[resource['uri']] = g.create_node(resource['labels'], {'uri': resource['uri'],
+                                                                              **resource['props']})
+        for start, type, end in ttl_graph['rels']:
+            g.merge_edge(resources[start], type, resources[end])
+        for oc in g.nodes_with('ObservationClass'):
+            context_label = CLASS_SPECIFIC_VARIABLE_GROUPINGS.get(oc.props.get('Class'))
+            for vg in g.nodes_with('VariableGrouping'):
+                if context_label is not None and vg.props.get('contextLabel') == context_label:
+                    g.merge_edge(oc, 'CLASS_SPECIFIC_VARIABLE_GROUPING', vg)
+        data_elements = g.nodes_with('DataElement')
+        matches = cdisc_standard_parser.match_data_elements(
+            [{'id': v.key, 'variable': v.props.get('Variable'), 'dataset': v.props.get('Dataset Name')}
+             for v in g.nodes_with('Variable')],
+            [{'name': de.props.get('dataElementName'), 'label': de.props.get('dataElementLabel')}
+             for de in data_elements]
+        )
+        for match in matches:
+            g.nodes[match['id']].set('dataElementName', match['dataElementName'])
+            g.nodes[match['id']].set('dataElementLabel', match['dataElementLabel'])
+        data_elements_by_name = defaultdict(list)
+        for de in data_elements:
+            data_elements_by_name[de.props.get('dataElementName')].append(de)
+        for v in g.nodes_with('Variable'):
+            datasets = g.inn(v, 'HAS_VARIABLE', 'Dataset')
+            das = data_elements_by_name.get(v.props.get('dataElementName'), []) \
+                if v.props.get('dataElementName') is not None else []
+            if datasets and len(datasets) * len(das) == 1:
+                g.merge_edge(v, 'IS_DATA_ELEMENT', das[0])
+        class_specific = []
+        for v in g.nodes_with('Variable'):
+            if g.out(v, 'IS_DATA_ELEMENT') or v.props.get('dataElementName') is None:
+                continue
+            for ds in g.inn(v, 'HAS_VARIABLE', 'Dataset'):
+                for oc in g.inn(ds, 'HAS_DATASET', 'ObservationClass'):
+                    for vg in g.out(oc, 'CLASS_SPECIFIC_VARIABLE_GROUPING', 'VariableGrouping'):
+                        for da in g.inn(vg, 'context', 'DataElement'):
+                            if da.props.get('dataElementName') == v.props['dataElementName']:
+                                class_specific.append((v, da))
+        for v, da in class_specific:
+            g.merge_edge(v, 'IS_DATA_ELEMENT', da)
+
+        # compute_statistics
+        de_rows, variable_rows = cdisc_standard_parser.metadata_statistics(
+            [{'id': de.key, 'name': de.props.get('dataElementName'), 'vg': vg.props.get('contextLabel') if vg else None}
+             for de in data_elements for vg in (g.out(de, 'context', 'VariableGrouping') or [None])],
+            [{'id': v.key, 'label': v.props.get('Label'), 'name': v.props.get('Variable')}
+             for v in g.nodes_with('Variable')]
+        )
+        for row in de_rows + variable_rows:
+            for key, value in row.items():
+                if key != 'id':
+                    g.nodes[row['id']].set(key, value)
+
+        # save_fingerprint (generate_excel_based_model reads the codelist_only mode from it)
+        g.create_node(['Standard Load Fingerprint'],
+                      self.input_fingerprint(extract_terms=extract_terms, extract_vld=extract_vld))
+
+    def input_fingerprint(self, extract_terms: bool = True, extract_vld: bool = True) -> dict:
+        """
+        :return: the fingerprint of the inputs, as CdiscStandardLoader.input_fingerprint
+        """
+        files = {
+            'sdtm': self.sdtm_file,
+            'sdtmig': self.sdtmig_file,
+            'terminology': self.terminology_file,
+            'domain_sort_order': self.domain_sort_order_file,
+            'domain_labels': self.domain_labels_file,
+            'ttl': self.ttl_file,
+        }
+        return cdisc_standard_parser.input_fingerprint(
+            self.standards_folder, files, loader_version=cdisc_standard_parser.LOADER_VERSION,
+            extract_terms=extract_terms, extract_vld=extract_vld, codelist_only=self.codelist_only
+        )
+
+    ## ---------------------------- CdiscModelManager.generate_excel_based_model ----------------------------- ##
+    def build_model(self, label_terms: bool = False, create_short_label: bool = False) -> None:
+        g = self.graph
+
+        # Terms
+        for t in g.nodes_with('Term'):
+            t.set(RDFSLABEL, t.props.get('Term'))
+            t.set('Codelist Code', t.props.get('GSK_Codelist_Code') if t.props.get('NCI Codelist Code') in [None, '']
+                  else t.props['NCI Codelist Code'])
+            t.set('Term Code', t.props.get('GSK_Term_Code') if t.props.get('NCI Term Code') in [None, '']
+                  else t.props['NCI Term Code'])
+
+        # Datasets to Classes
+        observation_classes = []
+        for d in g.nodes_with('Dataset'):
+            g.add_label(d, 'Class')
+            d.set('label', d.props.get('Description'))
+            d.set('short_label', d.props.get('Dataset'))
+            d.set('create', True)
+            for oc in g.inn(d, 'HAS_DATASET', 'ObservationClass'):
+                g.add_label(oc, 'Class')
+                label = OBSERVATION_CLASS_LABELS.get(oc.props.get('Class'))
+                oc.set('label', label)
+                oc.set('short_label', label.upper() if label is not None else None)
+                g.merge_edge(d, 'SUBCLASS_OF', oc)
+                if oc not in observation_classes:
+                    observation_classes.append(oc)
+        for oc in observation_classes:
+            rec_class = g.merge_node('Class', {'label': 'Record', 'short_label': 'RECORD'})
+            g.merge_edge(oc, 'SUBCLASS_OF', rec_class)
+
+        # Class from Variable (when no DataElement exists)
+        variable_classes = []
+        for d in g.nodes_with('Dataset'):
+            for v in g.out(d, 'HAS_VARIABLE', 'Variable'):
+                name = v.props.get('Variable')
+                if name is None or (name.startswith('COVAL') and name != 'COVAL') or \
+                        (name.startswith('TSVAL') and name not in ['TSVAL', 'TSVALCD', 'TSVALNF']):
+                    continue
+                if not g.out(v, 'IS_DATA_ELEMENT', 'DataElement'):
+                    variable_classes.append((d, v))
+        for d, v in variable_classes:
+            g.add_label(v, 'Class')
+            if (v.props.get('n_with_same_label') or 0) > 1:
+                v.set('label', None if d.props.get('Description') is None or v.props.get('Label') is None
+                      else d.props['Description'] + ' ' + v.props['Label'])
+            else:
+                v.set('label', v.props.get('Label'))
+            if (v.props.get('n_with_same_name') or 0) > 1:
+                v.set('short_label', None if d.props.get('Dataset') is None else d.props['Dataset'] + v.props['Variable'])
+            else:
+                v.set('short_label', v.props['Variable'])
+            v.set('create', False)
+            if v.props.get('Label') is None:
+                continue
+            g.merge_relationship(d, v, v.props['Label'])
+            # for the DM table, like all the variable to the (soon to be) subject class
+            if d.props.get('Dataset') in ['DM']:
+                for s in g.nodes_with('Variable'):
+                    if s.props.get('Dataset') in ['DM'] and s.props.get('Label') == "Unique Subject Identifier":
+                        g.merge_relationship(s, v, v.props['Label'])
+
+        # Class from dataElement and Relationship from Variable
+        for de in g.nodes_with('DataElement'):
+            name = de.props.get('dataElementName')
+            for dar in g.out(de, 'dataElementRole', 'DataElementRole') or [None]:
+                if name == 'USUBJID':
+                    label = 'Subject'
+                elif name == 'STUDYID':
+                    label = 'Study'
+                elif name == '--DECOD':
+                    label = 'Dictionary-Derived Term'
+                elif de.props.get('dataElementLabel') == 'Class':
+                    label = de.props.get('vg')
+                else:
+                    label = de.props.get('dataElementLabel')
+                create = dar is not None and dar.props.get('label') in ['Identifier Variable', 'Result Qualifier'] \
+                    and name not in ['DOMAIN', 'STUDYID', 'USUBJID', 'EPOCH']
+                class_map = {'label': label, 'short_label': name, 'create': create}
+                g.add_label(de, 'Class')
+                de.set('label', " ".join(x for x in [de.props.get('vg'), label] if x is not None))
+                de.set('short_label', " ".join(x for x in [de.props.get('vg_short'), name] if x is not None))
+                de.set('create', create)
+                dehl = g.merge_node('Class', {key: value for key, value in class_map.items() if value is not None})
+                g.merge_edge(de, 'SUBCLASS_OF', dehl)
+                for v in g.inn(de, 'IS_DATA_ELEMENT', 'Variable'):
+                    for d in g.inn(v, 'HAS_VARIABLE', 'Dataset'):
+                        g.add_label(v, 'Relationship')
+                        v.set('label', v.props.get('Label'))
+                        v.set('short_label', v.props.get('Variable') if create_short_label else None)
+                        v.set('relationship_type', label)
+                        if not (g.has_edge(v, 'TO', dehl) and g.has_edge(v, 'FROM', d)):
+                            g.create_edge(v, 'TO', dehl)
+                            g.create_edge(v, 'FROM', d)
+                        for t in g.out(v, 'HAS_CONTROLLED_TERM', 'Term'):
+                            g.merge_edge(dehl, 'HAS_CONTROLLED_TERM', t)
+        if self.codelist_only:
+            for dehl in g.nodes_with('Class'):
+                for de in g.inn(dehl, 'SUBCLASS_OF', 'DataElement'):
+                    for v in g.inn(de, 'IS_DATA_ELEMENT', 'Variable'):
+                        if g.inn(v, 'HAS_VARIABLE', 'Dataset'):
+                            for c in g.out(v, 'HAS_CODELIST', 'Codelist'):
+                                g.merge_edge(dehl, 'HAS_CODELIST', c)
+
+        # In the DM dateset, migrate the relationships going TO variables FROM the Unique Subject Identifier
+        for var in g.nodes_with('Relationship'):
+            if 'Variable' in var.labels and var.props.get('Dataset') == 'DM' and \
+                    var.props.get('Label') == "Unique Subject Identifier":
+                for rel in g.inn(var, 'FROM', 'Relationship'):
+                    g.delete_edges(rel, 'FROM', var)
+                    for subject in g.nodes_with('Class'):
+                        if subject.props.get('label') == 'Subject':
+                            g.merge_edge(rel, 'FROM', subject)
+
+        # Merging duplicate dehl Terms
+        def sort_key(t):
+            return [(t.props.get(key) is None, t.props.get(key) or '') for key in [RDFSLABEL, 'Codelist Code', 'Term Code']]
+        pools = []
+        for dehl in g.nodes_with('Class'):
+            if 'Variable' in dehl.labels:
+                continue
+            groups = defaultdict(list)
+            terms = g.out(dehl, 'HAS_CONTROLLED_TERM', 'Term')
+            if self.codelist_only:
+                terms = list(dict.fromkeys(
+                    [t for c in g.out(dehl, 'HAS_CODELIST', 'Codelist') for t in g.out(c, 'HAS_TERM', 'Term')] + terms))
+            for t in sorted(terms, key=sort_key):
+                groups[t.props.get(RDFSLABEL)].append(t)
+            pools += [(dehl, coll) for coll in groups.values() if len(coll) > 1]
+        for dehl, coll in pools:
+            template = coll[0]
+            if template.props.get('Codelist Code') is None or template.props.get('Term Code') is None:
+                continue
+            dehl_term = g.merge_node('Term', {'Codelist Code': 'P' + template.props['Codelist Code'],
+                                              'Term Code': 'P' + template.props['Term Code']})
+            dehl_term.set(RDFSLABEL, template.props.get(RDFSLABEL))
+            g.merge_edge(dehl, 'HAS_CONTROLLED_TERM', dehl_term)
+            for t in coll:
+                g.merge_edge(t, 'TERM_POOLED_INTO', dehl_term)
+                g.delete_edges(dehl, 'HAS_CONTROLLED_TERM', t)
+
+        # Link Domain Abbreviation to all dehl classes
+        domain_classes = [c for c in g.nodes_with('Class') if c.props.get('label') == 'Domain Abbreviation']
+        for de in g.nodes_with('DataElement'):
+            for dehl in g.out(de, 'SUBCLASS_OF', 'Class'):
+                for domain_class in domain_classes:
+                    if dehl is not domain_class and dehl.props.get('label') is not None and \
+                            dehl.props['label'] not in ['Subject', 'Study']:
+                        g.merge_relationship(dehl, domain_class, 'DOMAIN')
+
+        if label_terms:
+            for c in g.nodes_with('Class'):
+                if 'DataElement' in c.labels and g.out(c, 'SUBCLASS_OF'):
+                    continue
+                if c.props.get('create') is not False or c.props.get('label') is None:
+                    continue
+                if 'Variable' in c.labels and (c.props.get('Dataset') is None or c.props['Dataset'].startswith('SUPP')):
+                    continue
+                for t in self.controlled_terms(c):
+                    g.add_label(t, c.props['label'])
+
+        # Classes from SUPP domain Terms (only SUPPDM for now) - no effect on a graph built from the standard files
+        # (they have no SUPP_DATASET relationships)
+        rows = []
+        for qnam in g.nodes_with('Variable'):
+            if not str(qnam.props.get('Dataset', '')).startswith('SUPP') or qnam.props.get('Variable') != 'QNAM':
+                continue
+            terms = g.out(qnam, 'HAS_CONTROLLED_TERM', 'Term') + \
+                [t for c in g.out(qnam, 'HAS_CODELIST') for t in g.out(c, 'HAS_TERM', 'Term')]
+            for t in dict.fromkeys(terms):
+                for suppd in g.inn(qnam, 'HAS_VARIABLE', 'Dataset'):
+                    for d in g.inn(suppd, 'SUPP_DATASET', 'Dataset'):
+                        if d.props.get('Dataset') == 'DM' and (t, qnam, suppd, d) not in rows:
+                            rows.append((t, qnam, suppd, d))
+        groups = defaultdict(list)
+        for row in rows:
+            t = row[0]
+            if t.props.get('Decoded Value') is None or t.props.get('Term') is None:
+                groups[None].append(row)
+            else:
+                groups[t.props['Decoded Value'] + ' (' + t.props['Term'] + ')'].append(row)
+        for label, coll in groups.items():
+            for t, qnam, suppd, d in coll:
+                if len(coll) == 1 and label is not None:
+                    g.add_label(t, 'Class')
+                    t.set('label', label)
+                    t.set('short_label', t.props.get('Term'))
+                    t.set('create', False)
+                    g.merge_relationship(d, t, label)
+                for ds in g.inn(qnam, 'HAS_VARIABLE', 'Dataset'):
+                    for qval in g.out(ds, 'HAS_VARIABLE', 'Variable'):
+                        if qval.props.get('Variable') != 'QVAL':
+                            continue
+                        for vl in g.out(qval, 'HAS_VALUE_LEVEL_METADATA', 'Valuelevel'):
+                            for wc in g.out(vl, 'HAS_WHERE_CLAUSE', 'Where Clause'):
+                                if qnam in g.out(wc, 'ON_VARIABLE') and t in g.out(wc, 'ON_VALUE'):
+                                    for vlterm in g.out(vl, 'HAS_VL_TERM', 'Term'):
+                                        g.merge_edge(t, 'HAS_CONTROLLED_TERM', vlterm)
+
+        # 'qualifies' Relationship between the dehl classes of the DataElements (or the DataElements themselves if
+        # they have no dehl class)
+        pairs = []
+        for x in g.nodes_with('DataElement'):
+            for y in g.out(x, 'qualifies', 'DataElement'):
+                for subj in g.out(x, 'SUBCLASS_OF', 'Class') or [x]:
+                    for core in g.out(y, 'SUBCLASS_OF', 'Class') or [y]:
+                        if 'Class' in subj.labels and 'Class' in core.labels and subj is not core and \
+                                (subj, core) not in pairs:
+                            pairs.append((subj, core))
+        for subj, core in pairs:
+            g.merge_relationship(subj, core, 'QUALIFIES')
+
+        # Custom links (business experience)
+        for row in BUSINESS_RELATIONSHIPS:
+            for left_c in [c for c in g.nodes_with('Class') if c.props.get('label') == row['left']]:
+                for right_c in [c for c in g.nodes_with('Class') if c.props.get('label') == row['right']]:
+                    g.merge_relationship(left_c, right_c, row['rel'])
+
+        # topics
+        def role_labels(role):
+            return [de.props.get('dataElementLabel') for de in g.nodes_with('DataElement')
+                    for der in g.out(de, 'dataElementRole', 'DataElementRole') if der.props.get('label') == role]
+        topics = [{"Short Name of Measurement, Test or Examination": "Name of Measurement, Test or Examination"}
+                  .get(topic, topic) for topic in role_labels('Topic Variable') + ["Dictionary-Derived Term"]]
+
+        # linking Result Qualifiers to topics (Findings)
+        findings_topics = [de2.props.get('dataElementLabel') for de2 in g.nodes_with('DataElement')
+                           for ctx in g.out(de2, 'context', 'VariableGrouping')
+                           if de2.props.get('dataElementLabel') in topics
+                           and ctx.props.get('contextLabel') == 'Findings Observation Class Variables']
+        for rq_class in role_labels('Result Qualifier'):
+            for topic in findings_topics:
+                for c in [c for c in g.nodes_with('Class') if c.props.get('label') == rq_class]:
+                    for c_topic in [c for c in g.nodes_with('Class') if c.props.get('label') == topic]:
+                        rels = [r for r in g.inn(c_topic, 'FROM', 'Relationship') if g.has_edge(r, 'TO', c)]
+                        if not rels:
+                            rels = [g.create_node(['Relationship'])]
+                            g.create_edge(rels[0], 'FROM', c_topic)
+                            g.create_edge(rels[0], 'TO', c)
+                        for r in rels:
+                            r.set('relationship_type', 'HAS_RESULT')
+
+        # linking grouping classes to topics
+        groupings = role_labels('Grouping Qualifier')
+        for topic in [c for c in g.nodes_with('Class') if c.props.get('label') in topics]:
+            for gr in [c for c in g.nodes_with('Class') if c.props.get('label') in groupings]:
+                g.merge_relationship(topic, gr, 'IN_CATEGORY')
+
+        # category to subcategory
+        for cat in [c for c in g.nodes_with('Class') if c.props.get('label') == 'Category']:
+            for scat in [c for c in g.nodes_with('Class') if c.props.get('label') == 'Subcategory']:
+                g.merge_relationship(cat, scat, 'HAS_SUBCATEGORY')
+
+    def validate(self) -> list:
+        """
+        :return: list of the problems found in the built graph (empty if it is valid):
+        relationships to missing nodes, Relationship nodes without relationship_type, FROM or TO
+        """
+        g = self.graph
+        errors = [f"Relationship {e.start}-[:{e.type}]->{e.end} to a missing node" for e in g.edges
+                  if e.start not in g.nodes or e.end not in g.nodes]
+        for rel in g.nodes_with('Relationship'):
+            if rel.props.get('relationship_type') is None:
+                errors.append(f"Relationship node {rel.key} has no relationship_type")
+            if not g.out(rel, 'FROM') or not g.out(rel, 'TO'):
+                errors.append(f"Relationship node {rel.key} ({rel.props.get('relationship_type')}) "
+                              f"is missing FROM or TO")
+        return errors
+
+    def term_class_labels(self) -> list:
+        """
+        :return: labels of the Classes with controlled terms (as generate_excel_based_model.get_term_classes)
+        """
+        g = self.graph
+        return [c.props['label'] for c in g.nodes_with('Class')
+                if c.props.get('label') is not None and self.controlled_terms(c)]
+
+    def controlled_terms(self, c: Node) -> list:
+        """
+        :param c: a node of the graph
+        :return: the Terms of c, resolved as controlled_terms.CONTROLLED_TERMS
+        """
+        g = self.graph
+        pooled = g.out(c, 'HAS_CONTROLLED_TERM', 'Term')
+        terms = []
+        for codelist in g.out(c, 'HAS_CODELIST', 'Codelist'):
+            for t in g.out(codelist, 'HAS_TERM', 'Term'):
+                terms += [p for p in g.out(t, 'TERM_POOLED_INTO', 'Term') if p in pooled] or [t]
+        return list(dict.fromkeys(terms + pooled))
+
+    def to_graph(self) -> dict:
+        """
+        :return: the built graph in the format of metadata_snapshot.read_snapshot
+        """
+        g = self.graph
+        return {
+            'labels': sorted({label for node in g.nodes.values() for label in node.labels}),
+            'nodes': [[node.key, node.labels, node.props] for node in g.nodes.values()],
+            'rels': [[e.start, e.type, e.end, {}] for e in g.edges],
+        }
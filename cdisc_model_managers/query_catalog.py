@@ -0,0 +1,144 @@
+import re
+from collections import Counter
+from contextlib import nullcontext
+
+
+class QueryCatalog:
+    """
+    Registry of the named, parameterized Cypher queries run by CdiscStandardLoader and CdiscModelManager.
+
+    Values (file names, domains, sort orders, ...) are always passed as query parameters so that the text of a named
+    query is the same on every call and Neo4j can reuse the cached plan. A name can only ever be registered with
+    one query text - registering a different text under an existing name raises a ValueError.
+
+    Labels cannot be parameterized in Cypher. They are written in the query as `<placeholder>` and substituted at
+    render time, but only with labels that were explicitly whitelisted: the allowed_labels passed to render/run
+    (NamedQueryMixin passes the labels allowed for the object running the query) or else the ones of allow_labels.
+    EXAMPLE:
+        MATCH (n:`<file>`) REMOVE n:`<file>` SET n:GOC      rendered with labels={'file': 'SDTM_v1.4.csv'}
+    """
+    LABEL_PLACEHOLDER = re.compile(r"`<(\w+)>`")
+
+    def __init__(self):
+        self.queries = {}
+        self.counts = Counter()
+        self.allowed_labels = set()
+        self._rendered = {}
+
+    def allow_labels(self, *labels: str) -> None:
+        """
+        :param labels: labels that can be substituted into `<placeholder>`s of the queries rendered without
+        allowed_labels
+        :return: None
+        """
+        self.allowed_labels.update(labels)
+
+    def register(self, name: str, q: str) -> None:
+        """
+        :param name: name of the query (EXAMPLE: 'reshape_model.relabel_goc')
+        :param q: Cypher query, with `<placeholder>`s for labels
+        :return: None
+        """
+        registered = self.queries.get(name)
+        if registered is None:
+            self.queries[name] = q
+        elif registered != q:
+            raise ValueError(f"Query {name} is already registered with a different text")
+
+    def render(self, name: str, labels: dict = None, allowed_labels: set = None) -> str:
+        """
+        :param name: name of a registered query
+        :param labels: dictionary with placeholder names as keys and (whitelisted) labels as values
+        :param allowed_labels: labels that can be substituted - if None the ones of allow_labels
+        :return: Cypher query with the label placeholders substituted
+        """
+        labels = labels or {}
+        if allowed_labels is None:
+            allowed_labels = self.allowed_labels
+        # the whitelist is checked on every call (the rendered queries are cached for all the whitelists)
+        for label in labels.values():
+            if label not in allowed_labels:
+                raise ValueError(f"Query {name}: label {label} is not whitelisted")
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self._rendered:
+            q = self.queries[name]
+            placeholders = set(self.LABEL_PLACEHOLDER.findall(q))
+            missing = placeholders - set(labels.keys())
+            if missing:
+                raise ValueError(f"Query {name}: no label provided for placeholders {sorted(missing)}")
+            self._rendered[key] = self.LABEL_PLACEHOLDER.sub(
+                lambda m: "`" + labels[m.group(1)].replace("`", "``") + "`", q
+            )
+        return self._rendered[key]
+
+    def run(self, neo, name: str, q: str = None, params: dict = None, labels: dict = None,
+            convert_dates: bool = True, allowed_labels: set = None):
+        """
+        Registers (if q is provided), renders and runs a named query
+        (through neo.profiler if it is set - see QueryProfiler)
+        :param neo: NeoInterface object to run the query with
+        :param name: name of the query
+        :param q: Cypher query, with `<placeholder>`s for labels
+        :param params: query parameters
+        :param labels: dictionary with placeholder names as keys and (whitelisted) labels as values
+        :param convert_dates: as in NeoInterface.query - if False the neo4j.time values are returned as they are
+        :param allowed_labels: labels that can be substituted - if None the ones of allow_labels
+        :return: result of NeoInterface.query
+        """
+        if q is not None:
+            self.register(name, q)
+        rendered = self.render(name, labels, allowed_labels)
+        self.counts[name] += 1
+        profiler = getattr(neo, 'profiler', None)
+        if profiler is not None:
+            return profiler.run(neo, name, rendered, params, convert_dates=convert_dates)
+        return neo.query(rendered, params, convert_dates=convert_dates)
+
+    def stats(self) -> list:
+        """
+        :return: list of {'name', 'count'} for each registered query, most called first
+        """
+        return [{'name': name, 'count': self.counts[name]}
+                for name in sorted(self.queries, key=lambda x: (-self.counts[x], x))]
+
+    def reset_counts(self) -> None:
+        self.counts.clear()
+
+
+QUERY_CATALOG = QueryCatalog()
+
+
+class NamedQueryMixin:
+    """
+    Runs queries through the shared QUERY_CATALOG (to be mixed into NeoInterface subclasses).
+    The labels that can be substituted into the queries are whitelisted per object with allow_labels
+    """
+    query_catalog = QUERY_CATALOG
+    profiler = None
+    allowed_labels = frozenset()
+
+    def allow_labels(self, *labels: str) -> None:
+        """
+        :param labels: labels that can be substituted into `<placeholder>`s of the queries run by this object
+        :return: None
+        """
+        self.allowed_labels = self.allowed_labels | set(labels)
+
+    def run_query(self, name: str, q: str = None, params: dict = None, labels: dict = None,
+                  convert_dates: bool = True):
+        return self.query_catalog.run(self, name, q, params, labels, convert_dates=convert_dates,
+                                      allowed_labels=self.allowed_labels)
+
+    def profile_stage(self, name: str):
+        """
+        :return: context manager attributing the queries run inside it to stage `name` of the profiler
+        (does nothing if no profiler is set)
+        """
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+
+    def profile_call(self, name: str):
+        """
+        :return: context manager recording the call run inside it as query `name` of the current stage of the
+        profiler - for the calls that do not go through run_query (does nothing if no profiler is set)
+        """
+        return self.profiler.time(name) if self.profiler is not None else nullcontext({'rows': 0, 'counters': {}})
@@ -0,0 +1,119 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class QueryProfiler:
+    """
+    Records wall time, number of rows returned and Neo4j update counters of every named query (see QueryCatalog)
+    run while it is set as the `profiler` of a CdiscStandardLoader/CdiscModelManager, rolled up per stage.
+    The other calls to the database (schema, file loads, n10s) are recorded with profile_call.
+    EXAMPLE:
+        loader.profiler = QueryProfiler()
+        with loader.profile_stage("reshape_model"):
+            loader.reshape_model()
+        loader.profiler.write_report("load_profile.json")
+    """
+    COUNTERS = ['nodes_created', 'nodes_deleted', 'relationships_created', 'relationships_deleted',
+                'properties_set', 'labels_added', 'labels_removed', 'indexes_added', 'constraints_added']
+    NO_STAGE = "(no stage)"
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.current_stage = self.NO_STAGE
+
+    def _stage(self, name: str) -> dict:
+        if name not in self.stages:
+            self.stages[name] = {'stage': name, 'seconds': 0.0, 'queries': OrderedDict()}
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager attributing the queries run inside it to stage `name` and timing it
+        """
+        previous, self.current_stage = self.current_stage, name
+        stage = self._stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage['seconds'] += time.perf_counter() - start
+            self.current_stage = previous
+
+    def run(self, neo, name: str, q: str, params: dict = None, convert_dates: bool = True) -> list:
+        """
+        Runs a query as NeoInterface.query does (returning the data as a list of dictionaries) and records it
+        :param neo: NeoInterface object to run the query with
+        :param name: name of the query
+        :param q: Cypher query
+        :param params: query parameters
+        :param convert_dates: as in NeoInterface.query
+        :return: list of dictionaries
+        """
+        start = time.perf_counter()
+        with neo.driver.session() as session:
+            result = session.run(q, params)
+            data = result.data()
+            counters = result.consume().counters
+        if convert_dates:
+            neo.update_values(source=data)
+        self.record(name, time.perf_counter() - start, len(data),
+                    {counter: getattr(counters, counter, 0) for counter in self.COUNTERS})
+        return data
+
+    @contextmanager
+    def time(self, name: str):
+        """
+        Context manager recording the call run inside it (e.g. a NeoInterface.create_index or n10s call that does
+        not go through the QueryCatalog, or a file load) as query `name`.
+        It yields a dictionary in which the number of rows and the update counters can be set
+        """
+        entry = {'rows': 0, 'counters': {}}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            self.record(name, time.perf_counter() - start, entry['rows'], entry['counters'])
+
+    def record(self, name: str, seconds: float, rows: int, counters: dict) -> None:
+        queries = self._stage(self.current_stage)['queries']
+        if name not in queries:
+            queries[name] = {'name': name, 'calls': 0, 'seconds': 0.0, 'rows': 0,
+                             **{counter: 0 for counter in self.COUNTERS}}
+        query = queries[name]
+        query['calls'] += 1
+        query['seconds'] += seconds
+        query['rows'] += rows
+        for counter in self.COUNTERS:
+            query[counter] += counters.get(counter, 0)
+
+    def report(self) -> dict:
+        """
+        :return: dictionary with the totals and the list of stages, each with its totals and its queries
+        (slowest first)
+        """
+        stages = []
+        for stage in self.stages.values():
+            queries = sorted(stage['queries'].values(), key=lambda x: -x['seconds'])
+            totals = {key: sum(query[key] for query in queries) for key in ['calls', 'rows'] + self.COUNTERS}
+            stages.append({'stage': stage['stage'], 'seconds': round(stage['seconds'], 3),
+                           'query_seconds': round(sum(query['seconds'] for query in queries), 3),
+                           **totals,
+                           'queries': [{**query, 'seconds': round(query['seconds'], 3)} for query in queries]})
+        return {
+            'seconds': round(sum(stage['seconds'] for stage in stages), 3),
+            'calls': sum(stage['calls'] for stage in stages),
+            'stages': stages,
+        }
+
+    def write_report(self, path: str) -> dict:
+        """
+        Writes the report (see report) as json to path
+        :return: the report
+        """
+        report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import hashlib
+
+# Datatypes converted to numbers/booleans when importing RDF into Neo4j (the rest are kept as strings as n10s does)
+XSD = "http://www.w3.org/2001/XMLSchema#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+INTEGER_TYPES = [XSD + t for t in ["integer", "long", "int", "short", "byte"]]
+FLOAT_TYPES = [XSD + t for t in ["decimal", "double", "float"]]
+BOOLEAN_TYPE = XSD + "boolean"
+
+TOKEN = re.compile(r"""
+    (?P<comment>\#[^\n]*)
+  | (?P<ws>\s+)
+  | (?P<prefix>@prefix)
+  | (?P<iri><[^<>\s]*>)
+  | (?P<literal>"(?:[^"\\]|\\.)*")(?:\^\^(?P<datatype><[^<>\s]*>|[A-Za-z][\w.-]*:[\w.-]*)|@(?P<lang>[A-Za-z-]+))?
+  | (?P<pname>[A-Za-z][\w.-]*:(?:[\w.-]*\w)?|:[\w.-]*\w)
+  | (?P<punct>[;,.])
+  | (?P<a>a\b)
+""", re.VERBOSE)
+ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def parse_turtle(text: str) -> list:
+    """
+    Parses the Turtle subset used by the CDISC RDF files (prefixes, IRIs, prefixed names, typed/language tagged
+    literals, ';' and ',' lists). Blank nodes, collections and multi-line literals are not supported.
+    :param text: Turtle document
+    :return: list of triples (subject, predicate, object); IRIs are returned as str and literals as
+    tuples (value, datatype IRI or None)
+    """
+    prefixes = {}
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = TOKEN.match(text, pos)
+        if not m:
+            raise ValueError(f"Unsupported Turtle syntax at position {pos}: {text[pos:pos + 50]!r}")
+        pos = m.end()
+        if m.lastgroup in ['comment', 'ws']:
+            continue
+        tokens.append(m)
+
+    def expand(m):
+        if m.group('iri'):
+            return m.group('iri')[1:-1]
+        prefix, local = m.group('pname').split(':', 1)
+        if prefix not in prefixes:
+            raise ValueError(f"Undefined prefix: {prefix}")
+        return prefixes[prefix] + local
+
+    def term(m):
+        if m.group('literal'):
+            value = re.sub(r'\\(.)', lambda x: ESCAPES.get(x.group(1), x.group(1)), m.group('literal')[1:-1])
+            datatype = m.group('datatype')
+            if datatype:
+                datatype = datatype[1:-1] if datatype.startswith('<') else expand(TOKEN.match(datatype))
+            return value, datatype
+        if m.group('a'):
+            return RDF_TYPE
+        return expand(m)
+
+    triples = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i].group('prefix'):
+            prefixes[tokens[i + 1].group('pname')[:-1]] = expand(tokens[i + 2])
+            i += 4
+            continue
+        subject = term(tokens[i])
+        i += 1
+        while True:
+            predicate = term(tokens[i])
+            i += 1
+            while True:
+                triples.append((subject, predicate, term(tokens[i])))
+                i += 1
+                if tokens[i].group('punct') != ',':
+                    break
+                i += 1
+            punct = tokens[i].group('punct')
+            i += 1
+            if punct == ';' and tokens[i].group('punct') == '.':
+                # trailing ';' before the final '.'
+                i += 1
+                break
+            if punct == '.':
+                break
+    return triples
+
+
+def local_name(iri: str) -> str:
+    return re.split(r'[#/]', iri)[-1]
+
+
+def literal_value(value: str, datatype: str):
+    if datatype in INTEGER_TYPES:
+        return int(value)
+    if datatype in FLOAT_TYPES:
+        return float(value)
+    if datatype == BOOLEAN_TYPE:
+        return value == "true"
+    return value
+
+
+def triples_to_graph(triples: list) -> dict:
+    """
+    Converts RDF triples into nodes and relationships the same way they are imported by n10s with
+    handleVocabUris: 'IGNORE' - rdf:type becomes a label (next to Resource), literals become properties and other
+    IRIs become relationships, all named by the local name of the IRI; subjects are identified by the uri property.
+    :param triples: list of triples as returned by parse_turtle
+    :return: dictionary {'nodes': [{'uri', 'labels', 'props'}], 'rels': [[from uri, type, to uri]]}
+    """
+    nodes = {}
+    rels = []
+
+    def node(uri):
+        if uri not in nodes:
+            nodes[uri] = {'uri': uri, 'labels': ['Resource'], 'props': {}}
+        return nodes[uri]
+
+    for subject, predicate, obj in triples:
+        n = node(subject)
+        if predicate == RDF_TYPE:
+            label = local_name(obj)
+            if label not in n['labels']:
+                n['labels'].append(label)
+        elif isinstance(obj, tuple):
+            n['props'][local_name(predicate)] = literal_value(*obj)
+        else:
+            node(obj)
+            rels.append([subject, local_name(predicate), obj])
+    return {'nodes': list(nodes.values()), 'rels': rels}
+
+
+def load_ttl_graph(path: str, cache_folder: str = None) -> dict:
+    """
+    Returns the nodes and relationships of a Turtle file (see triples_to_graph).
+    The parsed graph is cached as json in cache_folder keyed by the sha256 of the file, so the file is parsed
+    only once for as long as it does not change.
+    :param path: path of the Turtle file
+    :param cache_folder: directory for the cached graphs; no caching if None
+    :return: dictionary {'sha256', 'nodes', 'rels'}
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+    cache_file = None
+    if cache_folder:
+        cache_file = os.path.join(cache_folder, f"{os.path.basename(path)}.{sha256[:16]}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                graph = json.load(f)
+            if graph.get('sha256') == sha256:
+                return graph
+    graph = {'sha256': sha256, **triples_to_graph(parse_turtle(content.decode('utf-8')))}
+    if cache_file:
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(cache_file, 'w') as f:
+            json.dump(graph, f, separators=(',', ':'))
+    return graph
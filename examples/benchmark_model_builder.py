@@ -0,0 +1,72 @@
+"""
+Timing of the two ways of building the model from the bundled SDTMIG 3.2 metadata:
+CdiscStandardLoader.load_standard(direct=True) followed by CdiscModelManager.generate_excel_based_model (the model is
+generated in the database), and ModelBuilder.build followed by CdiscModelManager.load_built_model (the model is
+built in memory and written in one batched load).
+Each run starts from an empty database; the node/relationship counts of both paths are compared.
+Requires a running Neo4j with APOC and n10s (the database is cleaned).
+"""
+import time
+from cdisc_model_managers.cdisc_standard_loader import CdiscStandardLoader
+from cdisc_model_managers.cdisc_model_manager import CdiscModelManager
+from cdisc_model_managers.model_builder import ModelBuilder
+
+standards_folder = "cdisc_data"
+standards_model = "SDTM_v1.4.csv"
+standards_file = "SDTMIG_v3.2.csv"
+sdtm_terminology = "CT2022Q1_short.csv"
+repeat = 3
+
+
+def counts(mm: CdiscModelManager) -> dict:
+    q = """
+    MATCH (n)
+    WHERE any(label IN labels(n) WHERE label IN $labels)
+    WITH count(n) as nodes
+    MATCH (a)-[r]->(b)
+    WHERE any(label IN labels(a) WHERE label IN $labels) AND any(label IN labels(b) WHERE label IN $labels)
+    RETURN nodes, count(r) as relationships
+    """
+    return mm.query(q, {'labels': CdiscModelManager.SNAPSHOT_LABELS})[0]
+
+
+def run_generated(mm: CdiscModelManager) -> float:
+    mm.clean_slate()
+    start = time.perf_counter()
+    csl = CdiscStandardLoader(standards_folder=standards_folder, sdtm_file=standards_model,
+                              sdtmig_file=standards_file, terminology_file=sdtm_terminology)
+    csl.load_standard(direct=True, force=True)
+    mm.generate_excel_based_model()
+    return time.perf_counter() - start
+
+
+def run_built(mm: CdiscModelManager) -> float:
+    mm.clean_slate()
+    start = time.perf_counter()
+    builder = ModelBuilder(standards_folder, standards_model, standards_file, sdtm_terminology)
+    builder.build()
+    mm.load_built_model(builder)
+    return time.perf_counter() - start
+
+
+def main():
+    mm = CdiscModelManager()
+    results = {'generated': [], 'built': []}
+    for i in range(repeat):
+        results['generated'].append(run_generated(mm))
+        results['generated', 'counts'] = counts(mm)
+        results['built'].append(run_built(mm))
+        results['built', 'counts'] = counts(mm)
+
+    for variant in ['generated', 'built']:
+        c = results[variant, 'counts']
+        print(f"{variant}: {c['nodes']} nodes, {c['relationships']} relationships")
+    assert results['generated', 'counts'] == results['built', 'counts']
+    print(f"{'path':<12}{'best':>10}{'mean':>10}  ({repeat} runs, seconds)")
+    for variant in ['generated', 'built']:
+        times = results[variant]
+        print(f"{variant:<12}{min(times):>10.3f}{sum(times) / len(times):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Before/after benchmark of the set-based statements that replaced the per-row apoc.do.when calls of
+CdiscModelManager ("Creating Class from Variable" in generate_excel_based_model and the mapping of the columns in
+automap_excel_based_model - now joined in Python by automap_columns) on the bundled SDTMIG 3.2 metadata.
+
+The standard is loaded once and saved as a metadata snapshot; each run restores the snapshot, generates the model,
+adds one Source Data Table per dataset (with one Source Data Column per variable) and automaps it. The legacy run
+swaps the named queries for their previous apoc.do.when text. The queries are timed with QueryProfiler.
+Requires a running Neo4j with APOC (the database is cleaned).
+"""
+import os
+import tempfile
+from cdisc_model_managers.cdisc_standard_loader import CdiscStandardLoader
+from cdisc_model_managers.cdisc_model_manager import CdiscModelManager
+from cdisc_model_managers.query_profiler import QueryProfiler
+
+standards_folder = "cdisc_data"
+standards_model = "SDTM_v1.4.csv"
+standards_file = "SDTMIG_v3.2.csv"
+sdtm_terminology = "CT2022Q1_short.csv"
+repeat = 3
+
+LEGACY_CREATE_VARIABLE_CLASSES = """
+   MATCH (d:Dataset)-[:HAS_VARIABLE]->(v:Variable)
+   WHERE NOT
+       (
+           (v.Variable starts with 'COVAL' AND v.Variable <> 'COVAL')
+               OR
+           (v.Variable starts with 'TSVAL' AND NOT v.Variable in ['TSVAL', 'TSVALCD', 'TSVALNF'])
+       )
+   AND NOT EXISTS
+       (
+           (v)-[:IS_DATA_ELEMENT]->(:DataElement)
+       )
+   SET v:Class
+   SET v.label =
+       CASE WHEN v.n_with_same_label > 1 THEN
+           d.Description + ' ' + v.Label
+       ELSE
+           v.Label
+       END
+   SET v.short_label =
+       CASE WHEN v.n_with_same_name > 1 THEN
+             d.Dataset + v.Variable
+       ELSE
+             v.Variable
+       END
+   SET v.create = False
+   WITH d, v
+   CALL apoc.do.when(
+      d.Dataset in $datasets
+      ,
+      '
+      MERGE (d)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
+      WITH d, v
+      MATCH (s:Variable)
+      WHERE s.Dataset in $datasets AND s.Label = "Unique Subject Identifier"
+      MERGE (s)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
+      '
+      ,
+      '
+      MERGE (d)<-[:FROM]-(:Relationship{relationship_type:v.Label})-[:TO]->(v)
+      '
+      ,
+      {d:d, v:v, datasets:$datasets}
+   )
+   YIELD value
+   RETURN value
+   """
+
+LEGACY_MAP_DATASETS_AND_VARIABLES = """
+   MATCH (sdt:`Source Data Table`), (ds:Dataset)
+   WHERE sdt._domain_ = ds.Dataset
+   MERGE (sdt)-[:MAPS_TO_CLASS]->(ds)
+   WITH *
+   MATCH (ds)-[:HAS_VARIABLE]->(v:`Variable`),
+         (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+   WHERE sdc._columnname_ = v.Variable
+   CALL apoc.do.when(
+       v:Class,
+       '
+       WITH sdc, v
+       MERGE (sdc)-[:MAPS_TO_CLASS]->(v)
+       '
+       ,
+       '
+       WITH sdc, v
+       MATCH (v)-[:IS_DATA_ELEMENT]->()-[:SUBCLASS_OF]->(dehl)
+       MERGE (sdc)-[:MAPS_TO_CLASS]->(dehl)
+       '
+       ,
+       {sdc:sdc, v:v}
+   ) YIELD value
+   RETURN *
+   """
+
+LEGACY_MAP_SUPP_TERM_CLASSES = """
+   MATCH (t:Term:Class), (sdc:`Source Data Column`)
+   WHERE t.short_label = sdc._columnname_
+   MERGE (sdc)-[:MAPS_TO_CLASS]->(t)
+   """
+
+LEGACY_SET_COLUMN_ORDER_AND_CORE = """
+   MATCH (sdt:`Source Data Table`)-[:HAS_COLUMN]->(sdc:`Source Data Column`), (d:Dataset)-->(v:Variable)
+   WHERE sdt._domain_ = d.Dataset and sdc._columnname_ = v.Variable
+   SET sdc.Order = v.Order
+   SET sdc.Core = v.Core
+   """
+
+# the named queries of each step: set-based statements and their legacy replacement
+STEPS = {
+    'create_variable_classes': {
+        'set-based': ["generate_excel_based_model.create_variable_classes",
+                      "generate_excel_based_model.link_subject_variable_classes"],
+        'legacy': ["legacy.create_variable_classes"],
+    },
+    'map_columns': {
+        'set-based': ["automap_excel_based_model.map_datasets",
+                      "automap_columns.get_columns",
+                      "automap_columns.get_variables",
+                      "automap_columns.get_term_classes",
+                      "automap_columns.merge_maps_to_class",
+                      "automap_columns.set_order_and_core"],
+        'legacy': ["legacy.map_datasets_and_variables",
+                   "legacy.map_supp_term_classes",
+                   "legacy.set_column_order_and_core"],
+    },
+}
+
+
+class LegacyModelManager(CdiscModelManager):
+    """
+    Runs the previous apoc.do.when queries in place of the set-based statements (and the previous column mapping
+    queries in place of automap_columns)
+    """
+    def run_query(self, name: str, q: str = None, params: dict = None, labels: dict = None,
+                  convert_dates: bool = True):
+        if name == "generate_excel_based_model.create_variable_classes":
+            return super().run_query("legacy.create_variable_classes", LEGACY_CREATE_VARIABLE_CLASSES,
+                                     {'datasets': ['DM']})
+        if name == "automap_excel_based_model.map_datasets":
+            return super().run_query("legacy.map_datasets_and_variables", LEGACY_MAP_DATASETS_AND_VARIABLES)
+        if name == "generate_excel_based_model.link_subject_variable_classes":
+            return []
+        return super().run_query(name, q, params, labels, convert_dates=convert_dates)
+
+    def automap_columns(self, chunk_size: int = 10000) -> list:
+        self.run_query("legacy.map_supp_term_classes", LEGACY_MAP_SUPP_TERM_CLASSES)
+        self.run_query("legacy.set_column_order_and_core", LEGACY_SET_COLUMN_ORDER_AND_CORE)
+        return []
+
+
+def create_source_data(mm: CdiscModelManager) -> list:
+    # one Source Data Table per dataset with one Source Data Column per variable
+    q = """
+    MATCH (d:Dataset)-[:HAS_VARIABLE]->(v:Variable)
+    MERGE (sdt:`Source Data Table`{_domain_: d.Dataset})
+    MERGE (sdt)-[:HAS_COLUMN]->(sdc:`Source Data Column`{_columnname_: v.Variable, _domain_: d.Dataset})
+    RETURN DISTINCT d.Dataset as domain
+    """
+    return [r['domain'] for r in mm.query(q)]
+
+
+def run(csl: CdiscStandardLoader, mm: CdiscModelManager, snapshot: str) -> dict:
+    mm.clean_slate()
+    mm.restore_metadata_snapshot(snapshot)
+    csl.create_schema()
+    mm.profiler = QueryProfiler()
+    mm.generate_excel_based_model()
+    domains = create_source_data(mm)
+    mm.automap_excel_based_model(domain=domains, standard=standards_file)
+    queries = {query['name']: query['seconds'] for stage in mm.profiler.report()['stages']
+               for query in stage['queries']}
+    mm.profiler = None
+    counts = mm.query("""
+    MATCH (:`Source Data Column`)-[m:MAPS_TO_CLASS]->()
+    WITH count(m) as maps_to_class
+    MATCH (r:Relationship)
+    RETURN maps_to_class, count(r) as relationships
+    """)[0]
+    return {'queries': queries, 'counts': counts}
+
+
+def main():
+    csl = CdiscStandardLoader(standards_folder=standards_folder, sdtm_file=standards_model,
+                              sdtmig_file=standards_file, terminology_file=sdtm_terminology)
+    csl.clean_slate()
+    csl.load_standard(direct=True, force=True)
+    managers = {'legacy': LegacyModelManager(), 'set-based': CdiscModelManager()}
+    with tempfile.TemporaryDirectory() as folder:
+        snapshot = os.path.join(folder, "standard.json.gz")
+        managers['set-based'].export_metadata_snapshot(
+            snapshot, labels=CdiscModelManager.SNAPSHOT_LABELS + ["GOC", "Special_Purpose_Variable", "Resource"])
+        results = {variant: [] for variant in managers}
+        for i in range(repeat):
+            for variant, mm in managers.items():
+                results[variant].append(run(csl, mm, snapshot))
+
+    for variant in managers:
+        counts = results[variant][-1]['counts']
+        print(f"{variant}: {counts['maps_to_class']} MAPS_TO_CLASS, {counts['relationships']} Relationship nodes")
+    assert results['legacy'][-1]['counts'] == results['set-based'][-1]['counts']
+    print(f"{'step':<25}{'legacy':>10}{'set-based':>12}  (best of {repeat}, seconds)")
+    for step, variants in STEPS.items():
+        best = {variant: min(sum(r['queries'].get(name, 0) for name in variants[variant]) for r in results[variant])
+                for variant in variants}
+        print(f"{step:<25}{best['legacy']:>10.3f}{best['set-based']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
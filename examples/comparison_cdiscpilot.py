@@ -37,7 +37,7 @@ def main(data_folder, domains):
         sorting_var = [col for col in sorting_variable if col in df_input.columns]
         print(f'Sorting variables: {sorting_var}\n')
 
-        meta = dp.neo_get_meta(standard=standard_label, table=table[0])
+        meta = dp.get_meta(standard=standard_label, table=table[0])
 
         def _sorter(x):
             # Some columns don't have an order set, so create an artificial one
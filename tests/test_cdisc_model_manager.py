@@ -36,6 +36,31 @@ def test_set_sort_order(cdmm):
     assert res == ['Col 3', 'Col 1', 'Col 2']
 
 
+def test_set_sort_order_all_tables(cdmm):
+    cdmm.clean_slate()
+
+    q1 = '''
+    MERGE (sdf:`Data Extraction Standard`{_tag_:'standard1'})-[:HAS_TABLE]->(sdt1:`Source Data Table`{_domain_:'Domain 1'})
+    MERGE (sdf)-[:HAS_TABLE]->(sdt2:`Source Data Table`{_domain_:'Domain 2'})
+    MERGE (sdt1)-[:HAS_COLUMN]->(:`Source Data Column`{_columnname_: 'Col 1', Order: 2})
+    MERGE (sdt1)-[:HAS_COLUMN]->(:`Source Data Column`{_columnname_: 'Col 2', Order: 1})
+    MERGE (sdt2)-[:HAS_COLUMN]->(:`Source Data Column`{_columnname_: 'Col 3', Order: 2})
+    MERGE (sdt2)-[:HAS_COLUMN]->(:`Source Data Column`{_columnname_: 'Col 4', Order: 1})
+    '''
+    cdmm.query(q1)
+
+    assert cdmm.set_sort_order(standard='standard1') == 2
+
+    q1 = '''
+    MATCH (sdt:`Source Data Table`)
+    RETURN sdt._domain_ as domain, sdt.SortOrder as SortOrder
+    ORDER BY domain
+    '''
+    res = cdmm.query(q1)
+    assert res == [{'domain': 'Domain 1', 'SortOrder': ['Col 2', 'Col 1']},
+                   {'domain': 'Domain 2', 'SortOrder': ['Col 4', 'Col 3']}]
+
+
 def test_extend_extraction_metadata(cdmm):
     cdmm.clean_slate()
 
@@ -64,3 +89,124 @@ def test_extend_extraction_metadata(cdmm):
     expected_res = [{'x': {'Order': 2, '_columnname_': 'Col 1'}, 'y': {'label': 'Class 1'}},
                     {'x': {'Order': 3, '_columnname_': 'Col 2'}, 'y': {'label': 'Class 2'}}]
     assert res == expected_res
+
+
+def test_extend_extraction_metadata_counts(cdmm):
+    cdmm.clean_slate()
+
+    q1 = '''
+    MERGE (sdf:`Data Extraction Standard`{_tag_:'standard1'})-[:HAS_TABLE]->(sdt1:`Source Data Table`{_domain_:'Domain 1'})
+    MERGE (sdf)-[:HAS_TABLE]->(sdt2:`Source Data Table`{_domain_:'Domain 2'})
+    MERGE (sdt1)-[:HAS_COLUMN]->(sdc1:`Source Data Column`{_columnname_: 'Col 1'})
+    MERGE (sdt1)-[:HAS_COLUMN]->(sdc2:`Source Data Column`{_columnname_: 'Col 2'})
+    MERGE (sdt2)-[:HAS_COLUMN]->(sdc3:`Source Data Column`{_columnname_: 'Col 3'})
+
+    MERGE (sdc1)-[:MAPS_TO_CLASS]->(c1:Class{label: 'Class 1'})
+    MERGE (sdc2)-[:MAPS_TO_CLASS]->(c2:Class{label: 'Class 2'})
+    MERGE (sdc3)-[:MAPS_TO_CLASS]->(c1)
+    MERGE (c1)<-[:TO]-(r1:Relationship)-[:FROM]->(c3:Class{short_label:'Domain 1'})
+    MERGE (c2)<-[:TO]-(r2:Relationship)-[:FROM]->(c3)
+    MERGE (c1)<-[:TO]-(r3:Relationship)-[:FROM]->(c4:Class{short_label:'Domain 2'})
+    '''
+    cdmm.query(q1)
+
+    res = cdmm.extend_extraction_metadata(standard='standard1', chunk_size=1, workers=2)
+    assert res == {'Domain 1': 2, 'Domain 2': 1}
+    res = cdmm.extend_extraction_metadata(domain=['Domain 1', 'Domain 2'], standard='standard1')
+    assert res == {'Domain 1': 0, 'Domain 2': 0}
+
+
+def test_get_controlled_terms(cdmm):
+    cdmm.clean_slate()
+
+    q1 = '''
+    MERGE (c:Class{label: 'Class 1'})-[:HAS_CODELIST]->(cl:Codelist{Code: 'C1'})
+    MERGE (cl)-[:HAS_TERM]->(t1:Term{`rdfs:label`: 'A', `Codelist Code`: 'C1', `Term Code`: 'T1'})
+    MERGE (cl)-[:HAS_TERM]->(t2:Term{`rdfs:label`: 'B', `Codelist Code`: 'C1', `Term Code`: 'T2'})
+    MERGE (t2)-[:TERM_POOLED_INTO]->(p:Term{`rdfs:label`: 'B', `Codelist Code`: 'PC1', `Term Code`: 'PT2'})
+    MERGE (c)-[:HAS_CONTROLLED_TERM]->(p)
+    MERGE (c)-[:HAS_CONTROLLED_TERM]->(t3:Term{`rdfs:label`: 'C', `Codelist Code`: 'C2', `Term Code`: 'T3'})
+    MERGE (:Class{label: 'Class 2'})-[:HAS_CONTROLLED_TERM]->(t2)
+    '''
+    cdmm.query(q1)
+
+    res = cdmm.get_controlled_terms(labels=['Class 1'])
+    assert [t['Term Code'] for t in res['Class 1']] == ['T1', 'PT2', 'T3']
+    res = cdmm.get_controlled_terms()
+    assert [t['Term Code'] for t in res['Class 2']] == ['T2']
+
+
+def test_load_built_model(cdmm):
+    from cdisc_model_managers.cdisc_standard_loader import CdiscStandardLoader
+    from cdisc_model_managers.model_builder import ModelBuilder
+    standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+    files = ['SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv']
+
+    def model_counts():
+        # nodes per label and relationships per type between the metadata nodes
+        q = """
+        MATCH (n)
+        WHERE size(labels(n)) = 0 OR any(label IN labels(n) WHERE label IN $labels)
+        UNWIND CASE WHEN size(labels(n)) = 0 THEN [''] ELSE labels(n) END as label
+        RETURN label, count(*) as n
+        """
+        nodes = {r['label']: r['n'] for r in cdmm.query(q, {'labels': CdiscModelManager.SNAPSHOT_LABELS})}
+        q = """
+        MATCH (a)-[r]->(b)
+        WHERE any(label IN labels(a) WHERE label IN $labels) AND any(label IN labels(b) WHERE label IN $labels)
+        RETURN type(r) as type, count(r) as n
+        """
+        rels = {r['type']: r['n'] for r in cdmm.query(q, {'labels': CdiscModelManager.SNAPSHOT_LABELS})}
+        return nodes, rels
+
+    cdmm.clean_slate()
+    csl = CdiscStandardLoader(standards_folder, *files)
+    csl.load_standard(direct=True, force=True)
+    cdmm.generate_excel_based_model()
+    generated = model_counts()
+    assert '' not in generated[0]  # no unlabelled nodes (e.g. from an unbound MERGE)
+    q = "MATCH (:Class)<-[:FROM]-(:Relationship{relationship_type: 'QUALIFIES'})-[:TO]->(:Class) RETURN count(*) as n"
+    assert cdmm.query(q)[0]['n'] > 0
+
+    cdmm.clean_slate()
+    builder = ModelBuilder(standards_folder, *files)
+    builder.build()
+    cdmm.load_built_model(builder)
+    assert model_counts() == generated
+
+
+def test_codelist_only_mode_travels_with_the_metadata(cdmm, tmp_path):
+    from cdisc_model_managers.model_builder import ModelBuilder
+    standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+    cdmm.clean_slate()
+    builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv',
+                           codelist_only=True)
+    builder.build()
+    cdmm.load_built_model(builder)
+    assert cdmm.is_codelist_only()
+
+    path = str(tmp_path / "snapshot.json.gz")
+    cdmm.export_metadata_snapshot(path)
+    cdmm.clean_slate()
+    cdmm.restore_metadata_snapshot(path)
+    assert cdmm.is_codelist_only()
+
+
+def test_export_metadata_snapshot_after_load_standard(cdmm, tmp_path):
+    from cdisc_model_managers.cdisc_standard_loader import CdiscStandardLoader
+    standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+    cdmm.clean_slate()
+    csl = CdiscStandardLoader(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    csl.load_standard(direct=True, force=True)
+    q = """
+    MATCH (f:`Standard Load Fingerprint`)
+    RETURN apoc.meta.cypher.type(f.loaded_at) as type, toString(f.loaded_at) as loaded_at
+    """
+    saved = cdmm.query(q)
+    assert saved[0]['type'] == 'DATE_TIME'
+
+    path = str(tmp_path / "snapshot.json.gz")
+    cdmm.export_metadata_snapshot(path)
+    cdmm.clean_slate()
+    cdmm.restore_metadata_snapshot(path)
+    assert cdmm.query(q) == saved
@@ -0,0 +1,247 @@
+import os
+import json
+import shutil
+import pytest
+from cdisc_model_managers.cdisc_standard_loader import CdiscStandardLoader
+
+filepath = os.path.dirname(__file__)
+standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+
+
+class FingerprintLoader(CdiscStandardLoader):
+    """
+    CdiscStandardLoader without a database connection: the saved fingerprint is held in memory and the stages only
+    record that they were run
+    """
+    def __init__(self, folder: str, saved: dict = None):
+        self.standards_folder = folder
+        self.sdtm_file = 'SDTM_v1.4.csv'
+        self.sdtmig_file = 'SDTMIG_v3.2.csv'
+        self.terminology_file = 'CT2022Q1_short.csv'
+        self.codelist_only = False
+        self.saved = saved
+        self.run = []
+
+    def get_fingerprint(self) -> dict:
+        return self.saved
+
+    def save_fingerprint(self, fingerprint: dict):
+        self.saved = {**fingerprint, 'loaded_at': 'now'}
+
+    def set_domain_labels(self, reset=False):
+        self.run.append('set_domain_labels')
+
+    def set_domain_sort_order(self, reset=False):
+        self.run.append('set_domain_sort_order')
+
+
+@pytest.fixture
+def folder(tmp_path):
+    # copy of the standards folder, so that the input files can be changed
+    for file in os.listdir(standards_folder):
+        shutil.copy(os.path.join(standards_folder, file), tmp_path)
+    return str(tmp_path)
+
+
+def touch(folder: str, file: str):
+    with open(os.path.join(folder, file), 'a') as f:
+        f.write("\n")
+
+
+def test_changed_stages_no_saved_fingerprint(folder):
+    csl = FingerprintLoader(folder)
+    assert csl.changed_stages(csl.input_fingerprint()) is None
+
+
+def test_changed_stages_unchanged(folder):
+    csl = FingerprintLoader(folder)
+    csl.saved = {**csl.input_fingerprint(), 'loaded_at': 'before'}
+    assert csl.changed_stages(csl.input_fingerprint()) == []
+
+
+def test_changed_stages_partial(folder):
+    csl = FingerprintLoader(folder)
+    csl.saved = csl.input_fingerprint()
+    touch(folder, CdiscStandardLoader.DOMAIN_SORT_ORDER_FILE)
+    assert csl.changed_stages(csl.input_fingerprint()) == ['set_domain_sort_order']
+    touch(folder, CdiscStandardLoader.DOMAIN_LABELS_FILE)
+    assert csl.changed_stages(csl.input_fingerprint()) == ['set_domain_labels', 'set_domain_sort_order']
+
+
+@pytest.mark.parametrize("change", ['loader_version', 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv',
+                                    CdiscStandardLoader.TTL_FILE, 'extract_terms', 'codelist_only'])
+def test_changed_stages_full(folder, change):
+    csl = FingerprintLoader(folder)
+    csl.saved = csl.input_fingerprint()
+    fingerprint = csl.input_fingerprint()
+    if change == 'loader_version':
+        fingerprint['loader_version'] += 1
+    elif change == 'extract_terms':
+        fingerprint = csl.input_fingerprint(extract_terms=False)
+    elif change == 'codelist_only':
+        csl.codelist_only = True
+        fingerprint = csl.input_fingerprint()
+    else:
+        touch(folder, change)
+        touch(folder, CdiscStandardLoader.DOMAIN_LABELS_FILE)  # a partial change does not avoid the full load
+        fingerprint = csl.input_fingerprint()
+    assert csl.changed_stages(fingerprint) is None
+
+
+def test_load_standard_skip_and_partial(folder):
+    csl = FingerprintLoader(folder)
+    csl.saved = csl.input_fingerprint()
+    assert csl.load_standard() == []
+    assert csl.run == []
+
+    touch(folder, CdiscStandardLoader.DOMAIN_SORT_ORDER_FILE)
+    assert csl.load_standard() == ['set_domain_sort_order']
+    assert csl.run == ['set_domain_sort_order']
+    # the new fingerprint is saved: the next load is skipped
+    assert csl.load_standard() == []
+    assert csl.run == ['set_domain_sort_order']
+
+
+def domains_and_variables(csl: CdiscStandardLoader) -> tuple:
+    q = """
+    MATCH (d:Domain)
+    RETURN d.Domain as domain, d.label as label, d.Description as description, d.`Sort Order` as sort_order
+    ORDER BY domain
+    """
+    domains = csl.query(q)
+    q = """
+    MATCH (v:Variable)
+    RETURN v.`Dataset Name` as dataset, v.`Variable Name` as variable, v.Order as order
+    ORDER BY dataset, variable
+    """
+    return domains, csl.query(q)
+
+
+def test_load_standard_partial_same_as_full(folder):
+    csl = CdiscStandardLoader(folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    csl.clean_slate()
+    csl.load_standard(direct=True, force=True)
+
+    # new release of the domain labels and sort order without AE
+    for file, key in [(CdiscStandardLoader.DOMAIN_LABELS_FILE, 'domain_labels'),
+                      (CdiscStandardLoader.DOMAIN_SORT_ORDER_FILE, 'domain_sort_order')]:
+        with open(os.path.join(folder, file)) as f:
+            json_data = json.load(f)
+        del json_data[key]['AE']
+        with open(os.path.join(folder, file), 'w') as f:
+            json.dump(json_data, f)
+
+    csl = CdiscStandardLoader(folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    assert csl.load_standard(direct=True) == ['set_domain_labels', 'set_domain_sort_order']
+    partial = domains_and_variables(csl)
+    ae = [domain for domain in partial[0] if domain['domain'] == 'AE']
+    assert ae == [{'domain': 'AE', 'label': None, 'description': None, 'sort_order': None}]
+
+    csl.clean_slate()
+    csl.load_standard(direct=True, force=True)
+    assert domains_and_variables(csl) == partial
+
+
+def test_load_terminology_delta(folder):
+    csl = CdiscStandardLoader(folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    csl.clean_slate()
+    csl.load_standard(direct=True, force=True)
+    # a Class of the model linked to the Term that is retired
+    csl.query("""
+    MATCH (t:Term{Code: 'C17998', `Codelist Code`: 'C66742'})
+    MERGE (:Class{label: 'Model Class'})-[:HAS_CONTROLLED_TERM]->(t)
+    """)
+
+    # new release: 'U' retired, 'NA' updated, 'X' inserted in the No Yes Response codelist
+    with open(os.path.join(folder, 'CT2022Q1_short.csv')) as f:
+        lines = f.read().splitlines()
+    lines = [line for line in lines if not line.startswith('"C17998"')]
+    lines = [line.replace('"Not Applicable","SDTM CT', '"Not Applicable (updated)","SDTM CT')
+             if line.startswith('"C48660"') else line for line in lines]
+    lines.append('"C99999","C66742",,"No Yes Response","X","Other","Test term.","Other","SDTM CT 2022-06-24"')
+    with open(os.path.join(folder, 'CT2022Q2_short.csv'), 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+    res = csl.load_terminology_delta('CT2022Q2_short.csv')
+    assert res == {'inserted': 1, 'updated': 1, 'retired': 1, 'codelists': 1}
+    assert csl.terminology_file == 'CT2022Q1_short.csv'
+
+    q = """
+    MATCH (n{`Codelist Code`: 'C66742'})
+    OPTIONAL MATCH (c:Codelist)-[:HAS_TERM]->(n)
+    OPTIONAL MATCH (v:Variable)-[:HAS_CONTROLLED_TERM]->(n)
+    OPTIONAL MATCH (m:Class{label: 'Model Class'})-[:HAS_CONTROLLED_TERM]->(n)
+    RETURN n.Code as code, labels(n) as labels, n.`NCI Preferred Term` as preferred, n.`Retired By` as retired_by,
+           count(DISTINCT c) as codelists, count(DISTINCT v) as variables, count(DISTINCT m) as model_classes
+    """
+    terms = {r['code']: r for r in csl.query(q)}
+    assert sorted(terms) == ['C17998', 'C48660', 'C49487', 'C49488', 'C99999']
+    q = "MATCH (v:Variable{`Codelist Code`: 'C66742'}) RETURN count(v) as n"
+    n_variables = csl.query(q)[0]['n']
+    assert n_variables > 0
+    retired = terms['C17998']
+    assert retired['labels'] == ['Retired Term'] and retired['retired_by'] == 'CT2022Q2_short.csv'
+    assert (retired['codelists'], retired['variables'], retired['model_classes']) == (0, 0, 1)
+    updated = terms['C48660']
+    assert updated['preferred'] == 'Not Applicable (updated)'
+    assert updated['codelists'] == 1 and updated['variables'] >= n_variables
+    inserted = terms['C99999']
+    assert inserted['labels'] == ['Term']
+    assert inserted['codelists'] == 1 and inserted['variables'] >= n_variables
+
+    fingerprint = csl.get_fingerprint()
+    assert fingerprint['terminology_file'] == 'CT2022Q2_short.csv'
+    assert csl.changed_stages(csl.input_fingerprint()) is None
+
+
+def test_model_builder_fingerprint():
+    from cdisc_model_managers.model_builder import ModelBuilder
+    csl = FingerprintLoader(standards_folder)
+    csl.codelist_only = True
+    builder = ModelBuilder(standards_folder, csl.sdtm_file, csl.sdtmig_file, csl.terminology_file, codelist_only=True)
+    assert builder.input_fingerprint(extract_vld=False) == csl.input_fingerprint(extract_vld=False)
+
+
+def test_load_standard_rf_variables_of_dm():
+    csl = CdiscStandardLoader(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    csl.clean_slate()
+    csl.load_standard(direct=True, force=True)
+    q = """
+    MATCH (v:Variable)
+    WHERE v.`Dataset Name` IN ['DM', 'AE'] AND v.Variable IN ['RFSTDTC', 'RFENDTC', 'AESTDTC']
+    RETURN v.Variable as variable, v.dataElementName as name, exists((v)-[:IS_DATA_ELEMENT]->()) as linked
+    ORDER BY variable
+    """
+    assert csl.query(q) == [{'variable': 'AESTDTC', 'name': '--STDTC', 'linked': True},
+                            {'variable': 'RFENDTC', 'name': None, 'linked': False},
+                            {'variable': 'RFSTDTC', 'name': None, 'linked': False}]
+
+
+class TtlLoader(FingerprintLoader):
+    """
+    FingerprintLoader recording the n10s and bulk imports of the TTL file (the queries return no rows)
+    """
+    def rdf_config(self):
+        self.run.append('rdf_config')
+
+    def import_ttl(self, filename: str = None, cache_folder: str = None, chunk_size: int = 10000):
+        self.run.append('import_ttl')
+
+    def rdf_import_subgraph_inline(self, rdf: str, format: str):
+        self.run.append('rdf_import_subgraph_inline')
+
+    def create_index(self, label: str, key: str):
+        pass
+
+    def run_query(self, name: str, q: str, params: dict = None, labels: dict = None, convert_dates: bool = True):
+        return []
+
+    def compute_statistics(self):
+        pass
+
+
+@pytest.mark.parametrize("bulk, run", [(True, ['import_ttl']), (False, ['rdf_config', 'rdf_import_subgraph_inline'])])
+def test_load_link_sdtm_ttl_n10s_only_when_not_bulk(bulk, run):
+    csl = TtlLoader(standards_folder)
+    csl.load_link_sdtm_ttl(bulk=bulk)
+    assert csl.run == run
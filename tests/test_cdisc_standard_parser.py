@@ -0,0 +1,155 @@
+import os
+from cdisc_model_managers import cdisc_standard_parser
+
+filepath = os.path.dirname(__file__)
+standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+
+
+def test_read_standard_csv():
+    rows = cdisc_standard_parser.read_standard_csv(standards_folder, 'SDTM_v1.4.csv')
+    assert len(rows) == 339
+    assert rows[0]['Variable Name'] == 'STUDYID'
+    assert rows[0]['Variable Order'] == 1
+    assert rows[0]['Dataset Name'] == ''
+    assert rows[0]['_domain_'] == 'SDTM_V1.4'
+    assert rows[0]['_filename_'] == 'SDTM_v1.4.csv'
+    # empty numeric column is not loaded
+    assert 'Controlled Terms, Codelist or Format' not in rows[0]
+
+
+def test_split_sdtm_rows():
+    rows = [{'Dataset Name': '', 'Variable Name': 'STUDYID'}, {'Dataset Name': 'DM', 'Variable Name': 'AGE'}]
+    gocs, special_purpose = cdisc_standard_parser.split_sdtm_rows(rows)
+    assert gocs == [{'Dataset Name': '', 'Variable Name': 'STUDYID'}]
+    assert special_purpose == [{'Dataset Name': 'DM', 'Variable Name': 'AGE'}]
+
+
+def test_sdtmig_variable_rows():
+    rows = [
+        {'Variable Name': 'AESEV', 'Variable Label': 'Severity/Intensity', 'CDISC CT Codelist Code(s)': 'C66769',
+         'Value List': ''},
+        {'Variable Name': 'DOMAIN', 'Variable Label': 'Domain Abbreviation', 'CDISC CT Codelist Code(s)': '',
+         'Value List': 'AE'},
+    ]
+    res = cdisc_standard_parser.sdtmig_variable_rows(rows)
+    assert res[0] == {'Variable Name': 'AESEV', 'Variable Label': 'Severity/Intensity',
+                      'CDISC CT Codelist Code(s)': 'C66769', 'Variable': 'AESEV', 'Label': 'Severity/Intensity',
+                      'Codelist Code': 'C66769'}
+    assert res[1] == {'Variable Name': 'DOMAIN', 'Variable Label': 'Domain Abbreviation',
+                      'CDISC CT Codelist Code(s)': '', 'Value List': 'AE', 'Variable': 'DOMAIN',
+                      'Label': 'Domain Abbreviation'}
+    # input rows are not modified
+    assert 'Variable' not in rows[0]
+
+
+def test_split_terminology_rows():
+    rows = cdisc_standard_parser.read_standard_csv(standards_folder, 'CT2022Q1_short.csv')
+    codelists, terms = cdisc_standard_parser.split_terminology_rows(rows)
+    assert len(codelists) + len(terms) == len(rows)
+    assert all(codelist['Codelist Code'] == '' for codelist in codelists)
+    term = [t for t in terms if t['Code'] == 'C49487'][0]
+    assert term['Term'] == 'N'
+    assert term['NCI Codelist Code'] == 'C66742'
+    assert term['NCI Term Code'] == 'C49487'
+
+
+def test_resolve_domain_sort_order():
+    domains, variables = cdisc_standard_parser.resolve_domain_sort_order({
+        'DM': 'STUDYID,USUBJID',
+        'CO': 'STUDYID,USUBJID,COSEQ',
+        'AE': 'STUDYID,USUBJID,AEDECOD',
+    })
+    assert domains == [
+        {'domain': 'DM', 'sort_order': 'STUDYID,USUBJID'},
+        {'domain': 'CO', 'sort_order': 'STUDYID,USUBJID,COSEQ'},
+        {'domain': 'AE', 'sort_order': 'STUDYID,USUBJID,AEDECOD'},
+    ]
+    assert [(v['variable'], v['order']) for v in variables if v['domain'] == 'DM'] == [('STUDYID', 1), ('USUBJID', 2)]
+    assert [(v['variable'], v['order']) for v in variables if v['domain'] == 'CO'] == \
+           [('STUDYID', 1), ('USUBJID', 2), ('COSEQ', 3)]
+    # --SEQ is appended when not mentioned
+    assert [(v['variable'], v['order']) for v in variables if v['domain'] == 'AE'] == \
+           [('STUDYID', 1), ('USUBJID', 2), ('AEDECOD', 3), ('AESEQ', 4)]
+
+
+def test_match_data_elements():
+    data_elements = [
+        {'name': 'STUDYID', 'label': 'Study Identifier'},
+        {'name': '--TESTCD', 'label': 'Short Name of Measurement, Test or Examination'},
+        {'name': '--STDTC', 'label': 'Start Date/Time of Observation'},
+    ]
+    variables = [
+        {'id': 1, 'variable': 'STUDYID', 'dataset': 'LB'},
+        {'id': 2, 'variable': 'LBTESTCD', 'dataset': 'LB'},
+        {'id': 3, 'variable': 'IETESTCD', 'dataset': 'TI'},
+        {'id': 4, 'variable': 'AESTDTC', 'dataset': 'AE'},
+        {'id': 5, 'variable': 'RFSTDTC', 'dataset': 'DM'},
+        {'id': 6, 'variable': 'LBXTESTCD', 'dataset': 'LB'},
+        {'id': 7, 'variable': 'TESTCD', 'dataset': 'LB'},
+    ]
+    res = cdisc_standard_parser.match_data_elements(variables, data_elements)
+    assert [(r['id'], r['dataElementName']) for r in res] == [
+        (1, 'STUDYID'), (2, '--TESTCD'), (3, '--TESTCD'), (4, '--STDTC')
+    ]
+    assert res[1]['dataElementLabel'] == 'Short Name of Measurement, Test or Examination'
+
+
+def test_diff_terminology():
+    loaded = [
+        {'id': 1, 'label': 'Codelist', 'props': {'Codelist Code': '', 'Code': 'C66742', 'Codelist Name': 'No Yes'}},
+        {'id': 2, 'label': 'Term', 'props': {'Codelist Code': 'C66742', 'Code': 'C49487', 'Term': 'N',
+                                             '_filename_': 'CT_old.csv'}},
+        {'id': 3, 'label': 'Term', 'props': {'Codelist Code': 'C66742', 'Code': 'C49488', 'Term': 'Y'}},
+    ]
+    rows = [
+        {'label': 'Codelist', 'props': {'Codelist Code': '', 'Code': 'C66742', 'Codelist Name': 'No Yes Response'}},
+        {'label': 'Term', 'props': {'Codelist Code': 'C66742', 'Code': 'C49487', 'Term': 'N',
+                                    '_filename_': 'CT_new.csv'}},
+        {'label': 'Term', 'props': {'Codelist Code': 'C66742', 'Code': 'C48660', 'Term': 'NA'}},
+    ]
+    inserts, updates, retirements = cdisc_standard_parser.diff_terminology(loaded, rows)
+    assert inserts == [rows[2]]
+    assert updates == [{'id': 1, 'label': 'Codelist', 'props': {'Codelist Name': 'No Yes Response'}}]
+    assert retirements == [loaded[2]]
+
+
+def test_metadata_statistics():
+    de_rows, variable_rows = cdisc_standard_parser.metadata_statistics(
+        [
+            {'id': 1, 'name': '--TESTCD', 'vg': 'Findings Observation Class Variables'},
+            {'id': 2, 'name': '--DTC', 'vg': 'General Observation Class Timing Variables'},
+            {'id': 3, 'name': '--TESTCD', 'vg': 'Findings About Events or Interventions Variables'},
+            {'id': 4, 'name': 'STUDYID', 'vg': None},
+        ],
+        [
+            {'id': 5, 'label': 'Study Identifier', 'name': 'STUDYID'},
+            {'id': 6, 'label': 'Study Identifier', 'name': 'STUDYID'},
+            {'id': 7, 'label': 'Severity/Intensity', 'name': 'AESEV'},
+        ]
+    )
+    assert de_rows == [
+        {'id': 1, 'vg': 'Findings Observation Class Variables', 'vg_short': 'Findings', 'n_with_same_name': 2},
+        {'id': 2, 'vg': 'General Observation Class Timing Variables', 'vg_short': 'GO Timing', 'n_with_same_name': 1},
+        {'id': 3, 'vg': 'Findings About Events or Interventions Variables', 'vg_short': 'FA', 'n_with_same_name': 2},
+        {'id': 4, 'vg': None, 'vg_short': None, 'n_with_same_name': 1},
+    ]
+    assert variable_rows == [
+        {'id': 5, 'n_with_same_label': 2, 'n_with_same_name': 2},
+        {'id': 6, 'n_with_same_label': 2, 'n_with_same_name': 2},
+        {'id': 7, 'n_with_same_label': 1, 'n_with_same_name': 1},
+    ]
+
+
+def test_automap_columns():
+    columns = [{'id': 1, 'table': 'AE', 'column': 'AETERM'}, {'id': 2, 'table': 'AE', 'column': 'USUBJID'},
+               {'id': 3, 'table': 'SUPPAE', 'column': 'AETRTEM'}, {'id': 4, 'table': 'AE', 'column': 'AEXYZ'}]
+    variables = [
+        {'id': 10, 'table': 'AE', 'column': 'AETERM', 'is_class': False, 'Order': 3, 'Core': 'Req', 'dehl_ids': [20]},
+        {'id': 11, 'table': 'AE', 'column': 'USUBJID', 'is_class': True, 'Order': 2, 'Core': 'Req', 'dehl_ids': []},
+        {'id': 12, 'table': 'DM', 'column': 'USUBJID', 'is_class': True, 'Order': 2, 'Core': 'Req', 'dehl_ids': []},
+    ]
+    term_classes = [{'id': 30, 'short_label': 'AETRTEM'}]
+    maps, properties, unmapped = cdisc_standard_parser.automap_columns(columns, variables, term_classes)
+    assert maps == [{'sdc': 1, 'class_id': 20}, {'sdc': 2, 'class_id': 11}, {'sdc': 3, 'class_id': 30}]
+    assert properties == [{'id': 1, 'Order': 3, 'Core': 'Req'}, {'id': 2, 'Order': 2, 'Core': 'Req'}]
+    assert unmapped == [{'table': 'AE', 'column': 'AEXYZ'}]
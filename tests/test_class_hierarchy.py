@@ -0,0 +1,20 @@
+from cdisc_model_managers.class_hierarchy import subclass_closure
+
+
+def test_subclass_closure():
+    # de -> dehl -> oc -> record, dataset -> oc, with a cycle between 5 and 6
+    edges = [[1, 2], [2, 3], [3, 4], [7, 3], [5, 6], [6, 5]]
+    closure = {(row['descendant'], row['ancestor']): row['depth'] for row in subclass_closure(edges)}
+    assert closure == {
+        (1, 2): 1, (1, 3): 2, (1, 4): 3,
+        (2, 3): 1, (2, 4): 2,
+        (3, 4): 1,
+        (7, 3): 1, (7, 4): 2,
+        (5, 6): 1, (6, 5): 1,
+    }
+
+
+def test_subclass_closure_shortest_depth():
+    edges = [[1, 2], [2, 3], [1, 3]]
+    closure = {(row['descendant'], row['ancestor']): row['depth'] for row in subclass_closure(edges)}
+    assert closure == {(1, 2): 1, (1, 3): 1, (2, 3): 1}
@@ -0,0 +1,64 @@
+import gzip
+import json
+import pytest
+from cdisc_model_managers import metadata_snapshot
+
+
+def test_write_read_snapshot(tmpdir):
+    path = str(tmpdir.join('metadata.json.gz'))
+    nodes = [{'id': 1, 'labels': ['Class', 'Dataset'], 'props': {'label': 'AE', 'Dataset': 'AE'}},
+             {'id': 2, 'labels': ['Class'], 'props': {'label': 'Subject'}}]
+    rels = [{'from_id': 1, 'type': 'SUBCLASS_OF', 'to_id': 2, 'props': {}}]
+    metadata_snapshot.write_snapshot(path, ['Class'], nodes, rels)
+    snapshot = metadata_snapshot.read_snapshot(path)
+    assert snapshot['labels'] == ['Class']
+    assert snapshot['nodes'] == [[1, ['Class', 'Dataset'], {'label': 'AE', 'Dataset': 'AE'}],
+                                 [2, ['Class'], {'label': 'Subject'}]]
+    assert snapshot['rels'] == [[1, 'SUBCLASS_OF', 2, {}]]
+
+
+def test_read_snapshot_other_version(tmpdir):
+    path = str(tmpdir.join('metadata.json.gz'))
+    with gzip.open(path, 'wt') as f:
+        json.dump({'format': metadata_snapshot.SNAPSHOT_FORMAT, 'version': 0, 'nodes': [], 'rels': []}, f)
+    with pytest.raises(ValueError):
+        metadata_snapshot.read_snapshot(path)
+
+
+def test_write_read_snapshot_temporal_values(tmpdir):
+    import neo4j.time
+    from datetime import timezone
+    path = str(tmpdir.join('metadata.json.gz'))
+    props = {
+        'loaded_at': neo4j.time.DateTime(2023, 6, 6, 12, 30, 15, 250000000, tzinfo=timezone.utc),
+        'released': neo4j.time.Date(2022, 3, 25),
+        'at': neo4j.time.Time(8, 0, 0),
+        'ttl': neo4j.time.Duration(days=1, seconds=30),
+        'dates': [neo4j.time.Date(2022, 1, 1), neo4j.time.Date(2022, 2, 1)],
+        'codes': ['C1', 'C2'],
+    }
+    nodes = [{'id': 1, 'labels': ['Standard Load Fingerprint'], 'props': props}]
+    metadata_snapshot.write_snapshot(path, ['Standard Load Fingerprint'], nodes, [])
+    snapshot = metadata_snapshot.read_snapshot(path)
+    restored = snapshot['nodes'][0][2]
+    assert restored == props
+    assert all(type(restored[key]) is type(props[key]) for key in props)
+
+
+def test_write_snapshot_unsupported_value(tmpdir):
+    path = str(tmpdir.join('metadata.json.gz'))
+    nodes = [{'id': 1, 'labels': ['Class'], 'props': {'label': 'AE', 'data': b'\x00'}}]
+    with pytest.raises(TypeError):
+        metadata_snapshot.write_snapshot(path, ['Class'], nodes, [])
+
+
+def test_write_read_snapshot_native_temporal_values(tmpdir):
+    import neo4j.time
+    from datetime import datetime, date, timezone
+    path = str(tmpdir.join('metadata.json.gz'))
+    props = {'loaded_at': datetime(2023, 6, 6, 12, 30, 15, 250000, tzinfo=timezone.utc), 'released': date(2022, 3, 25)}
+    metadata_snapshot.write_snapshot(path, ['Standard Load Fingerprint'],
+                                     [{'id': 1, 'labels': ['Standard Load Fingerprint'], 'props': props}], [])
+    restored = metadata_snapshot.read_snapshot(path)['nodes'][0][2]
+    assert restored == {'loaded_at': neo4j.time.DateTime(2023, 6, 6, 12, 30, 15, 250000000, tzinfo=timezone.utc),
+                        'released': neo4j.time.Date(2022, 3, 25)}
@@ -0,0 +1,93 @@
+import os
+from cdisc_model_managers.model_builder import ModelBuilder, ModelGraph
+
+filepath = os.path.dirname(__file__)
+standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+
+
+def test_merge_relationship():
+    g = ModelGraph()
+    a = g.create_node(['Class'], {'label': 'A', 'short_label': None})
+    b = g.create_node(['Class'], {'label': 'B'})
+    assert a.props == {'label': 'A'}
+    rel = g.merge_relationship(a, b, 'HAS_B')
+    assert g.merge_relationship(a, b, 'HAS_B') is rel
+    other = g.merge_relationship(a, b, 'OTHER')
+    assert other is not rel
+    assert g.out(rel, 'FROM') == [a] and g.out(rel, 'TO') == [b]
+    g.delete_edges(rel, 'TO', b)
+    assert g.inn(b, 'TO') == [other]
+    assert not g.has_edge(rel, 'TO', b) and len(g.edges) == 3
+
+
+def test_merge_node_after_set():
+    g = ModelGraph()
+    a = g.create_node(['Term'], {'Codelist Code': 'C1', 'Term Code': 'T1'})
+    assert g.merge_node('Term', {'Codelist Code': 'C1', 'Term Code': 'T1'}) is a
+    a.set('Term Code', 'T2')
+    assert g.find_node('Term', {'Codelist Code': 'C1', 'Term Code': 'T1'}) is None
+    assert g.merge_node('Term', {'Codelist Code': 'C1', 'Term Code': 'T2'}) is a
+    # a label added after the properties were set
+    g.add_label(a, 'Class')
+    assert g.find_node('Class', {'Term Code': 'T2'}) is a
+    assert g.find_node('Class', {}) is a
+    assert len(g.nodes) == 1
+
+
+def test_build():
+    builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    g = builder.build()
+    assert builder.validate() == []
+
+    def classes(label):
+        return [c for c in g.nodes_with('Class') if c.props.get('label') == label]
+
+    assert len(g.nodes_with('Dataset')) == 46
+    assert len(g.nodes_with('DataElement')) == 150
+    assert len(classes('Subject')) == 1 and len(classes('Record')) == 1
+    ae = [d for d in g.nodes_with('Dataset') if d.props['Dataset'] == 'AE'][0]
+    assert ae.props['Sort Order'] == "STUDYID,USUBJID,AEDECOD,AESTDTC,AESEQ"
+    assert [c.props['label'] for c in g.out(ae, 'SUBCLASS_OF')] == ['Event']
+    aeterm = [v for v in g.out(ae, 'HAS_VARIABLE') if v.props['Variable'] == 'AETERM'][0]
+    assert 'Relationship' in aeterm.labels
+    assert g.out(aeterm, 'FROM') == [ae]
+    assert [c.props['label'] for c in g.out(aeterm, 'TO')] == ['Reported Term']
+    qualifies = [rel for rel in g.nodes_with('Relationship') if rel.props.get('relationship_type') == 'QUALIFIES']
+    assert qualifies
+    assert all('Class' in node.labels for rel in qualifies for node in g.out(rel, 'FROM') + g.out(rel, 'TO'))
+
+    graph = builder.to_graph()
+    assert len(graph['nodes']) == len(g.nodes) and len(graph['rels']) == len(g.edges)
+    assert 'Class' in graph['labels']
+
+
+def test_build_codelist_only():
+    terms = {}
+    for codelist_only in [False, True]:
+        builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv',
+                               codelist_only=codelist_only)
+        g = builder.build(label_terms=True)
+        assert builder.validate() == []
+        terms[codelist_only] = {
+            c.props['label']: sorted((t.props['Codelist Code'], t.props['Term Code'], tuple(sorted(t.labels)))
+                                     for t in builder.controlled_terms(c))
+            for c in g.nodes_with('Class') if c.props.get('label') is not None
+        }
+        terms[codelist_only, 'edges'] = len([e for e in g.edges if e.type == 'HAS_CONTROLLED_TERM'])
+        fingerprint, = g.nodes_with('Standard Load Fingerprint')
+        assert fingerprint.props['codelist_only'] is codelist_only
+    # the same terms are resolved from far fewer relationships
+    assert terms[True] == terms[False]
+    assert terms[True, 'edges'] < terms[False, 'edges'] / 10
+
+
+def test_build_rf_variables_of_dm():
+    builder = ModelBuilder(standards_folder, 'SDTM_v1.4.csv', 'SDTMIG_v3.2.csv', 'CT2022Q1_short.csv')
+    g = builder.build()
+    variables = {(v.props.get('Dataset Name'), v.props.get('Variable')): v for v in g.nodes_with('Variable')}
+    # RF* variables of DM are not matched to --STDTC/--ENDTC
+    for name in ['RFSTDTC', 'RFENDTC']:
+        v = variables['DM', name]
+        assert v.props.get('dataElementName') is None
+        assert g.out(v, 'IS_DATA_ELEMENT') == []
+    assert variables['AE', 'AESTDTC'].props['dataElementName'] == '--STDTC'
@@ -0,0 +1,37 @@
+import pytest
+from cdisc_data_providers.projection import column_classes, minimal_subgraph, project_extraction
+
+RELS = [{'from': 'LB', 'to': 'Subject', 'short_label': 'USUBJID'},
+        {'from': 'LB', 'to': 'Test Code', 'short_label': 'LBTESTCD'},
+        {'from': 'Test Code', 'to': 'Result', 'short_label': 'LBSTRESN'},
+        {'from': 'LB', 'to': 'Unit', 'short_label': 'LBSTRESU'},
+        {'from': 'Unit', 'to': 'Result', 'short_label': 'LBSTRESN'},
+        {'from': 'LB', 'to': 'Category', 'short_label': 'cat'}]
+META = [{'rels': RELS, 'rename_dct': {'cat': 'LBCAT'}}]
+
+
+def test_column_classes():
+    assert column_classes(META) == {'USUBJID': 'Subject', 'LBTESTCD': 'Test Code', 'LBSTRESN': 'Result',
+                                    'LBSTRESU': 'Unit', 'LBCAT': 'Category'}
+
+
+def test_minimal_subgraph():
+    assert minimal_subgraph(RELS, []) == set()
+    assert minimal_subgraph(RELS, ['Subject']) == {'Subject'}
+    assert minimal_subgraph(RELS, ['Subject', 'Result', 'Test Code']) == {'Subject', 'LB', 'Test Code', 'Result'}
+    with pytest.raises(ValueError):
+        minimal_subgraph(RELS, ['Subject', 'Visit'])
+
+
+def test_project_extraction():
+    classes = ['LB', 'Subject', 'Test Code**', 'Result**', 'Unit**', 'Category**']
+    assert project_extraction(META, classes, RELS, columns=['LBCAT']) == \
+        (['LB', 'Subject', 'Category**'], [RELS[0], RELS[5]])
+    assert project_extraction(META, classes, RELS, columns=['LBSTRESN', 'LBSTRESU']) == \
+        (['LB', 'Subject', 'Result**', 'Unit**'], [RELS[0], RELS[3], RELS[4]])
+    # the rels between the kept classes are all kept
+    assert project_extraction(META, classes, RELS, columns=['LBTESTCD', 'LBSTRESN', 'LBSTRESU']) == \
+        (['LB', 'Subject', 'Test Code**', 'Result**', 'Unit**'], RELS[:5])
+    # classes to keep
+    assert project_extraction(META, classes, RELS, columns=[], keep_classes=['Category']) == \
+        (['LB', 'Subject', 'Category**'], [RELS[0], RELS[5]])
@@ -0,0 +1,95 @@
+import pytest
+from cdisc_model_managers.query_catalog import QueryCatalog, NamedQueryMixin
+from cdisc_model_managers.query_profiler import QueryProfiler
+
+
+class FakeNeo:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, q, params=None, convert_dates=True):
+        self.queries.append((q, params))
+        return []
+
+
+def test_run_renders_whitelisted_labels():
+    catalog = QueryCatalog()
+    catalog.allow_labels('SDTM_v1.4.csv')
+    neo = FakeNeo()
+    q = "MATCH (n:`<file>`) REMOVE n:`<file>` SET n:GOC"
+    catalog.run(neo, 'relabel', q, labels={'file': 'SDTM_v1.4.csv'})
+    catalog.run(neo, 'relabel', q, labels={'file': 'SDTM_v1.4.csv'})
+    assert neo.queries[0] == ("MATCH (n:`SDTM_v1.4.csv`) REMOVE n:`SDTM_v1.4.csv` SET n:GOC", None)
+    assert catalog.counts['relabel'] == 2
+    assert catalog.stats() == [{'name': 'relabel', 'count': 2}]
+
+
+def test_run_rejects_labels_not_whitelisted():
+    catalog = QueryCatalog()
+    with pytest.raises(ValueError):
+        catalog.run(FakeNeo(), 'relabel', "MATCH (n:`<file>`) RETURN n", labels={'file': 'x` DETACH DELETE n //'})
+    with pytest.raises(ValueError):
+        catalog.run(FakeNeo(), 'relabel', "MATCH (n:`<file>`) RETURN n")
+
+
+def test_allowed_labels_per_object():
+    class Loader(NamedQueryMixin, FakeNeo):
+        pass
+
+    catalog = QueryCatalog()
+    loader, other = Loader(), Loader()
+    loader.query_catalog = other.query_catalog = catalog
+    loader.allow_labels('SDTM_v1.4.csv')
+    q = "MATCH (n:`<file>`) RETURN n"
+    loader.run_query('match_file', q, labels={'file': 'SDTM_v1.4.csv'})
+    assert loader.queries == [("MATCH (n:`SDTM_v1.4.csv`) RETURN n", None)]
+    # the query rendered for loader is not reused for other, whose whitelist does not have the label
+    with pytest.raises(ValueError):
+        other.run_query('match_file', q, labels={'file': 'SDTM_v1.4.csv'})
+    assert other.allowed_labels == frozenset() and catalog.allowed_labels == set()
+    assert catalog.counts['match_file'] == 1
+
+
+def test_register_same_name_different_text():
+    catalog = QueryCatalog()
+    catalog.register('q1', "MATCH (n) WHERE n.Domain = $domain RETURN n")
+    catalog.register('q1', "MATCH (n) WHERE n.Domain = $domain RETURN n")
+    with pytest.raises(ValueError):
+        catalog.register('q1', "MATCH (n) WHERE n.Domain = 'AE' RETURN n")
+
+
+def test_run_through_profiler():
+    catalog = QueryCatalog()
+    neo = FakeNeo()
+    neo.profiler = QueryProfiler()
+    neo.profiler.run = lambda neo, name, q, params=None, convert_dates=True: \
+        neo.profiler.record(name, 0.5, 2, {'nodes_created': 3})
+    with neo.profiler.stage('reshape_model'):
+        catalog.run(neo, 'create_classes', "MERGE (c:ObservationClass {Class: $cls})", {'cls': 'EVENTS'})
+        catalog.run(neo, 'create_classes', "MERGE (c:ObservationClass {Class: $cls})", {'cls': 'FINDINGS'})
+    catalog.run(neo, 'other', "MATCH (n) RETURN n")
+    assert neo.queries == []
+    report = neo.profiler.report()
+    assert [stage['stage'] for stage in report['stages']] == ['reshape_model', '(no stage)']
+    stage = report['stages'][0]
+    assert (stage['calls'], stage['rows'], stage['nodes_created']) == (2, 4, 6)
+    assert stage['queries'][0]['name'] == 'create_classes'
+    assert stage['queries'][0]['seconds'] == 1.0
+    assert report['calls'] == 3
+
+
+def test_profile_call():
+    neo = NamedQueryMixin()
+    with neo.profile_call('create_schema.create_index') as entry:
+        entry['rows'] = 1  # no profiler set
+    neo.profiler = QueryProfiler()
+    with neo.profile_stage('load_files'):
+        for i in range(2):
+            with neo.profile_call('create_schema.create_index'):
+                pass
+        with neo.profile_call('load_standard.load_file') as entry:
+            entry['rows'] = 10
+    stage = neo.profiler.report()['stages'][0]
+    queries = sorted((query['name'], query['calls'], query['rows']) for query in stage['queries'])
+    assert queries == [('create_schema.create_index', 2, 0), ('load_standard.load_file', 1, 10)]
+    assert stage['query_seconds'] <= stage['seconds']
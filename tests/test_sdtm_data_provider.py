@@ -1,5 +1,7 @@
 import pytest
 from cdisc_data_providers import sdtm_data_provider
+from cdisc_data_providers import extraction_plan
+from cdisc_data_providers import meta_cache
 import pandas as pd
 import json
 import os
@@ -44,6 +46,64 @@ def test_get_data_sdtm_dm2(dp):
     pd.testing.assert_frame_equal(res, expected)
 
 
+def test_get_data_sdtm_columns(dp):
+    dp.clean_slate()
+    with open(os.path.join(filepath, 'data', 'test_data_sdtm.json')) as jsonfile:
+        dct = json.load(jsonfile)
+    dp.load_arrows_dict(dct)
+
+    standard = 'test_standard'
+    table = 'DM'
+    expected = dp.get_data_sdtm(standard=standard, domain=table)
+    res = dp.get_data_sdtm(standard=standard, domain=table, columns=['TC4'])
+    pd.testing.assert_frame_equal(res, expected[['TC4']])
+    with pytest.raises(ValueError):
+        dp.get_data_sdtm(standard=standard, domain=table, columns=['XX'])
+
+
+def test_get_data_sdtm_many(dp):
+    dp.clean_slate()
+    with open(os.path.join(filepath, 'data', 'test_data_sdtm.json')) as jsonfile:
+        dct = json.load(jsonfile)
+    dp.load_arrows_dict(dct)
+
+    standard = 'test_standard'
+    res = dp.get_data_sdtm_many(standard=standard, domains=['DM', 'AE'], workers=2)
+    assert res['errors'] == {}
+    assert set(res['timings']) == {'DM', 'AE'}
+    for domain in ['DM', 'AE']:
+        pd.testing.assert_frame_equal(res['data'][domain], dp.get_data_sdtm(standard=standard, domain=domain))
+
+    # failures are isolated per domain
+    res = dp.get_data_sdtm_many(standard=standard, domains=['DM', 'AE'], user_role='Directors')
+    assert res['data'] == {} and set(res['errors']) == {'DM', 'AE'}
+
+
+def test_iter_data_sdtm(dp):
+    dp.clean_slate()
+    with open(os.path.join(filepath, 'data', 'test_data_sdtm.json')) as jsonfile:
+        dct = json.load(jsonfile)
+    dp.load_arrows_dict(dct)
+
+    standard = 'test_standard'
+    table = 'AE'
+    expected = dp.get_data_sdtm(standard=standard, domain=table)
+    # the keys are the ones of the extraction only (not the Study without AE records)
+    dp.query("CREATE (:Study{`rdfs:label`: 'test_study_0'})")
+    extraction = dp.prepare_data_sdtm(standard=standard, domain=table)
+    assert dp.neo_get_partition_keys(extraction, 'Study') == ['test_study_1', 'test_study_2']
+    assert dp.neo_get_partition_keys(extraction, 'Study', after='test_study_1', limit=1) == ['test_study_2']
+    chunks = list(dp.iter_data_sdtm(standard=standard, domain=table, chunk_subjects=1, partition_class='Study'))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    res = pd.concat(chunks).sort_values(by=['TC1', 'TC2'], ignore_index=True)
+    pd.testing.assert_frame_equal(res, expected)
+
+    # not a class of the extraction: one chunk
+    chunks = list(dp.iter_data_sdtm(standard=standard, domain=table, chunk_subjects=1))
+    assert len(chunks) == 1
+    pd.testing.assert_frame_equal(chunks[0], expected)
+
+
 def test_get_data_restricted_access(dp):
     dp.clean_slate()
     with open(os.path.join(filepath, 'data', 'test_data_sdtm_restricted.json')) as jsonfile:
@@ -194,3 +254,98 @@ def test_neo_validate_access(dp):
     # Role does not exist
     with pytest.raises(Exception):
         dp.neo_validate_access(classes=classes, user_role="Directors")
+
+
+def test_neo_validate_extraction(dp):
+    dp.clean_slate()
+    dp.query("""
+    MERGE (:Class {label: 'Subject', count: 10})
+    MERGE (:Class {label: 'Race', count: 1})
+    MERGE (:Class {label: 'Age', count: 0})
+    MERGE (role:`User Role`{name: 'External Researcher'})-[:ACCESS_RESTRICTED]->(:Class {label: 'Sex', count: 5})
+    MERGE (role)-[:ACCESS_RESTRICTED]->(:Class {label: 'Ethnicity'})
+    MERGE (:`User Role`{name: 'Study Lead'})
+    """)
+    classes = ['Subject', 'Race', 'Age', 'Sex', 'Ethnicity', 'Study']
+
+    assert dp.neo_validate_extraction(classes, user_role='External Researcher') == \
+        (['Subject', 'Race', 'Study'], ['Age', 'Ethnicity'], ['Sex'])
+    assert dp.neo_validate_extraction(classes, check_counts=False, user_role='External Researcher') == \
+        (['Subject', 'Race', 'Age', 'Study'], [], ['Sex', 'Ethnicity'])
+    assert dp.neo_validate_extraction(classes, user_role='Study Lead') == \
+        (['Subject', 'Race', 'Sex', 'Study'], ['Age', 'Ethnicity'], [])
+    with pytest.raises(Exception):
+        dp.neo_validate_extraction(classes, user_role="Directors")
+
+    rels = [{'from': 'Subject', 'to': 'Race'}, {'from': 'Subject', 'to': 'Sex'}, {'from': 'Age', 'to': 'Subject'}]
+    assert dp.filter_classes_from_rels(rels, ['Sex', 'Age']) == [{'from': 'Subject', 'to': 'Race'}]
+
+
+def test_extraction_plan(dp):
+    dp.clean_slate()
+    with open(os.path.join(filepath, 'data', 'test_data_sdtm.json')) as jsonfile:
+        dct = json.load(jsonfile)
+    dp.load_arrows_dict(dct)
+
+    standard = 'test_standard'
+    table = 'AE'
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) is None
+    assert extraction_plan.materialize_extraction_plans(dp, standard=standard) == 2
+    meta = dp.neo_get_meta(standard=standard, table=table)
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) == meta
+    assert dp.get_meta(standard=standard, table=table) == meta
+
+    # the plan is stale once the mapping of the table changes
+    dp.query("""
+    MATCH (sdt:`Source Data Table`{_domain_:$table})-[:HAS_COLUMN]->(sdc:`Source Data Column`)
+    SET sdc.Order = coalesce(sdc.Order, 0) + 100
+    """, {'table': table})
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) is None
+    # the cached metadata is kept until invalidated
+    assert dp.get_meta(standard=standard, table=table) == meta
+    assert dp.invalidate(standard=standard) == 1
+    assert dp.get_meta(standard=standard, table=table) == dp.neo_get_meta(standard=standard, table=table)
+
+
+@pytest.mark.parametrize("change", [
+    # remapping a column to another Class (the number of mappings is unchanged)
+    """
+    MATCH (sdc:`Source Data Column`{_columnname_:'TC1'})-[r:MAPS_TO_CLASS]->(:Class{label:'test_class_2'}),
+    (c:Class{label:'test_class_6'})
+    DELETE r
+    MERGE (sdc)-[:MAPS_TO_CLASS]->(c)
+    """,
+    "MATCH (r:Relationship{relationship_type:'test_rel_2'}) SET r.relationship_type = 'test_rel_2b'",
+    "MATCH (c:Class{label:'test_class_2'}) SET c.create = true",
+    "MATCH (c:Class{label:'test_class_2'}) SET c.short_label = 'tc2b'",
+])
+def test_extraction_plan_stale_after_remapping(dp, change):
+    dp.clean_slate()
+    with open(os.path.join(filepath, 'data', 'test_data_sdtm.json')) as jsonfile:
+        dct = json.load(jsonfile)
+    dp.load_arrows_dict(dct)
+
+    standard = 'test_standard'
+    table = 'AE'
+    extraction_plan.materialize_extraction_plans(dp, standard=standard)
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) is not None
+    dp.query(change)
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) is None
+    extraction_plan.materialize_extraction_plans(dp, standard=standard)
+    assert dp.neo_get_extraction_plan(standard=standard, table=table) == \
+           dp.neo_get_meta(standard=standard, table=table)
+
+
+def test_meta_cache():
+    now = [0]
+    cache = meta_cache.MetaCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put('standard', 'DM', 'dm')
+    cache.put('standard', 'AE', 'ae')
+    assert cache.get('standard', 'DM') == 'dm'
+    cache.put('standard', 'LB', 'lb')  # evicts AE, the least recently used
+    assert cache.get('standard', 'AE') is None
+    now[0] = 10
+    assert cache.get('standard', 'DM') is None  # expired
+    cache.put('other', 'LB', 'lb')
+    assert meta_cache.invalidate_all(standard='other') == 1
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'size': 1, 'maxsize': 2}
@@ -0,0 +1,43 @@
+import os
+from cdisc_model_managers import ttl_parser
+
+filepath = os.path.dirname(__file__)
+standards_folder = os.path.join(filepath, '..', 'cdisc_data')
+
+
+def test_parse_turtle():
+    triples = ttl_parser.parse_turtle("""
+    @prefix ex: <http://example.org/ns#> .
+    @prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+    ex:A a ex:Thing ;
+      ex:name "A \\"quoted\\" name"^^xsd:string ;
+      ex:size "3"^^xsd:integer ;
+      ex:flag "true"^^xsd:boolean ;
+      ex:rel ex:B, <http://example.org/ns#C> ;
+    .
+    """)
+    graph = ttl_parser.triples_to_graph(triples)
+    nodes = {node['uri']: node for node in graph['nodes']}
+    assert nodes['http://example.org/ns#A'] == {
+        'uri': 'http://example.org/ns#A',
+        'labels': ['Resource', 'Thing'],
+        'props': {'name': 'A "quoted" name', 'size': 3, 'flag': True},
+    }
+    assert nodes['http://example.org/ns#B'] == {'uri': 'http://example.org/ns#B', 'labels': ['Resource'], 'props': {}}
+    assert graph['rels'] == [
+        ['http://example.org/ns#A', 'rel', 'http://example.org/ns#B'],
+        ['http://example.org/ns#A', 'rel', 'http://example.org/ns#C'],
+    ]
+
+
+def test_load_ttl_graph(tmpdir):
+    graph = ttl_parser.load_ttl_graph(os.path.join(standards_folder, 'sdtm-1-3.ttl'), str(tmpdir))
+    assert len([n for n in graph['nodes'] if 'DataElement' in n['labels']]) == 150
+    assert len([n for n in graph['nodes'] if 'VariableGrouping' in n['labels']]) == 6
+    assert len([n for n in graph['nodes'] if 'DataElementRole' in n['labels']]) == 9
+    de = [n for n in graph['nodes'] if n['props'].get('dataElementName') == '--ACN'][0]
+    assert de['props']['dataElementLabel'] == 'Action Taken with Study Treatment'
+    assert [r[1] for r in graph['rels'] if r[0] == de['uri']] == ['context', 'dataElementRole', 'dataElementType']
+    # the parsed graph is cached by file hash
+    assert os.listdir(str(tmpdir)) == [f"sdtm-1-3.ttl.{graph['sha256'][:16]}.json"]
+    assert ttl_parser.load_ttl_graph(os.path.join(standards_folder, 'sdtm-1-3.ttl'), str(tmpdir)) == graph